@@ -33,6 +33,12 @@ class SSHAuth(Auth):
         if self.key_filename:
             self.key_filename = os.path.expanduser(self.key_filename)
 
+    def key(self):
+        """
+        Returns the (hostname, port, username) tuple identifying the connection.
+        """
+        return (self.hostname, self.port, self.username)
+
     def to_paramiko(self):
         kwargs = {}
 
@@ -0,0 +1,109 @@
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from . import auths as a
+
+
+class SSHConnectionPool:
+    """
+    Shares SSH connections between all the runners and uploaders of the process.
+
+    Connections are keyed by the (hostname, port, username) of the `SSHAuth`, so that several runners targeting the same host reuse the same paramiko transport. Tools that shell out to OpenSSH (e.g. rsync) are multiplexed over a ControlMaster socket managed by the pool, so that authentication happens only once.
+    """
+
+    def __init__(self, keepalive=30, control_persist=600, control_dir=None):
+        """
+        Initializes the connection pool.
+
+        Args:
+            keepalive (int, optional): Interval in seconds between keepalive packets, 0 disables them.
+            control_persist (int, optional): Seconds the OpenSSH master connection stays open after its last client exits.
+            control_dir (str, optional): Directory where the ControlMaster sockets are created. If not provided, a temporary directory is created on first use.
+        """
+        self.keepalive = keepalive
+        self.control_persist = control_persist
+        self.control_dir = control_dir
+        self.temporary_control_dir = False
+        self.clients = {}
+        self.masters = {}
+        self.lock = threading.Lock()
+
+    def get(self, auth: a.SSHAuth):
+        """
+        Returns the shared `MySSHClient` for the given authentication, the client is not connected until its `connect()` method is called.
+        """
+        from .utils import MySSHClient
+
+        with self.lock:
+            client = self.clients.get(auth.key(), None)
+            if client is None:
+                client = MySSHClient(auth, keepalive=self.keepalive, pool=self)
+                self.clients[auth.key()] = client
+            return client
+
+    def control_path(self, auth: a.SSHAuth):
+        """
+        Returns the path of the ControlMaster socket for the given authentication.
+        """
+        with self.lock:
+            if self.control_dir is None:
+                # Unix sockets paths are limited to ~100 characters, keep them short
+                self.control_dir = tempfile.mkdtemp(prefix="hpctools-ssh-")
+                self.temporary_control_dir = True
+            self.masters[auth.key()] = auth
+        hostname, port, username = auth.key()
+        return os.path.join(self.control_dir, f"{username}@{hostname}:{port}")
+
+    def ssh_options(self, auth: a.SSHAuth):
+        """
+        Returns the OpenSSH command line options to multiplex over the managed ControlMaster socket.
+        """
+        options = [
+            "-o ControlMaster=auto",
+            f"-o ControlPath={self.control_path(auth)}",
+            f"-o ControlPersist={self.control_persist}",
+        ]
+        if self.keepalive:
+            options.append(f"-o ServerAliveInterval={self.keepalive}")
+        return " ".join(options)
+
+    def close(self, auth: a.SSHAuth):
+        """
+        Closes the shared connection and the ControlMaster for the given authentication.
+        """
+        with self.lock:
+            client = self.clients.pop(auth.key(), None)
+            master = self.masters.pop(auth.key(), None)
+        if client is not None:
+            client.close()
+        if master is not None:
+            hostname, port, username = auth.key()
+            path = os.path.join(self.control_dir, f"{username}@{hostname}:{port}")
+            if os.path.exists(path):
+                subprocess.run(
+                    f"ssh -o ControlPath={path} -O exit {username}@{hostname}",
+                    shell=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+
+    def close_all(self):
+        """
+        Closes all the shared connections and ControlMasters.
+        """
+        for auth in list(self.masters.values()):
+            self.close(auth)
+        for client in list(self.clients.values()):
+            self.close(client.auth)
+        if self.temporary_control_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+            self.control_dir = None
+            self.temporary_control_dir = False
+
+
+# Default pool used by the runners and uploaders
+ssh_pool = SSHConnectionPool()
+atexit.register(ssh_pool.close_all)
@@ -0,0 +1,305 @@
+import os
+import time
+import shlex
+import sqlite3
+import threading
+from .utils import dotdict
+
+# States after which a job or array task never changes again
+TERMINAL_STATES = {
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "TIMEOUT",
+}
+
+SACCT_FORMAT = "JobID,State,ExitCode"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    host TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    name TEXT,
+    run_name TEXT,
+    config_offset INTEGER,
+    config_size INTEGER,
+    template_hash TEXT,
+    remote_dir TEXT,
+    state TEXT,
+    submitted REAL,
+    updated REAL,
+    PRIMARY KEY (host, job_id)
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    host TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    state TEXT,
+    exit_code INTEGER,
+    updated REAL,
+    PRIMARY KEY (host, job_id, task_id)
+);
+"""
+
+
+def sacct_command(job_ids):
+    """Returns the `sacct` command querying the state of all the given jobs at once"""
+    return f"sacct -n -P -X -j {','.join(job_ids)} --format={SACCT_FORMAT}"
+
+
+def parse_array_range(spec):
+    """
+    Expands the array task ids of a Slurm array range, e.g. `[0-3,7%2]` into `[0, 1, 2, 3, 7]`.
+    """
+    spec = spec.strip("[]").split("%")[0]
+    task_ids = []
+    for part in filter(None, spec.split(",")):
+        start, _, stop = part.partition("-")
+        stop, _, step = stop.partition(":")
+        task_ids.extend(range(int(start), int(stop or start) + 1, int(step or 1)))
+    return task_ids
+
+
+def format_array_range(task_ids):
+    """
+    Compresses array task ids in a Slurm array range, e.g. `[0, 1, 2, 3, 7]` into `0-3,7`.
+    """
+    parts = []
+    task_ids = sorted(set(task_ids))
+    start = None
+    for i, task_id in enumerate(task_ids):
+        if start is None:
+            start = task_id
+        if i + 1 == len(task_ids) or task_ids[i + 1] != task_id + 1:
+            parts.append(str(start) if start == task_id else f"{start}-{task_id}")
+            start = None
+    return ",".join(parts)
+
+
+def collapse_job_ids(job_ids):
+    """
+    Groups the array tasks of the same job in a single array range, e.g. `["1_0", "1_1", "1_5", "2"]` into `["1_[0-1,5]", "2"]`. A whole job supersedes its tasks.
+    """
+    jobs = {}
+    for job_id in job_ids:
+        job_id, _, task_spec = str(job_id).partition("_")
+        task_ids = jobs.setdefault(job_id, set())
+        if not task_spec:
+            jobs[job_id] = None
+        elif task_ids is not None:
+            task_ids.update(parse_array_range(task_spec))
+
+    collapsed = []
+    for job_id, task_ids in jobs.items():
+        if task_ids is None:
+            collapsed.append(job_id)
+        elif len(task_ids) == 1:
+            collapsed.append(f"{job_id}_{task_ids.pop()}")
+        else:
+            collapsed.append(f"{job_id}_[{format_array_range(task_ids)}]")
+    return collapsed
+
+
+def scancel_command(job_ids, state=None, max_ids=500):
+    """
+    Returns the command cancelling the given jobs and array tasks with as few `scancel` invocations as possible.
+
+    Args:
+        job_ids (list): Job ids, array tasks (`123_4`) or array ranges (`123_[4-7]`).
+        state (str, optional): If provided, only the jobs and tasks in this state are cancelled, e.g. "PENDING".
+        max_ids (int, optional): The maximum number of ids passed to each `scancel`, to stay below the command line length limit.
+    """
+    job_ids = collapse_job_ids(job_ids)
+    options = f"--state={state} " if state else ""
+    commands = []
+    for i in range(0, len(job_ids), max_ids):
+        chunk = " ".join(shlex.quote(job_id) for job_id in job_ids[i : i + max_ids])
+        commands.append(f"scancel {options}{chunk}")
+    return " ; ".join(commands)
+
+
+def parse_sacct(output):
+    """
+    Parses the output of `sacct_command()`.
+
+    Returns:
+        A list of `(job_id, task_id, state, exit_code)` tuples, `task_id` is None for jobs that are not array jobs. Pending array ranges are expanded to one tuple per task.
+    """
+    rows = []
+    for line in output.splitlines():
+        fields = line.strip().split("|")
+        if len(fields) < 3:
+            continue
+        job_id, state, exit_code = fields[:3]
+        # e.g. "CANCELLED by 1234"
+        state = state.split(" ")[0]
+        exit_code = int(exit_code.split(":")[0]) if exit_code else None
+
+        job_id, _, task_spec = job_id.partition("_")
+        if not task_spec:
+            rows.append((job_id, None, state, exit_code))
+        else:
+            for task_id in parse_array_range(task_spec):
+                rows.append((job_id, task_id, state, exit_code))
+    return rows
+
+
+def aggregate_state(states):
+    """Returns the state of an array job given the states of its tasks"""
+    active = [state for state in states if state not in TERMINAL_STATES]
+    if active:
+        return "RUNNING" if "RUNNING" in active else active[0]
+    if all(state == "COMPLETED" for state in states):
+        return "COMPLETED"
+    return "FAILED"
+
+
+class JobStore:
+    """
+    A local SQLite database of the submitted jobs.
+
+    Each job is recorded with the range of configs of the sweep it runs, the hash of its template and the remote directory it runs in. The state of the jobs, and of the tasks of array jobs, is refreshed in batch with `update()`, only the jobs that are not in a terminal state need to be queried.
+    """
+
+    def __init__(self, path="~/.cache/hpctools/jobs.db"):
+        """
+        Args:
+            path (str, optional): The path of the database, ":memory:" keeps the database in memory.
+        """
+        if path != ":memory:":
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        # Jobs are recorded from the threads of the fan-out and async runners
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def record(
+        self,
+        host,
+        job_id,
+        name=None,
+        run_name=None,
+        config_offset=0,
+        config_size=None,
+        template_hash=None,
+        remote_dir=None,
+        state="PENDING",
+    ):
+        """
+        Records a submitted job, resubmissions with the same id overwrite the previous record.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    host,
+                    job_id,
+                    name,
+                    run_name,
+                    config_offset,
+                    config_size,
+                    template_hash,
+                    remote_dir,
+                    state,
+                    now,
+                    now,
+                ),
+            )
+
+    def jobs(self, host=None, run_name=None, state=None):
+        """Returns the recorded jobs matching the given filters, as `dotdict` objects"""
+        filters = {"host": host, "run_name": run_name, "state": state}
+        filters = {k: v for k, v in filters.items() if v is not None}
+        query = "SELECT * FROM jobs"
+        if filters:
+            query += " WHERE " + " AND ".join(f"{k} = ?" for k in filters)
+        with self.lock:
+            rows = self.connection.execute(
+                query + " ORDER BY submitted", tuple(filters.values())
+            ).fetchall()
+        return [dotdict(row) for row in rows]
+
+    def tasks(self, host, job_id):
+        """Returns the array tasks of the job, as `dotdict` objects"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT * FROM tasks WHERE host = ? AND job_id = ? ORDER BY task_id",
+                (host, job_id),
+            ).fetchall()
+        return [dotdict(row) for row in rows]
+
+    def active_jobs(self, host):
+        """Returns the ids of the jobs of the host that are not in a terminal state"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT job_id, state FROM jobs WHERE host = ?", (host,)
+            ).fetchall()
+        return [row["job_id"] for row in rows if row["state"] not in TERMINAL_STATES]
+
+    def update(self, host, rows):
+        """
+        Updates the state of the jobs with the rows returned by `parse_sacct()`.
+
+        Returns:
+            A list of `dotdict` objects with the `job_id`, `task_id`, `state` and `exit_code` of the jobs and tasks whose state changed.
+        """
+        now = time.time()
+        changed = []
+        array_jobs = set()
+        with self.lock, self.connection:
+            for job_id, task_id, state, exit_code in rows:
+                if task_id is None:
+                    cursor = self.connection.execute(
+                        "UPDATE jobs SET state = ?, updated = ? "
+                        "WHERE host = ? AND job_id = ? AND state IS NOT ?",
+                        (state, now, host, job_id, state),
+                    )
+                else:
+                    array_jobs.add(job_id)
+                    cursor = self.connection.execute(
+                        "INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (host, job_id, task_id) DO UPDATE "
+                        "SET state = excluded.state, exit_code = excluded.exit_code, "
+                        "updated = excluded.updated "
+                        "WHERE state IS NOT excluded.state "
+                        "OR exit_code IS NOT excluded.exit_code",
+                        (host, job_id, task_id, state, exit_code, now),
+                    )
+                if cursor.rowcount:
+                    changed.append(
+                        dotdict(
+                            job_id=job_id,
+                            task_id=task_id,
+                            state=state,
+                            exit_code=exit_code,
+                        )
+                    )
+
+            for job_id in array_jobs:
+                states = [
+                    row["state"]
+                    for row in self.connection.execute(
+                        "SELECT state FROM tasks WHERE host = ? AND job_id = ?",
+                        (host, job_id),
+                    )
+                ]
+                state = aggregate_state(states)
+                self.connection.execute(
+                    "UPDATE jobs SET state = ?, updated = ? "
+                    "WHERE host = ? AND job_id = ? AND state IS NOT ?",
+                    (state, now, host, job_id, state),
+                )
+        return changed
+
+    def close(self):
+        self.connection.close()
+
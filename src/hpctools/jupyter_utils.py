@@ -1,6 +1,8 @@
 import ipywidgets as widgets
 from IPython.display import display
-from threading import Timer
+from threading import Thread, Event
+from .monitoring import QueuePoller, LogFollower
+from .jobs import scancel_command
 
 
 class DynamicTableWidget:
@@ -12,9 +14,34 @@ class DynamicTableWidget:
         button_text,
         button_style,
         refresh_interval,
+        max_refresh_interval=None,
+        backoff=1.5,
+        bulk_callback=None,
+        bulk_button_text=None,
     ):
+        """
+        A table of rows with one button each, refreshed in the background.
+
+        Rows are identified by `row_key()`, on each refresh only the widgets of the rows that were added, removed or changed are touched.
+
+        Args:
+            title (str): The title of the table.
+            rows_func (callable): Returns the rows of the table, as a list of strings.
+            button_callback (callable): Called with the clicked button and its row.
+            button_text (str): The text of the buttons.
+            button_style (str): The style of the buttons.
+            refresh_interval (float): The interval in seconds between refreshes.
+            max_refresh_interval (float, optional): While the rows do not change, the refresh interval is multiplied by `backoff` up to this value. If not provided, 30 times `refresh_interval`.
+            backoff (float, optional): The factor the refresh interval is multiplied by when nothing changes.
+            bulk_callback (callable, optional): If provided, rows can be selected with a checkbox, and a button in the title bar calls `bulk_callback(button, rows)` with the selected rows.
+            bulk_button_text (str, optional): The text of the bulk button. If not provided, `"{button_text} selected"`.
+        """
         self.title = title
         self.refresh_interval = refresh_interval
+        if max_refresh_interval is None:
+            max_refresh_interval = 30 * refresh_interval
+        self.max_refresh_interval = max_refresh_interval
+        self.backoff = backoff
         self.container = widgets.VBox(
             [
                 widgets.Label(
@@ -27,77 +54,190 @@ class DynamicTableWidget:
             ],
             layout=widgets.Layout(overflow="hidden"),
         )
-        self.timer = None
         self.rows_func = rows_func
         self.button_callback = button_callback
         self.button_text = button_text
         self.button_style = button_style
+        self.bulk_callback = bulk_callback
 
-    def new_lines(self, n):
-        for _ in range(n):
-            t = widgets.VBox(
-                [
-                    widgets.HBox(
-                        [
-                            widgets.Button(
-                                description="Kill",
-                                button_style=self.button_style,
-                                layout=widgets.Layout(width="auto"),
-                            ),
-                            widgets.Label(
-                                "",
-                                layout=widgets.Layout(
-                                    width="80%", justify_content="center"
-                                ),
-                            ),
-                        ]
-                    ),
-                    widgets.HTML(
-                        value="<hr style='border: 1px solid #000'>",
-                        layout=widgets.Layout(width="100%"),
-                    ),
-                ],
-                layout=widgets.Layout(overflow="hidden"),
+        if self.bulk_callback is not None:
+            self.select_all = widgets.Checkbox(
+                value=False, indent=False, layout=widgets.Layout(width="auto")
+            )
+            self.select_all.observe(self.on_select_all, names="value")
+            bulk_button = widgets.Button(
+                description=bulk_button_text or f"{button_text} selected",
+                button_style=button_style,
+                layout=widgets.Layout(width="auto"),
             )
-            self.container.children = self.container.children + (t,)
+            bulk_button.on_click(self.on_bulk_click)
+            # The title bar holds the bulk controls
+            self.container.children = (
+                widgets.HBox(
+                    [self.select_all, bulk_button, self.container.children[0]]
+                ),
+            ) + self.container.children[1:]
+
+        # Row widgets by row key
+        self.rows = {}
+        self.thread = None
+        self.stop_event = Event()
+
+    def new_row(self):
+        button = widgets.Button(
+            description=self.button_text,
+            button_style=self.button_style,
+            layout=widgets.Layout(width="auto"),
+        )
+        button.line = None
+        # Registered once, the handler reads the current row of the button
+        button.on_click(self.on_button_click)
+        checkbox = []
+        if self.bulk_callback is not None:
+            checkbox = [
+                widgets.Checkbox(
+                    value=False, indent=False, layout=widgets.Layout(width="auto")
+                )
+            ]
+        return widgets.VBox(
+            [
+                widgets.HBox(
+                    checkbox
+                    + [
+                        button,
+                        widgets.Label(
+                            "",
+                            layout=widgets.Layout(
+                                width="80%", justify_content="center"
+                            ),
+                        ),
+                    ]
+                ),
+                widgets.HTML(
+                    value="<hr style='border: 1px solid #000'>",
+                    layout=widgets.Layout(width="100%"),
+                ),
+            ],
+            layout=widgets.Layout(overflow="hidden"),
+        )
+
+    def new_lines(self, n):
+        self.container.children = self.container.children + tuple(
+            self.new_row() for _ in range(n)
+        )
 
     def del_lines(self, n):
         self.container.children = self.container.children[:-n]
 
     def get_row(self, i):
         row = self.container.children[i + 2].children
-        button, label, separator = row[0].children[0], row[0].children[1], row[1]
+        button, label, separator = row[0].children[-2], row[0].children[-1], row[1]
         return button, label, separator
 
     def n_rows(self):
         return len(self.container.children) - 2
 
+    def row_key(self, line):
+        """Returns the key identifying the row across refreshes"""
+        return line
+
+    def row_label(self, line):
+        """Returns the text displayed in the row"""
+        return line.replace(" ", "\xa0")  # Replace spaces with non-breaking spaces
+
+    def on_button_click(self, button):
+        self.button_callback(button, button.line)
+
+    def selected_rows(self):
+        """Returns the rows whose checkbox is selected"""
+        if self.bulk_callback is None:
+            return []
+        return [
+            row.children[0].children[1].line
+            for row in self.rows.values()
+            if row.children[0].children[0].value
+        ]
+
+    def on_select_all(self, change):
+        for row in self.rows.values():
+            row.children[0].children[0].value = change["new"]
+
+    def on_bulk_click(self, button):
+        rows = self.selected_rows()
+        if rows:
+            self.bulk_callback(button, rows)
+        self.select_all.value = False
+        self.on_select_all({"new": False})
+
     def update(self):
+        """
+        Refreshes the table, only the widgets of the changed rows are touched.
+
+        Returns:
+            True if any row was added, removed or changed.
+        """
         lines = self.rows_func()
-        delta = len(lines) - self.n_rows()
-        if delta > 0:
-            self.new_lines(delta)
-        elif delta < 0:
-            self.del_lines(-delta)
-        for i, line in enumerate(lines):
-            button, label, separator = self.get_row(i)
-            label.value = line.replace(
-                " ", "\xa0"
-            )  # Replace spaces with non-breaking spaces
-            button._click_handlers.callbacks = []
-            button.line = line
-            button.on_click(lambda e: self.button_callback(e, e.line))
-            if i == len(lines) - 1:
-                separator.layout.display = "none"
+
+        changed = False
+        rows = {}
+        for line in lines:
+            key = self.row_key(line)
+            row = self.rows.get(key, None)
+            if row is None:
+                row = self.new_row()
+            rows[key] = row
+
+            *_, button, label = row.children[0].children
+            if button.line != line:
+                button.line = line
+                label.value = self.row_label(line)
+                changed = True
+        self.rows = rows
+
+        children = self.container.children[:2] + tuple(rows.values())
+        if children != self.container.children:
+            self.container.children = children
+            changed = True
+
+        # Hide the separator of the last row only
+        for i, row in enumerate(rows.values()):
+            display_value = "none" if i == len(rows) - 1 else "block"
+            separator = row.children[1]
+            if separator.layout.display != display_value:
+                separator.layout.display = display_value
+
+        return changed
+
+    def poll(self):
+        interval = self.refresh_interval
+        while not self.stop_event.is_set():
+            try:
+                changed = self.update()
+            except Exception as e:
+                print(f"Failed to refresh {self.title}: {e}")
+                changed = False
+
+            # Back off while nothing changes, refresh quickly again as soon as something does
+            if changed:
+                interval = self.refresh_interval
             else:
-                separator.layout.display = "block"
+                interval = min(interval * self.backoff, self.max_refresh_interval)
+            self.stop_event.wait(interval)
 
     def auto_update(self):
-        self.update()
+        """Starts the polling thread, if it is not running already"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = Thread(target=self.poll, daemon=True)
+        self.thread.start()
 
-        # Schedule the next refresh
-        self.timer = Timer(self.refresh_interval, self.auto_update)
-        self.timer.start()
+    def stop(self):
+        """Stops the polling thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
 
     def view(self):
         display(self.container)
@@ -105,22 +245,115 @@ class DynamicTableWidget:
 
 
 class SlurmQueueWidget(DynamicTableWidget):
-    def __init__(self, runner, job_name):
+    """
+    The jobs of the user with the given name in the Slurm queue.
+
+    The queue is read from the `QueuePoller` of the runner, so that any number of widgets cost a single `squeue` query per interval.
+    """
+
+    COLUMN_WIDTHS = (20, 12, 12, 6, 24, 0)
+
+    def __init__(self, runner, job_name, poller: QueuePoller = None):
         super().__init__(
-            "Slurm Queue", self.get_slurm_queue, self.on_click, "Kill", "danger", 1
+            "Slurm Queue",
+            self.get_slurm_queue,
+            self.on_click,
+            "Kill",
+            "danger",
+            1,
+            bulk_callback=self.on_bulk_kill,
         )
         self.runner = runner
         self.job_name = job_name
+        self.poller = poller if poller is not None else runner.queue_poller
 
     def get_slurm_queue(self):
-        stdout, _, _ = self.runner.exec(f"squeue -n {self.job_name}")
-        lines = stdout.readlines()[1:]
-        return lines
+        return [row.line for row in self.poller.jobs(name=self.job_name)]
+
+    def on_queue(self, rows):
+        self.update()
+
+    def auto_update(self):
+        """Subscribes the widget to the queue poller"""
+        if self.on_queue not in self.poller.subscribers:
+            self.poller.subscribe(self.on_queue)
+
+    def stop(self):
+        self.poller.unsubscribe(self.on_queue)
+
+    @staticmethod
+    def job_id(row):
+        return row.replace("|", " ").split()[0]
+
+    def row_key(self, line):
+        return self.job_id(line)
+
+    def row_label(self, line):
+        fields = line.split("|")
+        return super().row_label(
+            " ".join(
+                field.ljust(width) for field, width in zip(fields, self.COLUMN_WIDTHS)
+            ).rstrip()
+        )
 
     def kill_job(self, row):
-        job_id = row.split()[0]
-        stdout, _, _ = self.runner.exec(f"scancel {job_id}")
+        job_id = self.job_id(row)
+        stdout, _, _ = self.runner.exec(scancel_command([job_id]))
         return stdout.readlines()
 
+    def kill_jobs(self, rows):
+        """Kills the jobs of the rows with as few `scancel` invocations as possible"""
+        return self.runner.cancel([self.job_id(row) for row in rows])
+
     def on_click(self, button, row):
         self.kill_job(row)
+
+    def on_bulk_kill(self, button, rows):
+        self.kill_jobs(rows)
+
+
+class LogWidget:
+    """
+    The logs of the runs, followed incrementally with a `LogFollower`, to be displayed next to `SlurmQueueWidget`.
+    """
+
+    def __init__(self, follower: LogFollower, max_chars=20000):
+        """
+        Args:
+            follower (LogFollower): The follower the logs are read from.
+            max_chars (int, optional): The number of characters kept for each log.
+        """
+        self.follower = follower
+        self.max_chars = max_chars
+        self.logs = {}
+        self.selector = widgets.Dropdown(
+            options=[], description="Log", layout=widgets.Layout(width="100%")
+        )
+        self.selector.observe(self.on_select, names="value")
+        self.output = widgets.Textarea(
+            value="", disabled=True, layout=widgets.Layout(width="100%", height="300px")
+        )
+        self.container = widgets.VBox([self.selector, self.output])
+
+    def on_logs(self, new_text):
+        for path, text in new_text.items():
+            self.logs[path] = (self.logs.get(path, "") + text)[-self.max_chars :]
+        if set(self.logs) != set(self.selector.options):
+            self.selector.options = sorted(self.logs)
+        if not self.selector.options:
+            # No log exists yet
+            return
+        if self.selector.value is None:
+            self.selector.value = self.selector.options[0]
+        elif self.selector.value in new_text:
+            self.output.value = self.logs[self.selector.value]
+
+    def on_select(self, change):
+        self.output.value = self.logs.get(change["new"], "")
+
+    def view(self):
+        display(self.container)
+        self.follower.subscribe(self.on_logs)
+
+    def stop(self):
+        self.follower.unsubscribe(self.on_logs)
@@ -0,0 +1,262 @@
+import abc
+import time
+import shlex
+import base64
+import codecs
+import threading
+from .runners import read_output
+from .utils import dotdict
+
+LOG_MARKER = "@@hpctools-log"
+
+# Structured squeue output: the fields are separated by "|", the job id comes first
+SQUEUE_FORMAT = "%i|%T|%M|%D|%R|%j"
+SQUEUE_FIELDS = ("job_id", "state", "time", "nodes", "reason", "name")
+
+
+def parse_squeue(output):
+    """
+    Parses the output of `squeue --noheader --format=SQUEUE_FORMAT`.
+
+    Returns:
+        A list of `dotdict` objects with one attribute per field of `SQUEUE_FIELDS`, and the raw `line`.
+    """
+    rows = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # The job name is last, it may contain "|"
+        fields = line.split("|", len(SQUEUE_FIELDS) - 1)
+        row = dotdict(zip(SQUEUE_FIELDS, fields))
+        row.line = line
+        rows.append(row)
+    return rows
+
+
+class Poller(abc.ABC):
+    """
+    Calls `fetch()` periodically from a background thread on behalf of the subscribers.
+
+    The thread is started with the first subscriber and stopped with the last one. While the result of `fetch()` does not change, the interval between polls is multiplied by `backoff` up to `max_interval`.
+    """
+
+    def __init__(self, interval=5, max_interval=60, backoff=1.5):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @abc.abstractmethod
+    def fetch(self, interval):
+        """
+        Returns the result passed to the subscribers and whether it changed since the previous poll.
+        """
+        pass
+
+    def subscribe(self, callback):
+        """
+        Calls `callback(result)` after each poll of the background thread, the thread is started with the first subscriber.
+        """
+        with self.subscribers_lock:
+            self.subscribers.append(callback)
+            if self.thread is None or not self.thread.is_alive():
+                self.stop_event.clear()
+                self.thread = threading.Thread(target=self.poll, daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, callback):
+        """Removes the callback, the thread is stopped with the last subscriber"""
+        with self.subscribers_lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+            if not self.subscribers:
+                self.stop_event.set()
+
+    def poll(self):
+        interval = self.interval
+        while not self.stop_event.is_set():
+            try:
+                result, changed = self.fetch(interval)
+            except Exception as e:
+                print(f"{self.__class__.__name__} failed to poll: {e}")
+                result, changed = None, False
+
+            if result is not None:
+                for callback in list(self.subscribers):
+                    try:
+                        callback(result)
+                    except Exception as e:
+                        print(f"{self.__class__.__name__} subscriber failed: {e}")
+
+            # Back off while nothing changes
+            if changed:
+                interval = self.interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            self.stop_event.wait(interval)
+
+
+class QueuePoller(Poller):
+    """
+    Polls the Slurm queue of the user on behalf of all the consumers of a runner.
+
+    A single `squeue` query returns all the jobs of the user, its result is cached for `ttl` seconds so that any number of widgets and API callers cost one scheduler query per interval. Consumers either call `jobs()`, or `subscribe()` a callback which is called from a background thread after each poll.
+    """
+
+    def __init__(self, runner, interval=5, ttl=None, max_interval=60, backoff=1.5):
+        """
+        Args:
+            runner (Runner): The runner the queue is queried through.
+            interval (float, optional): The interval in seconds between polls of the background thread.
+            ttl (float, optional): The time in seconds the result of a query is reused for. If not provided, `interval` is used.
+            max_interval (float, optional): While the queue does not change, the interval between polls is multiplied by `backoff` up to this value.
+            backoff (float, optional): The factor the interval is multiplied by when the queue does not change.
+        """
+        super().__init__(interval=interval, max_interval=max_interval, backoff=backoff)
+        self.runner = runner
+        self.ttl = interval if ttl is None else ttl
+
+        self.rows = None
+        self.timestamp = 0
+        self.previous_lines = None
+        # Held during the query, concurrent callers wait for it instead of issuing their own
+        self.lock = threading.Lock()
+
+    def command(self):
+        return f"squeue --noheader -u \"$USER\" --format='{SQUEUE_FORMAT}'"
+
+    def refresh(self):
+        """Queries the queue, bypassing the cache"""
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self):
+        stdout, _, _ = self.runner.exec(self.command())
+        self.rows = parse_squeue(read_output(stdout))
+        self.timestamp = time.time()
+        return self.rows
+
+    def jobs(self, name=None, max_age=None):
+        """
+        Returns the jobs in the queue, querying the queue only if the cached result is older than `max_age` seconds.
+
+        Args:
+            name (str, optional): If provided, only the jobs with this name are returned.
+            max_age (float, optional): If not provided, `ttl` is used.
+        """
+        if max_age is None:
+            max_age = self.ttl
+        with self.lock:
+            if self.rows is None or time.time() - self.timestamp >= max_age:
+                self._refresh()
+            rows = self.rows
+        if name is not None:
+            rows = [row for row in rows if row.name == name]
+        return rows
+
+    def fetch(self, interval):
+        rows = self.jobs(max_age=min(self.ttl, interval))
+        lines = [row.line for row in rows]
+        changed = lines != self.previous_lines
+        self.previous_lines = lines
+        return rows, changed
+
+
+class LogFollower(Poller):
+    """
+    Follows the logs of the runs on the remote filesystem, fetching only the bytes appended since the previous poll.
+
+    The offset reached in each log file is tracked locally, all the logs matching the patterns are read in a single round trip: a shell script compares the size of each file with its offset and prints the new bytes, base64 encoded so that offsets stay exact. The offsets are sent on the standard input of the script, the command line is too short for thousands of logs.
+    """
+
+    def __init__(
+        self,
+        runner,
+        patterns=("runs/*/out.log", "runs/*/*/out.log"),
+        directory=None,
+        max_bytes=2**20,
+        interval=5,
+        max_interval=60,
+        backoff=1.5,
+    ):
+        """
+        Args:
+            runner (Runner): The runner the logs are read through.
+            patterns (tuple, optional): The glob patterns of the log files, relative to `directory`.
+            directory (str, optional): The directory of the runs. If not provided, the experiment run directory of the runner.
+            max_bytes (int, optional): The maximum number of bytes read from each file per poll, the rest is read by the next polls.
+            interval (float, optional): The interval in seconds between polls of the background thread.
+            max_interval (float, optional): While no log grows, the interval between polls is multiplied by `backoff` up to this value.
+            backoff (float, optional): The factor the interval is multiplied by when no log grows.
+        """
+        super().__init__(interval=interval, max_interval=max_interval, backoff=backoff)
+        self.runner = runner
+        self.patterns = patterns
+        self.directory = directory or runner.experiment_rundir
+        self.max_bytes = max_bytes
+        self.offsets = {}
+        # Characters split across two reads are decoded with the next read
+        self.decoders = {}
+        self.lock = threading.Lock()
+
+    def offsets_input(self):
+        """Returns the offsets read by `command()` on its standard input, one `offset<TAB>path` line per log"""
+        return "".join(f"{offset}\t{path}\n" for path, offset in self.offsets.items())
+
+    def command(self):
+        script = f"""
+cd {shlex.quote(self.directory)} || exit 1
+declare -A OFFSETS
+while IFS=$'\\t' read -r offset f; do
+    [ -n "$f" ] && OFFSETS["$f"]=$offset
+done
+for f in {" ".join(self.patterns)}; do
+    [ -f "$f" ] || continue
+    size=$(stat -c %s "$f")
+    offset=${{OFFSETS["$f"]:-0}}
+    # The file was truncated, read it again from the start
+    [ "$size" -lt "$offset" ] && offset=0
+    [ "$size" -gt "$offset" ] || continue
+    n=$((size - offset < {self.max_bytes} ? size - offset : {self.max_bytes}))
+    echo "{LOG_MARKER} $offset $n $f"
+    tail -c +$((offset + 1)) "$f" | head -c $n | base64 -w 0
+    echo
+done
+"""
+        return f"bash -c {shlex.quote(script)}"
+
+    def read(self):
+        """
+        Reads the bytes appended to the logs since the previous call.
+
+        Returns:
+            A dictionary mapping the path of each log that grew, relative to `directory`, to its new text.
+        """
+        with self.lock:
+            stdout, _, _ = self.runner.exec(
+                self.command(), stdin=self.offsets_input()
+            )
+            lines = read_output(stdout).splitlines()
+
+            new_text = {}
+            for header, data in zip(lines, lines[1:]):
+                if not header.startswith(LOG_MARKER + " "):
+                    continue
+                _, offset, n, path = header.split(" ", 3)
+                if int(offset) == 0 or path not in self.decoders:
+                    self.decoders[path] = codecs.getincrementaldecoder("utf-8")(
+                        errors="replace"
+                    )
+                self.offsets[path] = int(offset) + int(n)
+                text = self.decoders[path].decode(base64.b64decode(data))
+                new_text[path] = new_text.get(path, "") + text
+            return new_text
+
+    def fetch(self, interval):
+        new_text = self.read()
+        return new_text, bool(new_text)
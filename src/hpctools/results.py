@@ -0,0 +1,252 @@
+import os
+import re
+import json
+from .utils import GridConfig, idx_to_name
+from .runs import RUN_LOG_FILENAME, local_run_files, run_fingerprint
+
+METRICS_FILENAME = "metrics.json"
+
+# e.g. "loss: 0.25", "accuracy=0.9"
+LOG_METRIC_PATTERN = re.compile(
+    r"(?P<key>[A-Za-z_][\w/.-]*)\s*[=:]\s*"
+    r"(?P<value>[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?)\b"
+)
+LOG_HEADER_KEYS = ("SLURM_JOB_ID", "SLURM_ARRAY_TASK_ID", "GRID_INDEX")
+GRID_INDEX_PATTERN = re.compile(r"^GRID_INDEX: (\d+)$", flags=re.MULTILINE)
+
+
+def parse_metrics_file(run_dir):
+    """
+    Reads the metrics of a run from its `metrics.json` file, either a JSON object or JSON lines, the last value of each metric wins.
+    """
+    path = os.path.join(run_dir, METRICS_FILENAME)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, "r") as f:
+        content = f.read()
+    try:
+        metrics = json.loads(content)
+        records = metrics if isinstance(metrics, list) else [metrics]
+    except json.JSONDecodeError:
+        records = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    metrics = {}
+    for record in records:
+        metrics.update(record)
+    return metrics
+
+
+def parse_log_metrics(run_dir, pattern=LOG_METRIC_PATTERN):
+    """
+    Extracts the `key: value` or `key=value` numeric metrics printed in the `out.log` file of a run, the last value of each metric wins.
+    """
+    path = os.path.join(run_dir, RUN_LOG_FILENAME)
+    if not os.path.exists(path):
+        return {}
+
+    metrics = {}
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            for match in pattern.finditer(line):
+                value = match.group("value")
+                metrics[match.group("key")] = (
+                    float(value) if any(c in value for c in ".eE") else int(value)
+                )
+    # Written by the launch templates, not metrics
+    for key in LOG_HEADER_KEYS:
+        metrics.pop(key, None)
+    return metrics
+
+
+def default_parser(run_dir):
+    """Reads the metrics from `metrics.json` if the run has one, from `out.log` otherwise"""
+    if os.path.exists(os.path.join(run_dir, METRICS_FILENAME)):
+        return parse_metrics_file(run_dir)
+    return parse_log_metrics(run_dir)
+
+
+def names_size(names):
+    """Returns the number of configuration names, as in `flatten_names()`"""
+    size = 1
+    for dim in names:
+        if isinstance(dim, list):
+            size *= len(dim)
+    return size
+
+
+class ResultTable:
+    """
+    Columnar table of the config values and metrics of the runs of a sweep.
+
+    Each `runs/<name>` directory is mapped back to its `GridConfig` index through the configuration names, or through the `GRID_INDEX` written in its `out.log` by the launch templates. The metrics are extracted with a pluggable parser.
+
+    Ingestion is incremental: the size and mtime of the files of each run are recorded, and `ingest()` parses only the runs that are new or changed. The table can be saved and loaded, so that the state survives across sessions.
+    """
+
+    def __init__(
+        self,
+        grid: GridConfig = None,
+        config_names: list = None,
+        join="_",
+        parser=default_parser,
+        path=None,
+    ):
+        """
+        Args:
+            grid (GridConfig, optional): The grid of the sweep, used to add the config values of each run to the table.
+            config_names (list, optional): The configuration names, in the format accepted by `flatten_names()`. If not provided, `grid.config_names` is used.
+            join (str, optional): The separator of the configuration names.
+            parser (callable, optional): Returns the metrics of the run directory it is called with, as a dictionary.
+            path (str, optional): If provided, the table is loaded from this JSON file, if it exists, and saved to it after each ingestion.
+        """
+        self.grid = grid
+        if config_names is None and grid is not None:
+            config_names = grid.config_names
+        self.config_names = config_names
+        self.join = join
+        self.parser = parser
+        self.path = path
+
+        self._name_to_idx = None
+        self.records = {}
+        self.fingerprints = {}
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load(self.path)
+
+    def grid_index(self, run_dir):
+        """Returns the grid index of the run, or None if it cannot be determined"""
+        if self.config_names is not None:
+            if self._name_to_idx is None:
+                indices = (
+                    self.grid.valid_indices()
+                    if self.grid is not None
+                    else range(names_size(self.config_names))
+                )
+                self._name_to_idx = {
+                    idx_to_name(self.config_names, i, join=self.join): i
+                    for i in indices
+                }
+            idx = self._name_to_idx.get(os.path.basename(run_dir), None)
+            if idx is not None:
+                return idx
+
+        log = os.path.join(run_dir, RUN_LOG_FILENAME)
+        if os.path.exists(log):
+            with open(log, "r", errors="replace") as f:
+                match = GRID_INDEX_PATTERN.search(f.read())
+            if match:
+                return int(match.group(1))
+        return None
+
+    def ingest(self, runs_dir):
+        """
+        Adds the new or changed runs of `runs_dir` to the table, a run is a directory containing an `out.log` file.
+
+        Returns:
+            The list of the ingested run directories, relative to `runs_dir`.
+        """
+        ingested = []
+        for root, _, files in os.walk(runs_dir):
+            if RUN_LOG_FILENAME not in files:
+                continue
+            run = os.path.relpath(root, runs_dir)
+            fingerprint = run_fingerprint(local_run_files(root))
+            if self.fingerprints.get(run, None) == fingerprint:
+                continue
+
+            idx = self.grid_index(root)
+            record = {"run": run, "grid_index": -1 if idx is None else idx}
+            if self.grid is not None and idx is not None:
+                record.update(self.grid.get_config(idx))
+            record.update(self.parser(root))
+
+            self.records[run] = record
+            self.fingerprints[run] = fingerprint
+            ingested.append(run)
+
+        if self.path is not None:
+            self.save(self.path)
+        return sorted(ingested)
+
+    def columns(self):
+        """Returns the names of the columns, in order of first appearance"""
+        columns = {}
+        for record in self.records.values():
+            columns.update(dict.fromkeys(record))
+        return list(columns)
+
+    def to_dict(self):
+        """Returns the table as a dictionary of columns, missing values are None"""
+        records = [self.records[run] for run in sorted(self.records)]
+        return {
+            column: [record.get(column, None) for record in records]
+            for column in self.columns()
+        }
+
+    def to_numpy(self):
+        """
+        Returns the table as a NumPy structured array.
+
+        Requires NumPy. Numeric columns with missing values are stored as floats with NaN, other columns as strings.
+        """
+        import numpy as np
+
+        columns = self.to_dict()
+        arrays, dtypes = [], []
+        for column, values in columns.items():
+            present = [v for v in values if v is not None]
+            if present and all(
+                isinstance(v, (int, float)) and not isinstance(v, bool)
+                for v in present
+            ):
+                if len(present) == len(values) and all(
+                    isinstance(v, int) for v in present
+                ):
+                    array = np.array(values, dtype=np.int64)
+                else:
+                    array = np.array(
+                        [np.nan if v is None else v for v in values], dtype=np.float64
+                    )
+            elif present and all(isinstance(v, bool) for v in present):
+                array = np.array([bool(v) for v in values], dtype=np.bool_)
+            else:
+                array = np.array(["" if v is None else str(v) for v in values])
+            arrays.append(array)
+            dtypes.append((column, array.dtype))
+
+        table = np.empty(len(self.records), dtype=dtypes)
+        for (column, _), array in zip(dtypes, arrays):
+            table[column] = array
+        return table
+
+    def to_arrow(self):
+        """Returns the table as a PyArrow table, requires PyArrow"""
+        import pyarrow as pa
+
+        return pa.table(self.to_dict())
+
+    def to_parquet(self, path):
+        """Writes the table to a Parquet file, requires PyArrow"""
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(), path)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {"records": self.records, "fingerprints": self.fingerprints},
+                f,
+                default=str,
+            )
+
+    def load(self, path):
+        with open(path, "r") as f:
+            state = json.load(f)
+        self.records = state["records"]
+        self.fingerprints = state["fingerprints"]
+
+    def __len__(self):
+        return len(self.records)
+
@@ -1,11 +1,345 @@
+import io
 import os
+import abc
+import shutil
+import json
+import fnmatch
+import hashlib
+import asyncio
+import functools
 import re
+import queue
+import time
+import shlex
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import jinja2
 from .utils import MySSHClient, dotdict
 from .auths import SSHAuth
+from .connections import SSHConnectionPool, ssh_pool
+from .jobs import (
+    JobStore,
+    TERMINAL_STATES,
+    format_array_range,
+    parse_array_range,
+    sacct_command,
+    parse_sacct,
+    scancel_command,
+)
+from .runs import (
+    COLLECT_STATE_FILENAME,
+    RUN_CACHE_DIR,
+    list_runs_command,
+    group_run_files,
+    filter_run_files,
+    run_fingerprint,
+    run_markers_command,
+    parse_run_markers,
+    run_config_names,
+    run_dirs_root,
+    run_cache_command,
+    parse_run_cache,
+)
+from .uploaders import file_hash, build_manifest, HashCache, RSYNCUploader
 
 DEBUG = False
 
+# Printed before the output of each launch command when several runs are submitted at once
+RUN_OUTPUT_MARKER = "@@hpctools-run-"
+
+
+def read_output(output):
+    """
+    Returns the output of `Runner.exec()` as a string, whether it is a file-like object or raw bytes.
+    """
+    if hasattr(output, "read"):
+        output = output.read()
+    if isinstance(output, bytes):
+        output = output.decode("utf-8")
+    return output or ""
+
+
+def parse_job_id(output):
+    """
+    Returns the job id in the output of `sbatch`, or None if no job was submitted.
+    """
+    match = re.search(r"Submitted batch job (\d+)", output)
+    return match.group(1) if match else None
+
+
+def split_run_output(output, n_runs):
+    """
+    Splits the output of chained launch commands into the output of each run.
+    """
+    outputs = [""] * n_runs
+    current = None
+    for line in output.splitlines(keepends=True):
+        if line.startswith(RUN_OUTPUT_MARKER):
+            current = int(line[len(RUN_OUTPUT_MARKER) :])
+        elif current is not None:
+            outputs[current] += line
+    return outputs
+
+
+# Width in bytes of each record of the config index, a right aligned byte offset and a newline
+CONFIG_INDEX_WIDTH = 16
+# Directory, relative to the experiment directory, where the config tables are written
+CONFIG_TABLE_DIR = os.path.join(".hpctools", "configs")
+
+
+def write_config_table(path, configs, config_names=None):
+    """
+    Writes the configs to a table with one `name<TAB>config` line per config, and an index with the byte offset of each line.
+
+    Index records have a fixed width (`CONFIG_INDEX_WIDTH`), so the record of config `i` is found by seeking to `i * CONFIG_INDEX_WIDTH` in the index and then to the offset it holds in the table, without reading the other configs.
+
+    Args:
+        path (str): The path of the table, the index is written to `{path}.idx`.
+        configs (list): The configs, typically command line arguments.
+        config_names (list, optional): The names of the configs. If not provided, the index of each config is used as its name.
+
+    Returns:
+        The path of the table and of the index.
+    """
+    if config_names is None:
+        config_names = [str(i) for i in range(len(configs))]
+    if len(config_names) != len(configs):
+        raise ValueError("The number of config names and configs must match")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    offset = 0
+    with open(path, "wb") as table, open(f"{path}.idx", "wb") as index:
+        for name, config in zip(config_names, configs):
+            record = f"{name}\t{config}\n"
+            if record.count("\t") != 1 or record.count("\n") != 1:
+                raise ValueError(f"Config {name} contains tabs or newlines")
+            record = record.encode("utf-8")
+            index.write(f"{offset:{CONFIG_INDEX_WIDTH - 1}d}\n".encode("utf-8"))
+            table.write(record)
+            offset += len(record)
+
+    return path, f"{path}.idx"
+
+
+# Width in bytes of each record of the config hashes file, a sha256 hex digest, a right aligned grid index and a newline
+CONFIG_HASH_WIDTH = 64 + 1 + 15 + 1
+# Template arguments that do not change the result of a config, left out of its hash
+MEMO_IGNORED_ARGS = (
+    "script_configs",
+    "script_config_names",
+    "subexperiment_name",
+    "slurm_args",
+    "array_offset",
+    "array_throttle",
+    "pack_size",
+    "pack_workers",
+    "max_workers",
+    "worker_gpus",
+    "cpus_per_worker",
+)
+
+
+def config_hashes(configs, template_hash, context_hash, template_args={}):
+    """
+    Returns the content hash of each config: the hash of the config, the template, the template arguments shared by all the configs (except `MEMO_IGNORED_ARGS`) and the experiment context.
+    """
+    shared_args = {
+        k: v for k, v in template_args.items() if k not in MEMO_IGNORED_ARGS
+    }
+    run_key = json.dumps(
+        [template_hash, context_hash, shared_args], sort_keys=True, default=str
+    )
+    run_hash = hashlib.sha256(run_key.encode("utf-8")).hexdigest()
+    return [
+        hashlib.sha256(f"{run_hash}\t{config}".encode("utf-8")).hexdigest()
+        for config in configs
+    ]
+
+
+def write_config_hashes(path, hashes, indices=None):
+    """
+    Writes the hash and the grid index of each config to a file of fixed width records (`CONFIG_HASH_WIDTH`), read by the launch templates to record the completed configs in the run cache.
+
+    Args:
+        path (str): The path of the file.
+        hashes (list): The hashes of the configs, see `config_hashes()`.
+        indices (list, optional): The indices of the configs in the sweep. If not provided, the index of each hash is used.
+    """
+    if indices is None:
+        indices = range(len(hashes))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for config_hash, idx in zip(hashes, indices):
+            record = f"{config_hash} {idx:{CONFIG_HASH_WIDTH - 66}d}\n"
+            f.write(record.encode("utf-8"))
+    return path
+
+
+def config_indices(job):
+    """Returns the indices in the sweep of the configs of a job (or shard), in the order of its array tasks"""
+    if job.indices is not None:
+        return list(job.indices)
+    return list(range(job.offset, job.offset + job.size))
+
+
+def config_table_names(job):
+    """Returns the names of the configs of a job (or shard), the default names of the config table if it was submitted without names"""
+    return job.config_names or [str(i) for i in range(len(config_indices(job)))]
+
+
+class ExecStream(abc.ABC):
+    """
+    Output of a command run with `exec_stream()`.
+
+    Iterating yields `(stream, line)` tuples, where stream is "stdout" or "stderr", as soon as each line is available. Once the iteration is over, the exit code of the command is stored in `exitcode`. If the command runs longer than `timeout` seconds it is killed and `TimeoutError` is raised, `cancel()` kills it and stops the iteration.
+    """
+
+    def __init__(self, timeout=None, poll_interval=0.05):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.exitcode = None
+        self.cancelled = threading.Event()
+        self.start = time.time()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def expired(self):
+        return self.timeout is not None and time.time() - self.start > self.timeout
+
+    @abc.abstractmethod
+    def lines(self):
+        pass
+
+    def __iter__(self):
+        return self.lines()
+
+
+def split_lines(buffer, data):
+    """Appends data to the buffer, returns the complete lines and the remaining buffer"""
+    *lines, buffer = (buffer + data).split(b"\n")
+    return [line.decode("utf-8", errors="replace") for line in lines], buffer
+
+
+class SSHExecStream(ExecStream):
+    def __init__(self, channel, timeout=None, chunk_size=2**15, **kwargs):
+        super().__init__(timeout=timeout, **kwargs)
+        self.channel = channel
+        self.chunk_size = chunk_size
+
+    def lines(self):
+        # Data is read only when the consumer asks for more lines, the SSH window bounds what is buffered meanwhile
+        buffers = {"stdout": b"", "stderr": b""}
+        receivers = {
+            "stdout": (self.channel.recv_ready, self.channel.recv),
+            "stderr": (self.channel.recv_stderr_ready, self.channel.recv_stderr),
+        }
+
+        def receive(stream, recv):
+            data = recv(self.chunk_size)
+            lines, buffers[stream] = split_lines(buffers[stream], data)
+            return data, lines
+
+        while True:
+            if self.cancelled.is_set():
+                self.channel.close()
+                return
+            if self.expired():
+                self.channel.close()
+                raise TimeoutError(f"Command timed out after {self.timeout}s")
+
+            received = False
+            for stream, (ready, recv) in receivers.items():
+                if ready():
+                    received = True
+                    _, lines = receive(stream, recv)
+                    for line in lines:
+                        yield stream, line
+
+            if not received:
+                if self.channel.exit_status_ready():
+                    # The exit status is sent after all the output, but the last output may have arrived since it was checked
+                    for stream, (ready, recv) in receivers.items():
+                        while ready():
+                            data, lines = receive(stream, recv)
+                            for line in lines:
+                                yield stream, line
+                            if not data:
+                                break
+                    break
+                time.sleep(self.poll_interval)
+
+        for stream, buffer in buffers.items():
+            if buffer:
+                yield stream, buffer.decode("utf-8", errors="replace")
+        self.exitcode = self.channel.recv_exit_status()
+
+
+class LocalExecStream(ExecStream):
+    def __init__(self, process, timeout=None, max_lines=1000, **kwargs):
+        super().__init__(timeout=timeout, **kwargs)
+        self.process = process
+        # Bounded, readers block (and so does the process) when the consumer is slower
+        self.queue = queue.Queue(maxsize=max_lines)
+
+    def read(self, stream, pipe):
+        for line in iter(pipe.readline, b""):
+            while not self.cancelled.is_set():
+                try:
+                    self.queue.put((stream, line), timeout=self.poll_interval)
+                    break
+                except queue.Full:
+                    pass
+        pipe.close()
+        self.queue.put((stream, None))
+
+    def lines(self):
+        readers = [
+            threading.Thread(target=self.read, args=(stream, pipe), daemon=True)
+            for stream, pipe in [
+                ("stdout", self.process.stdout),
+                ("stderr", self.process.stderr),
+            ]
+        ]
+        for reader in readers:
+            reader.start()
+
+        open_streams = len(readers)
+        while open_streams:
+            if self.cancelled.is_set():
+                self.process.kill()
+                return
+            if self.expired():
+                self.process.kill()
+                self.cancel()
+                raise TimeoutError(f"Command timed out after {self.timeout}s")
+            try:
+                stream, line = self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if line is None:
+                open_streams -= 1
+            else:
+                yield stream, line.decode("utf-8", errors="replace").rstrip("\n")
+
+        self.exitcode = self.process.wait()
+
+
+class ShardedJob(dotdict):
+    """
+    A sweep submitted as several array jobs (shards), each shard has the `offset` of its first config in the sweep and its `size`.
+    """
+
+    def locate(self, grid_idx):
+        """
+        Returns the shard running the config with the given index in the sweep, and its array task id in the shard.
+        """
+        for shard in self.shards:
+            if shard.offset <= grid_idx < shard.offset + shard.size:
+                return shard, grid_idx - shard.offset
+        raise IndexError("Grid index out of bounds")
+
 
 class LAUNCH_COMMANDS(type):
     def __class_getitem__(cls, key):
@@ -21,35 +355,95 @@ class LAUNCH_COMMANDS(type):
     }
 
 
+# Custom undefined class that returns an empty string instead of raising an error
+class SilentUndefined(jinja2.Undefined):
+    def _fail_with_undefined_error(self, *args, **kwargs):
+        class EmptyString(str):
+            def __call__(self, *args, **kwargs):
+                return ""
+
+        return EmptyString()
+
+    __add__ = __radd__ = __mul__ = __rmul__ = __div__ = __rdiv__ = (
+        __truediv__
+    ) = __rtruediv__ = __floordiv__ = __rfloordiv__ = __mod__ = __rmod__ = (
+        __pos__
+    ) = __neg__ = __call__ = __getitem__ = __lt__ = __le__ = __gt__ = __ge__ = (
+        __int__
+    ) = __float__ = __complex__ = __pow__ = __rpow__ = (_fail_with_undefined_error)
+
+
+class PathLoader(jinja2.BaseLoader):
+    """
+    Loads templates directly from their (absolute) path on disk.
+    """
+
+    def get_source(self, environment, template):
+        if not os.path.isfile(template):
+            raise jinja2.TemplateNotFound(template)
+        mtime = os.path.getmtime(template)
+        with open(template) as f:
+            source = f.read()
+        return source, template, lambda: os.path.getmtime(template) == mtime
+
+
 class TEMPLATING_ENGINES(type):
     def __class_getitem__(cls, key):
         return TEMPLATING_ENGINES.MAP[key]
 
-    def j2(template, **template_kwargs):
-        import jinja2
-
-        # Custom undefined class that returns an empty string instead of raising an error
-        class SilentUndefined(jinja2.Undefined):
-            def _fail_with_undefined_error(self, *args, **kwargs):
-                class EmptyString(str):
-                    def __call__(self, *args, **kwargs):
-                        return ""
-
-                return EmptyString()
-
-            __add__ = __radd__ = __mul__ = __rmul__ = __div__ = __rdiv__ = (
-                __truediv__
-            ) = __rtruediv__ = __floordiv__ = __rfloordiv__ = __mod__ = __rmod__ = (
-                __pos__
-            ) = __neg__ = __call__ = __getitem__ = __lt__ = __le__ = __gt__ = __ge__ = (
-                __int__
-            ) = __float__ = __complex__ = __pow__ = __rpow__ = (
-                _fail_with_undefined_error
+    # Shared jinja2 environment, created on first use
+    J2_ENVIRONMENT = None
+    # Compiled jinja2 templates, keyed by (path, mtime)
+    J2_TEMPLATES = {}
+
+    def j2_environment(bytecode_cache_dir=None, reset=False):
+        """
+        Returns the jinja2 environment shared by all the runners.
+
+        Args:
+            bytecode_cache_dir (str, optional): If provided, compiled templates are also cached on disk in this directory, so that new processes can skip the compilation step.
+            reset (bool, optional): If True, the environment and the compiled templates are rebuilt.
+        """
+        if reset or bytecode_cache_dir is not None:
+            TEMPLATING_ENGINES.J2_ENVIRONMENT = None
+            TEMPLATING_ENGINES.J2_TEMPLATES.clear()
+
+        if TEMPLATING_ENGINES.J2_ENVIRONMENT is None:
+            bytecode_cache = None
+            if bytecode_cache_dir is not None:
+                os.makedirs(bytecode_cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+
+            TEMPLATING_ENGINES.J2_ENVIRONMENT = jinja2.Environment(
+                loader=PathLoader(),
+                undefined=SilentUndefined,
+                bytecode_cache=bytecode_cache,
+                # Caching is handled by J2_TEMPLATES
+                cache_size=0,
             )
+        return TEMPLATING_ENGINES.J2_ENVIRONMENT
 
-        return jinja2.Template(open(template).read(), undefined=SilentUndefined).render(
-            **template_kwargs,
-        )
+    def j2_template(template):
+        """
+        Returns the compiled jinja2 template, compiling it only if it was never seen or it changed on disk.
+        """
+        template = os.path.abspath(template)
+        key = (template, os.path.getmtime(template))
+
+        compiled = TEMPLATING_ENGINES.J2_TEMPLATES.get(key, None)
+        if compiled is None:
+            compiled = TEMPLATING_ENGINES.j2_environment().get_template(template)
+
+            # Forget older versions of the same template
+            for old_key in list(TEMPLATING_ENGINES.J2_TEMPLATES):
+                if old_key[0] == template:
+                    del TEMPLATING_ENGINES.J2_TEMPLATES[old_key]
+            TEMPLATING_ENGINES.J2_TEMPLATES[key] = compiled
+
+        return compiled
+
+    def j2(template, **template_kwargs):
+        return TEMPLATING_ENGINES.j2_template(template).render(**template_kwargs)
 
     MAP = {
         "j2": j2,
@@ -64,6 +458,9 @@ class Runner:
     It handles the creation of launch files, the execution of the experiments, and the management of the experiment context (files and directories).
     """
 
+    # The host the jobs are submitted to, jobs are recorded by (host, job id) in the job store
+    host = "localhost"
+
     # The `LAUNCH_COMMANDS` dictionary defines the commands used to launch experiments for different types of job schedulers (e.g., Bash, Slurm).
     # The keys in this dictionary represent the file extension of the launch file, and the values are the corresponding launch commands.
     LAUNCH_COMMANDS = {
@@ -78,6 +475,8 @@ class Runner:
         experiment_dir: str = None,
         experiment_name: str = None,
         environment: dict = None,
+        config_table: bool = True,
+        job_store: JobStore = None,
     ):
         """
         Initializes the experiment runner.
@@ -87,6 +486,8 @@ class Runner:
             experiment_dir (str, optional): The directory containing the necessary configuration and files for the experiment. If not provided, the current working directory will be considered the experiment directory.
             experiment_name (str, optional): The name of the experiment. If not provided, it will default to the basename of `experiment_dir`.
             environment (dict, optional): A dictionary of environment variables to be used during the experiment. If not provided, an empty dictionary will be used.
+            config_table (bool, optional): If True, the `script_configs` template argument is written to an indexed config table next to the launch file, instead of being inlined in the launch file.
+            job_store (JobStore, optional): If provided, every submitted job is recorded in the job store, see `refresh_jobs()`.
         """
 
         self.project_name = project_name
@@ -105,6 +506,11 @@ class Runner:
         if environment is None:
             environment = {}
         self.environment = environment
+        self.config_table = config_table
+        self.job_store = job_store
+        self._queue_poller = None
+        # Content hashes of the context files, see `context_hash()`
+        self.hash_cache = HashCache()
 
         self.context = []
         self.context_blacklist = []
@@ -141,36 +547,102 @@ class Runner:
         """
         self.context_blacklist.append(path)
 
-    def run(
-        self,
-        template,
-        template_args={},
-        run_name=None,
-        dry_run=False,
-    ):
+    def sync_blacklist(self, source):
         """
-        Runs the experiment using the specified template and arguments.
+        Returns the local paths of source that are not synchronized: the paths removed with `del_context()` and, in the experiment directory, the runs collected back by `collect()`, which would otherwise overwrite the newer remote files.
+        """
+        blacklist = list(self.context_blacklist)
+        if os.path.abspath(source) == os.path.abspath(self.experiment_dir):
+            blacklist += [
+                os.path.join(source, "runs"),
+                os.path.join(source, COLLECT_STATE_FILENAME),
+            ]
+        return blacklist
+
+    def context_hash(self, ignore=None):
+        """
+        Returns the content hash of the experiment context: the experiment directory and the files and directories added with `add_context()`, by their path in the experiment run directory.
 
-        The `run()` method is responsible for generating the launch file, executing the experiment, and performing any necessary cleanup.
+        The files written by the runner (launch files, config tables, run cache, collected runs) and the blacklisted paths are left out, so that the hash changes only when the files the configs run with change.
+
+        Args:
+            ignore (list, optional): The files matching one of these glob patterns, relative to the experiment run directory, are left out too, e.g. `["*.ipynb", "analysis/*"]`.
+        """
+        sources = {os.path.abspath(self.experiment_dir): self.experiment_rundir}
+        for source, target in self.context:
+            sources.setdefault(source, target)
+
+        manifest = {}
+        for source, target in sources.items():
+            if os.path.isfile(source):
+                files = {os.path.basename(source): self.hash_cache.hash(source)}
+            else:
+                blacklist = self.context_blacklist + [
+                    os.path.join(source, path)
+                    for path in [".hpctools", "runs", COLLECT_STATE_FILENAME]
+                ]
+                files = build_manifest(source, blacklist, self.hash_cache)
+            for path, digest in files.items():
+                path = os.path.relpath(
+                    os.path.join(target, path), self.experiment_rundir
+                )
+                # Launch files, rendered by the runner
+                if path.startswith("launch.") and (
+                    path.rsplit(".", 1)[-1] in self.LAUNCH_COMMANDS
+                ):
+                    continue
+                if not any(fnmatch.fnmatch(path, pattern) for pattern in ignore or []):
+                    manifest[path] = digest
+
+        return hashlib.sha256(
+            json.dumps(manifest, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def job_name(self, run_name=None):
+        """
+        Returns the name of the job of the given experiment run.
+        """
+        job_name = "/".join(
+            filter(
+                None,
+                [
+                    self.project_name,
+                    self.experiment_name,
+                    run_name,
+                ],
+            )
+        )
+        # Allow only certain characters
+        pattern = re.compile(
+            "([^"
+            # \U0001F9EA # 🧪
+            "A-Za-z"  # Leters
+            "0-9"  # Numbers
+            "\-._\/"  # Other symbols
+            "]+)",
+            flags=re.UNICODE,
+        )
+        return re.sub(pattern, "", job_name)
+
+    def render_launch_file(self, template, template_args={}, run_name=None):
+        """
+        Compiles the launch file template and writes the launch file to the experiment directory.
 
         Args:
             template (str): The path to the template file used to generate the launch file.
             template_args (dict, optional): A dictionary of arguments to be passed to the template compiler.
-            run_name (str, optional): The name of the experiment run. If not provided, a default name will be generated.
-            dry_run (bool, optional): If True, the launch command will be printed but not executed.
+            run_name (str, optional): The name of the experiment run.
 
         Returns:
-            A `dotdict` object containing the job attributes.
+            A `dotdict` object with the `job_name`, the local `launch_file_name` and the `launch_command` to be executed from the experiment run directory. With a config table, the `config_table` and the `saved_launch_file` of the submission, named after the run name and a hash of the template and its arguments.
         """
-        self.run_before()
-
         _, launch_file_ext, template_ext = template.rsplit(".", 2)
 
         launch_command = self.__class__.LAUNCH_COMMANDS.get(launch_file_ext, None)
         if launch_command is None:
             raise ValueError(f"Unrecognized launch file of type {launch_file_ext}")
 
-        template_compiler = TEMPLATING_ENGINES.get(template_ext, None)
+        template_compiler = TEMPLATING_ENGINES.MAP.get(template_ext, None)
         if template_compiler is None:
             raise ValueError(f"Unrecognized template extension: {template_ext}")
 
@@ -187,28 +659,47 @@ class Runner:
         )
         launch_file_name = os.path.join(self.experiment_dir, launch_file_name)
 
-        # Generate the job name
-        job_name = "/".join(
-            filter(
-                None,
+        job_name = self.job_name(run_name)
+        template_hash = file_hash(template)
+
+        table_name = None
+        if self.config_table and "script_configs" in template_args:
+            # Each submission has its own table, the pending tasks of a previous submission with the same run name keep reading theirs
+            submission = json.dumps(
+                [template_hash, job_name, template_args], sort_keys=True, default=str
+            )
+            table_name = "-".join(
                 [
-                    self.project_name,
-                    self.experiment_name,
-                    run_name,
-                ],
+                    run_name or "run",
+                    hashlib.sha256(submission.encode("utf-8")).hexdigest()[:12],
+                ]
             )
-        )
-        # Allow only certain characters
-        pattern = re.compile(
-            "([^"
-            # \U0001F9EA # 🧪
-            "A-Za-z"  # Leters
-            "0-9"  # Numbers
-            "\-._\/"  # Other symbols
-            "]+)",
-            flags=re.UNICODE,
-        )
-        job_name = re.sub(pattern, "", job_name)
+            # Paths relative to the experiment run directory, where the launch file is executed
+            config_table = os.path.join(CONFIG_TABLE_DIR, f"{table_name}.tsv")
+            write_config_table(
+                os.path.join(self.experiment_dir, config_table),
+                template_args["script_configs"],
+                template_args.get("script_config_names", None),
+            )
+            template_args = dict(
+                template_args,
+                config_table=config_table,
+                config_index=f"{config_table}.idx",
+                config_index_width=CONFIG_INDEX_WIDTH,
+            )
+            if "script_config_hashes" in template_args:
+                config_hashes = f"{config_table}.hashes"
+                write_config_hashes(
+                    os.path.join(self.experiment_dir, config_hashes),
+                    template_args["script_config_hashes"],
+                    template_args.get("script_config_indices", None),
+                )
+                template_args = dict(
+                    template_args,
+                    config_hashes=config_hashes,
+                    config_hash_width=CONFIG_HASH_WIDTH,
+                    run_cache_dir=RUN_CACHE_DIR,
+                )
 
         # Compile the launch file template
         launch_file = template_compiler(
@@ -218,6 +709,7 @@ class Runner:
             project_name=self.project_name,
             experiment_name=self.experiment_name,
             run_name=run_name,
+            job_name=job_name,
             # Actual args
             **template_args,
         )
@@ -226,31 +718,640 @@ class Runner:
         with open(launch_file_name, "w+") as f:
             f.write(launch_file)
 
-        # Compile the launch command
-        launch_command.format(
+        saved_launch_file = None
+        if table_name is not None:
+            # Kept next to the config table, failed tasks are resubmitted with the same launch file
+            saved_launch_file = os.path.join(
+                CONFIG_TABLE_DIR, f"{table_name}.{launch_file_ext}"
+            )
+            shutil.copyfile(
+                launch_file_name, os.path.join(self.experiment_dir, saved_launch_file)
+            )
+
+        # Compile the launch command, the launch file is executed from the experiment run directory
+        launch_command = launch_command.format(
+            launch_file_name=os.path.basename(launch_file_name),
+        )
+
+        return dotdict(
+            job_name=job_name,
             launch_file_name=launch_file_name,
+            launch_command=launch_command,
+            template_hash=template_hash,
+            saved_launch_file=saved_launch_file,
+            config_table=template_args.get("config_table", None),
         )
 
-        print(f"Launch command: {launch_command}")
+    def run(
+        self,
+        template,
+        template_args={},
+        run_name=None,
+        dry_run=False,
+    ):
+        """
+        Runs the experiment using the specified template and arguments.
 
-        self.sync_context()
+        The `run()` method is responsible for generating the launch file, executing the experiment, and performing any necessary cleanup.
 
-        if dry_run:
-            print("Dry run: Launch command not executed")
-        else:
-            # Run the launch command
-            stdout, stderr, exitcode = self.exec(launch_command)
+        Args:
+            template (str): The path to the template file used to generate the launch file.
+            template_args (dict, optional): A dictionary of arguments to be passed to the template compiler.
+            run_name (str, optional): The name of the experiment run. If not provided, a default name will be generated.
+            dry_run (bool, optional): If True, the launch command will be printed but not executed.
 
-            print(stdout.read().decode("utf-8"))
-            print("\033[91m" + stderr.read().decode("utf-8") + "\033[0m")
+        Returns:
+            A `dotdict` object containing the job attributes.
+        """
+        return self.run_many([(template, template_args, run_name)], dry_run=dry_run)[0]
+
+    def run_many(self, runs, dry_run=False):
+        """
+        Runs several experiments at once, paying the setup cost only once.
+
+        All the launch files are rendered up front, the context (which includes the launch files) is synchronized a single time and all the launch commands are chained in a single `exec()` call.
+
+        Args:
+            runs (list): A list of `(template, template_args, run_name)` tuples, `template_args` and `run_name` can be omitted.
+            dry_run (bool, optional): If True, the launch commands will be printed but not executed.
+
+        Returns:
+            A list of `dotdict` objects containing the job attributes, one for each run.
+        """
+        # Fill in the optional template_args and run_name
+        runs = [tuple(run) + ({}, None)[len(run) - 1 :] for run in runs]
+
+        run_names = [run_name for _, _, run_name in runs]
+        if len(set(run_names)) != len(run_names):
+            raise ValueError("Run names must be unique")
+
+        self.run_before()
 
-        # Cleanup
-        if not DEBUG:
-            os.remove(launch_file_name)
+        launches = [self.render_launch_file(*run) for run in runs]
+
+        for launch in launches:
+            print(f"Launch command: {launch.launch_command}")
+
+        try:
+            self.sync_context()
+
+            outputs = [""] * len(launches)
+            if dry_run:
+                print("Dry run: Launch command not executed")
+            else:
+                # Run all the launch commands in one go, the markers allow to split the output by run
+                command = f"cd {self.experiment_rundir}"
+                for i, launch in enumerate(launches):
+                    command += f"; echo {RUN_OUTPUT_MARKER}{i}; {launch.launch_command}"
+                stdout, stderr, exitcode = self.exec(command)
+
+                outputs = split_run_output(read_output(stdout), len(launches))
+                for output in outputs:
+                    print(output)
+                print("\033[91m" + read_output(stderr) + "\033[0m")
+        finally:
+            # Cleanup
+            if not DEBUG:
+                for launch in launches:
+                    os.remove(launch.launch_file_name)
 
         self.run_after()
 
-        job = dotdict(name=job_name)
+        jobs = []
+        for (_, template_args, run_name), launch, output in zip(
+            runs, launches, outputs
+        ):
+            job = dotdict(
+                name=launch.job_name,
+                output=output,
+                id=parse_job_id(output),
+                template_hash=launch.template_hash,
+                config_names=template_args.get("script_config_names", None),
+                offset=template_args.get("array_offset", None) or 0,
+                size=len(template_args.get("script_configs", [])),
+                indices=template_args.get("script_config_indices", None),
+                throttle=template_args.get("array_throttle", None),
+                launch_file=launch.saved_launch_file,
+                config_table=launch.config_table,
+                subexperiment_name=template_args.get("subexperiment_name", None),
+                run_name=run_name,
+            )
+            if self.job_store is not None and job.id is not None:
+                self.job_store.record(
+                    self.host,
+                    job.id,
+                    name=job.name,
+                    run_name=run_name,
+                    config_offset=job.offset,
+                    config_size=job.size or None,
+                    template_hash=job.template_hash,
+                    remote_dir=self.experiment_rundir,
+                )
+            jobs.append(job)
+
+        return jobs
+
+    def cancel(self, job_ids, state=None):
+        """
+        Cancels the given jobs and array tasks, collapsed in as few `scancel` invocations as possible and executed in a single `exec()` call.
+
+        Args:
+            job_ids (list): Job ids, array tasks (`123_4`) or array ranges (`123_[4-7]`).
+            state (str, optional): If provided, only the jobs and tasks in this state are cancelled, e.g. "PENDING".
+
+        Returns:
+            The output of `scancel`.
+        """
+        if not job_ids:
+            return ""
+        stdout, _, _ = self.exec(scancel_command(job_ids, state=state))
+        return read_output(stdout)
+
+    def cancel_job(self, job, indices=None, state=None):
+        """
+        Cancels a job returned by `run()`, `run_sharded()` or `run_packed()`.
+
+        Args:
+            job (dotdict): The job to cancel.
+            indices (list, optional): If provided, only the array tasks running the configs with these indices in the sweep are cancelled.
+            state (str, optional): If provided, only the tasks in this state are cancelled, e.g. "PENDING".
+        """
+        shards = job.shards if isinstance(job, ShardedJob) else [job]
+        if indices is None:
+            job_ids = [shard.id for shard in shards]
+        elif isinstance(job, ShardedJob):
+            job_ids = [
+                f"{shard.id}_{task_id}"
+                for shard, task_id in map(job.locate, indices)
+            ]
+        else:
+            if job.indices is not None:
+                # Memoized jobs run a subset of the sweep, see `run_memoized()`
+                positions = {idx: pos for pos, idx in enumerate(job.indices)}
+                indices = [positions[idx] for idx in indices]
+            job_ids = [f"{job.id}_{idx // (job.pack_size or 1)}" for idx in indices]
+        return self.cancel([job_id for job_id in job_ids if job_id], state=state)
+
+    def collect(
+        self,
+        local_dir=None,
+        job=None,
+        names=None,
+        include=None,
+        exclude=None,
+        workers=4,
+        force=False,
+    ):
+        """
+        Pulls the results of the runs (the `runs/` directory) back from the experiment run directory.
+
+        The files of all the runs are listed with a single `exec()` call, and only the runs whose files changed since the previous collection are downloaded, with `workers` parallel transfers. The fingerprint of each collected run is stored in `local_dir/.hpctools-collect.json`.
+
+        Args:
+            local_dir (str, optional): The local directory the `runs/` directory is collected to. If not provided, the experiment directory.
+            job (dotdict, optional): If provided, only the runs of the configs of this job are collected, from its `runs/{subexperiment_name}` directory.
+            names (list, optional): If provided, only the runs with these config names are collected, in any subexperiment.
+            include (list, optional): If provided, only the files matching one of these glob patterns are collected, e.g. `["*.log", "metrics.json"]`.
+            exclude (list, optional): The files matching one of these glob patterns are not collected, e.g. `["checkpoints/*", "*.pt"]`.
+            workers (int, optional): The number of parallel transfers.
+            force (bool, optional): If True, the runs are collected even if they did not change.
+
+        Returns:
+            The list of the collected run directories, relative to `local_dir`.
+        """
+        if local_dir is None:
+            local_dir = self.experiment_dir
+
+        stdout, _, _ = self.exec(
+            f"cd {self.experiment_rundir} && {list_runs_command()}"
+        )
+        runs = group_run_files(read_output(stdout))
+        if job is not None:
+            # Only the runs in the run directories of the job, `runs/{subexperiment_name}`
+            shards = job.shards if isinstance(job, ShardedJob) else [job]
+            job_runs = {
+                (run_dirs_root(shard), name)
+                for shard in shards
+                for name in config_table_names(shard)
+            }
+
+
+            def is_job_run(run_dir):
+                runs_dir, run_names = run_config_names(run_dir)
+                return any((runs_dir, name) in job_runs for name in run_names)
+
+            runs = {
+                run_dir: files for run_dir, files in runs.items() if is_job_run(run_dir)
+            }
+        if names is not None:
+            names = set(names)
+            runs = {
+                run_dir: files
+                for run_dir, files in runs.items()
+                if not names.isdisjoint(run_config_names(run_dir)[1])
+            }
+
+        state_file = os.path.join(local_dir, COLLECT_STATE_FILENAME)
+        state = {}
+        if os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                state = json.load(f)
+
+        changed = {}
+        for run_dir, files in runs.items():
+            files = filter_run_files(files, include=include, exclude=exclude)
+            fingerprint = run_fingerprint(files)
+            if files and (force or state.get(run_dir, None) != fingerprint):
+                changed[run_dir] = (files, fingerprint)
+
+        # Balance the transfers by number of files, runs are not split across transfers
+        groups = [[] for _ in range(max(1, min(workers, len(changed))))]
+        for run_dir, (files, _) in sorted(
+            changed.items(), key=lambda item: -len(item[1][0])
+        ):
+            group = min(groups, key=len)
+            group.extend(os.path.join(run_dir, path) for path, _, _ in files)
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(self.download, group, local_dir)
+                for group in groups
+                if group
+            ]
+            for future in futures:
+                future.result()
+
+        for run_dir, (_, fingerprint) in changed.items():
+            state[run_dir] = fingerprint
+        os.makedirs(local_dir, exist_ok=True)
+        with open(state_file, "w") as f:
+            json.dump(state, f)
+
+        print(f"Collected {len(changed)} of {len(runs)} runs")
+        return sorted(changed)
+
+    def failed_indices(self, job):
+        """
+        Returns the indices in the sweep of the configs of the job that failed or never ran.
+
+        A config succeeded if one of its runs wrote a `0` completion marker (the `exit_code` file written by the launch templates). Only the runs in `runs/{subexperiment_name}` with the name of the config, and the same `GRID_INDEX`, are runs of the config. The configs of the array tasks that `sacct` reports as still pending or running, in the job or in its resubmissions, are left out. Markers and states are read with a single `exec()` call.
+        """
+        shards = job.shards if isinstance(job, ShardedJob) else [job]
+        shard_of = {}
+        for shard in shards:
+            for job_id in [shard.id] + (shard.retry_ids or []):
+                shard_of[job_id] = shard
+        if None in shard_of:
+            raise ValueError("The job was not submitted")
+
+        runs_dirs = {shard.id: run_dirs_root(shard) for shard in shards}
+        command = (
+            f"cd {self.experiment_rundir}"
+            f"; echo {RUN_OUTPUT_MARKER}0"
+            f"; {run_markers_command(sorted(set(runs_dirs.values())))}"
+            f"; echo {RUN_OUTPUT_MARKER}1; {sacct_command(list(shard_of))}"
+        )
+        stdout, _, _ = self.exec(command)
+        markers_output, sacct_output = split_run_output(read_output(stdout), 2)
+        succeeded = set()
+        for run_dir, (grid_idx, exit_code) in parse_run_markers(markers_output).items():
+            if exit_code != 0:
+                continue
+            runs_dir, names = run_config_names(run_dir)
+            succeeded.update((runs_dir, name, grid_idx) for name in names)
+
+        active = set()
+        for job_id, task_id, state, _ in parse_sacct(sacct_output):
+            shard = shard_of.get(job_id, None)
+            if shard is None or state in TERMINAL_STATES:
+                continue
+            indices = config_indices(shard)
+            if task_id is None:
+                active.update(indices)
+            else:
+                pack_size = shard.pack_size or 1
+                active.update(indices[task_id * pack_size : (task_id + 1) * pack_size])
+
+        failed = []
+        for shard in shards:
+            for name, idx in zip(config_table_names(shard), config_indices(shard)):
+                if idx in active:
+                    continue
+                if (runs_dirs[shard.id], name, idx) not in succeeded:
+                    failed.append(idx)
+        return failed
+
+    def resubmit(self, job, max_retries=3, dry_run=False):
+        """
+        Resubmits only the array tasks of the job whose configs failed or never ran, see `failed_indices()`.
+
+        The tasks are resubmitted as a compact array (`sbatch --array=...`) of the original launch file, which reads the original config table, so nothing is rendered or uploaded again. Packed jobs resubmit the whole pack of each failed config. The resubmissions are tracked in the `retry_ids` of the job (or of its shards), and the number of attempts of each config in `job.attempts`.
+
+        Args:
+            job (dotdict): A job returned by `run()`, `run_sharded()` or `run_packed()` with a config table.
+            max_retries (int, optional): The maximum number of resubmissions of each config, the configs that exhausted their budget are not resubmitted.
+            dry_run (bool, optional): If True, the launch commands will be printed but not executed.
+
+        Returns:
+            A `dotdict` object with the resubmitted `indices`, the `exhausted` indices and the `ids` of the new jobs.
+        """
+        shards = job.shards if isinstance(job, ShardedJob) else [job]
+        if job.attempts is None:
+            job.attempts = {}
+
+        failed = self.failed_indices(job)
+        exhausted = [
+            idx for idx in failed if job.attempts.get(idx, 0) >= max_retries
+        ]
+        retry = [idx for idx in failed if job.attempts.get(idx, 0) < max_retries]
+
+        command = f"cd {self.experiment_rundir}"
+        submissions = []
+        for shard in shards:
+            pack_size = shard.pack_size or 1
+            positions = {idx: pos for pos, idx in enumerate(config_indices(shard))}
+            task_ids = {
+                positions[idx] // pack_size for idx in retry if idx in positions
+            }
+            if not task_ids:
+                continue
+            if shard.launch_file is None:
+                raise ValueError(
+                    "The job has no saved launch file, run it with a config table"
+                )
+            array = format_array_range(task_ids)
+            if shard.throttle:
+                array += f"%{shard.throttle}"
+            command += (
+                f"; echo {RUN_OUTPUT_MARKER}{len(submissions)}"
+                f"; sbatch --array={array} {shard.launch_file}"
+            )
+            submissions.append(shard)
+
+        if exhausted:
+            print(f"{len(exhausted)} configs exhausted their retry budget")
+        print(f"Resubmitting {len(retry)} configs: {command}")
+
+        ids = []
+        if submissions and not dry_run:
+            stdout, stderr, _ = self.exec(command)
+            outputs = split_run_output(read_output(stdout), len(submissions))
+            for shard, output in zip(submissions, outputs):
+                job_id = parse_job_id(output)
+                if job_id is None:
+                    print("\033[91m" + output + read_output(stderr) + "\033[0m")
+                    continue
+                shard.retry_ids = (shard.retry_ids or []) + [job_id]
+                ids.append(job_id)
+                if self.job_store is not None:
+                    self.job_store.record(
+                        self.host,
+                        job_id,
+                        name=shard.name,
+                        run_name=shard.run_name,
+                        config_offset=shard.offset,
+                        config_size=shard.size,
+                        template_hash=shard.template_hash,
+                        remote_dir=self.experiment_rundir,
+                    )
+            for idx in retry:
+                job.attempts[idx] = job.attempts.get(idx, 0) + 1
+
+        return dotdict(indices=retry, exhausted=exhausted, ids=ids)
+
+    def download(self, files, local_dir):
+        """
+        Downloads the given files of the experiment run directory to `local_dir`.
+
+        Args:
+            files (list): The paths of the files, relative to the experiment run directory.
+            local_dir (str): The local directory.
+        """
+        pass
+
+    @property
+    def queue_poller(self):
+        """
+        The `QueuePoller` shared by all the consumers of the queue of this runner, e.g. `SlurmQueueWidget`.
+        """
+        if self._queue_poller is None:
+            from .monitoring import QueuePoller
+
+            self._queue_poller = QueuePoller(self)
+        return self._queue_poller
+
+    def refresh_jobs(self):
+        """
+        Refreshes the state of the jobs of the job store submitted to this host that are not finished yet, with a single `sacct` call.
+
+        Returns:
+            A list of `dotdict` objects with the `job_id`, `task_id`, `state` and `exit_code` of the jobs and array tasks whose state changed.
+        """
+        if self.job_store is None:
+            raise ValueError("The runner has no job store")
+
+        job_ids = self.job_store.active_jobs(self.host)
+        if not job_ids:
+            return []
+
+        stdout, _, _ = self.exec(sacct_command(job_ids))
+        return self.job_store.update(self.host, parse_sacct(read_output(stdout)))
+
+    def run_sharded(
+        self,
+        template,
+        template_args={},
+        run_name=None,
+        max_array_size=1000,
+        throttle=None,
+        dry_run=False,
+    ):
+        """
+        Runs a sweep split in several array jobs, each with at most `max_array_size` tasks.
+
+        The `script_configs` and `script_config_names` template arguments are split in shards, each shard is rendered with its own `array_offset` (the index of its first config in the sweep) and all the shards are submitted at once with `run_many()`.
+
+        Args:
+            template (str): The path to the template file used to generate the launch file.
+            template_args (dict, optional): A dictionary of arguments to be passed to the template compiler, must contain `script_configs`.
+            run_name (str, optional): The name of the experiment run, shards are named `{run_name}-{shard}`.
+            max_array_size (int, optional): The maximum number of tasks of each array job, should be lower than the MaxArraySize of the cluster.
+            throttle (int, optional): If provided, the maximum number of tasks of each array job running at the same time (the `%N` suffix of `--array`).
+            dry_run (bool, optional): If True, the launch commands will be printed but not executed.
+
+        Returns:
+            A `ShardedJob` object tracking the shards as a single job.
+        """
+        configs = template_args["script_configs"]
+        config_names = template_args.get("script_config_names", None)
+
+        runs = []
+        offsets = list(range(0, len(configs), max_array_size))
+        for shard, offset in enumerate(offsets):
+            shard_args = dict(
+                template_args,
+                script_configs=configs[offset : offset + max_array_size],
+                array_offset=offset,
+                array_throttle=throttle,
+            )
+            if config_names is not None:
+                shard_args["script_config_names"] = config_names[
+                    offset : offset + max_array_size
+                ]
+            runs.append(
+                (template, shard_args, "-".join(filter(None, [run_name, str(shard)])))
+            )
+
+        shards = self.run_many(runs, dry_run=dry_run)
+
+        return ShardedJob(
+            name=self.job_name(run_name), shards=shards, size=len(configs)
+        )
+
+    def run_packed(
+        self,
+        template,
+        template_args={},
+        run_name=None,
+        pack_size=None,
+        workers=None,
+        max_array_size=1000,
+        throttle=None,
+        dry_run=False,
+    ):
+        """
+        Runs a sweep as an array job where each task runs `pack_size` configs, see `packedarrayjob.slurm.j2`.
+
+        Packing many short configs in the same task amortizes the scheduling overhead and queue wait. Inside each task, the configs are run by `workers` concurrent processes, each with its own log directory and `exit_code` file.
+
+        Args:
+            template (str): The path to the template file used to generate the launch file.
+            template_args (dict, optional): A dictionary of arguments to be passed to the template compiler, must contain `script_configs`.
+            run_name (str, optional): The name of the experiment run.
+            pack_size (int, optional): The number of configs run by each array task. If not provided, the smallest pack size that fits the sweep in `max_array_size` tasks is used.
+            workers (int, optional): The number of configs run concurrently in each task. If not provided, one per allocated GPU, or one per `cpus-per-task`.
+            max_array_size (int, optional): The maximum number of tasks of the array job, used when `pack_size` is not provided.
+            throttle (int, optional): If provided, the maximum number of tasks running at the same time.
+            dry_run (bool, optional): If True, the launch command will be printed but not executed.
+
+        Returns:
+            A `dotdict` object containing the job attributes, config `i` is run by array task `i // job.pack_size`.
+        """
+        if not self.config_table:
+            raise ValueError("Packed array jobs require the config table")
+
+        n_configs = len(template_args["script_configs"])
+        if pack_size is None:
+            pack_size = max(1, -(-n_configs // max_array_size))
+
+        job = self.run(
+            template,
+            dict(
+                template_args,
+                pack_size=pack_size,
+                pack_workers=workers,
+                array_throttle=throttle,
+            ),
+            run_name=run_name,
+            dry_run=dry_run,
+        )
+        job.pack_size = pack_size
+
+        return job
+
+    def run_memoized(
+        self,
+        template,
+        template_args={},
+        run_name=None,
+        link=True,
+        ignore=None,
+        dry_run=False,
+    ):
+        """
+        Runs only the configs of the sweep that did not already complete with the same code, template and arguments.
+
+        Each config is identified by a content hash of its value, the template, the shared template arguments and the experiment context, see `config_hashes()` and `context_hash()`. When a config succeeds, the launch templates record its run directory in the run cache (`.hpctools/cache/<hash>` in the experiment run directory). The run cache is read with a single `exec()` call and the configs with a completed run are skipped, so that resubmitting a sweep, or extending its grid, runs only the new points.
+
+        Args:
+            template (str): The path to the template file used to generate the launch file.
+            template_args (dict, optional): A dictionary of arguments to be passed to the template compiler, must contain `script_configs`.
+            run_name (str, optional): The name of the experiment run.
+            link (bool, optional): If True, the run directory of each skipped config is a symlink to its completed run, so that `runs/{subexperiment_name}` holds the whole sweep.
+            ignore (list, optional): Glob patterns of the context files that do not change the results, e.g. analysis notebooks, see `context_hash()`.
+            dry_run (bool, optional): If True, the launch command will be printed but not executed.
+
+        Returns:
+            A `dotdict` object containing the job attributes, with the `indices` in the sweep of the submitted configs, in the order of the array tasks, and the `skipped` configs as a dictionary mapping their index in the sweep to their completed run directory.
+        """
+        if not self.config_table:
+            raise ValueError("Memoized runs require the config table")
+
+        configs = template_args["script_configs"]
+        config_names = template_args.get("script_config_names", None)
+        if config_names is None:
+            config_names = [str(i) for i in range(len(configs))]
+        hashes = config_hashes(
+            configs, file_hash(template), self.context_hash(ignore), template_args
+        )
+
+        stdout, _, _ = self.exec(
+            f"cd {self.experiment_rundir} && {run_cache_command()}"
+        )
+        cache = parse_run_cache(read_output(stdout))
+
+        skipped = {
+            i: cache[config_hash]
+            for i, config_hash in enumerate(hashes)
+            if config_hash in cache
+        }
+        indices = [i for i in range(len(configs)) if i not in skipped]
+        print(f"Skipping {len(skipped)} of {len(configs)} configs already completed")
+
+        if link and skipped:
+            runs_dir = os.path.join(
+                "runs", template_args.get("subexperiment_name", None) or ""
+            )
+            command = f"cd {self.experiment_rundir} && mkdir -p {runs_dir}"
+            for i, run_dir in skipped.items():
+                link_path = os.path.normpath(os.path.join(runs_dir, config_names[i]))
+                if link_path == run_dir:
+                    continue
+                target = os.path.relpath(run_dir, runs_dir)
+                command += (
+                    f"; [ -e {shlex.quote(link_path)} ]"
+                    f" || ln -sfn {shlex.quote(target)} {shlex.quote(link_path)}"
+                )
+            if dry_run:
+                print(f"Link command: {command}")
+            else:
+                self.exec(command)
+
+        if indices:
+            job = self.run(
+                template,
+                dict(
+                    template_args,
+                    script_configs=[configs[i] for i in indices],
+                    script_config_names=[config_names[i] for i in indices],
+                    script_config_hashes=[hashes[i] for i in indices],
+                    script_config_indices=indices,
+                ),
+                run_name=run_name,
+                dry_run=dry_run,
+            )
+        else:
+            job = dotdict(
+                name=self.job_name(run_name),
+                output="",
+                id=None,
+                config_names=[],
+                offset=0,
+                size=0,
+                indices=[],
+                run_name=run_name,
+            )
+        job.skipped = skipped
 
         return job
 
@@ -260,9 +1361,23 @@ class Runner:
 
         Args:
             command (str): The command to be executed.
+            stdin (str, optional): If provided, written to the standard input of the command, for inputs too large for the command line.
+
+        Returns:
+            A tuple containing the stdout, stderr, and exit code of the executed command. The outputs are bytes, or binary file-like objects for the `SSHRunner`, see `read_output()`.
+        """
+        pass
+
+    def exec_stream(self, cmd, timeout=None):
+        """
+        Executes the specified command in the target environment of the runner, streaming its output as it is produced.
+
+        Args:
+            cmd (str): The command to be executed.
+            timeout (float, optional): If provided, the command is killed after this many seconds.
 
         Returns:
-            A tuple containing the stdout, stderr, and exit code of the executed command.
+            An `ExecStream` yielding `(stream, line)` tuples, with the exit code in its `exitcode` attribute once consumed.
         """
         pass
 
@@ -302,6 +1417,8 @@ class SSHRunner(Runner):
         *args,
         auth: SSHAuth = None,
         auth_kwargs: dict = {},
+        pool: SSHConnectionPool = ssh_pool,
+        uploader="rsync",
         **kwargs,
     ):
         """
@@ -312,6 +1429,8 @@ class SSHRunner(Runner):
             *args: Positional arguments passed to the parent `Runner` class.
             auth (SSHAuth, optional): The authentication method to use. If not provided, `auth_kwargs` must be specified.
             auth_kwargs (dict, optional): The arguments to pass to the authentication method. If `auth` is provided, this argument is ignored.
+            pool (SSHConnectionPool, optional): The pool the SSH connection is shared through, runners targeting the same host share the same connection. If None, the runner uses a connection of its own.
+            uploader (str or Uploader, optional): The uploader used to synchronize the context, see `MySSHClient.put_dir()`.
             **kwargs: Keyword arguments passed to the parent `Runner` class.
         """
         super().__init__(*args, **kwargs)
@@ -322,17 +1441,20 @@ class SSHRunner(Runner):
         else:
             raise ValueError("No authentication method provided")
 
-        self.ssh_client = MySSHClient(self.auth)
+        self.host = self.auth.hostname
+        self.uploader = uploader
+        self.pool = pool
+        if self.pool is not None:
+            self.ssh_client = self.pool.get(self.auth)
+        else:
+            self.ssh_client = MySSHClient(self.auth)
 
         self.experiment_rundir = os.path.join(remote_workdir, self.experiment_name)
 
         self.add_context(self.experiment_dir, self.experiment_rundir)
 
     def connect(self):
-        if (
-            self.ssh_client.get_transport() is None
-            or not self.ssh_client.get_transport().is_active()
-        ):
+        if not self.ssh_client.is_connected():
             print("Connecting to remote host")
             self.ssh_client.connect()
         else:
@@ -342,23 +1464,58 @@ class SSHRunner(Runner):
         print("Uploading context to remote host")
         for local_path, remote_path in self.context:
             print(f"Uploading {local_path} to {remote_path}")
-            self.ssh_client.upload(
-                local_path, remote_path, blacklist=self.context_blacklist
+            self.ssh_client.put_dir(
+                local_path,
+                remote_path,
+                blacklist=self.sync_blacklist(local_path),
+                uploader=self.uploader,
             )
 
-    def exec(self, cmd, shell="bash -c", environment={}):
-        environment = self.environment.update(environment)
+    def command(self, cmd, shell="bash -c", environment={}):
+        """Returns the command wrapped in the shell, with the environment variables exported"""
+        environment = {**self.environment, **environment}
         environment = " ".join([f"{k}={v}" for k, v in environment.items()])
         if environment:
             environment = f"export {environment};"
 
-        cmd = f"{shell} '{environment} {cmd}'"
+        return f"{shell} {shlex.quote(f'{environment} {cmd}')}"
 
-        _, stdout, stderr = self.ssh_client.exec_command(cmd)
+    def exec(self, cmd, shell="bash -c", environment={}, stdin=None):
+        # Drain stdout and stderr while the command runs, waiting for the exit status first stalls once the channel window is full
+        stream = self.exec_stream(
+            cmd, shell=shell, environment=environment, stdin=stdin
+        )
+        output = {"stdout": io.BytesIO(), "stderr": io.BytesIO()}
+        for name, line in stream:
+            output[name].write(f"{line}\n".encode("utf-8"))
 
-        exitcode = stdout.channel.recv_exit_status()
+        for f in output.values():
+            f.seek(0)
 
-        return stdout, stderr, exitcode
+        return output["stdout"], output["stderr"], stream.exitcode
+
+    def exec_stream(
+        self, cmd, shell="bash -c", environment={}, timeout=None, stdin=None
+    ):
+        """
+        Executes the command on the remote host, streaming its output line by line.
+
+        Returns:
+            An `ExecStream` yielding `(stream, line)` tuples.
+        """
+        channel = self.ssh_client.exec_channel(
+            self.command(cmd, shell=shell, environment=environment)
+        )
+        if stdin is not None:
+            channel.sendall(stdin.encode("utf-8"))
+            channel.shutdown_write()
+
+        return SSHExecStream(channel, timeout=timeout)
+
+    def download(self, files, local_dir):
+        RSYNCUploader(self.auth, pool=self.pool).download(
+            self.experiment_rundir, local_dir, files
+        )
 
     def run_before(self):
         # Initialize ssh connection
@@ -383,17 +1540,347 @@ class LocalRunner(Runner):
     def del_context(self, path):
         self.context_blacklist.append(path)
 
-    def exec(self, cmd, environment={}):
-        environment = self.environment.update(environment)
+    def download(self, files, local_dir):
+        if os.path.abspath(local_dir) == os.path.abspath(self.experiment_rundir):
+            return
+        for path in files:
+            target = os.path.join(local_dir, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(self.experiment_rundir, path), target)
+
+    def exec(self, cmd, environment={}, stdin=None):
+        environment = {**os.environ, **self.environment, **environment}
 
         process = subprocess.Popen(
             cmd,
             shell=True,
             env=environment,
+            stdin=subprocess.PIPE if stdin is not None else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
-        stdout, stderr = process.communicate()
+        stdout, stderr = process.communicate(
+            stdin.encode("utf-8") if stdin is not None else None
+        )
         exitcode = process.wait()
 
         return stdout, stderr, exitcode
+
+    def exec_stream(self, cmd, environment={}, timeout=None):
+        """
+        Executes the command on the local host, streaming its output line by line.
+
+        Returns:
+            An `ExecStream` yielding `(stream, line)` tuples.
+        """
+        environment = {**os.environ, **self.environment, **environment}
+
+        process = subprocess.Popen(
+            cmd,
+            shell=True,
+            env=environment,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        return LocalExecStream(process, timeout=timeout)
+
+    def run_pool(
+        self,
+        script,
+        script_configs,
+        script_config_names=None,
+        subexperiment_name=None,
+        max_workers=None,
+        worker_gpus=None,
+        cpus_per_worker=None,
+        callback=None,
+    ):
+        """
+        Runs the configs on the local host with a pool of worker processes, and waits for them to complete.
+
+        As in `job.bash.j2`, the output of each config is written to `runs/{subexperiment_name}/{config_name}/out.log` in the experiment directory.
+
+        Args:
+            script (str): The command to run, the config is appended to it.
+            script_configs (list): The configs, typically command line arguments.
+            script_config_names (list, optional): The names of the configs. If not provided, the index of each config is used as its name.
+            subexperiment_name (str, optional): The name of the subexperiment, used in the log directories.
+            max_workers (int, optional): The number of configs run at the same time. If not provided, one per GPU in `worker_gpus`, or one per CPU.
+            worker_gpus (list, optional): The GPU ids, worker slot `i` runs its configs with `CUDA_VISIBLE_DEVICES=worker_gpus[i % len(worker_gpus)]`, so that slots share the GPUs round-robin when `max_workers` is larger.
+            cpus_per_worker (int, optional): If provided, worker slot `i` is pinned with taskset to the CPUs `[i * cpus_per_worker, (i + 1) * cpus_per_worker)`.
+            callback (callable, optional): Called as `callback(idx, config_name, exitcode)` when each config completes.
+
+        Returns:
+            The list of the exit codes of the configs.
+        """
+        if script_config_names is None:
+            script_config_names = [str(i) for i in range(len(script_configs))]
+        if max_workers is None:
+            max_workers = len(worker_gpus) if worker_gpus else os.cpu_count()
+
+        # Free worker slots, each slot has its own GPU and CPUs
+        slots = queue.Queue()
+        for slot in range(max_workers):
+            slots.put(slot)
+
+        lock = threading.Lock()
+        exitcodes = [None] * len(script_configs)
+
+        def run_config(idx):
+            config_name = script_config_names[idx]
+            logdir = os.path.join(
+                self.experiment_dir,
+                *filter(None, ["runs", subexperiment_name, config_name]),
+            )
+            os.makedirs(logdir, exist_ok=True)
+
+            command = f"{script} {script_configs[idx]}"
+
+            slot = slots.get()
+            try:
+                environment = {**os.environ, **self.environment}
+                if worker_gpus:
+                    gpu = worker_gpus[slot % len(worker_gpus)]
+                    environment["CUDA_VISIBLE_DEVICES"] = str(gpu)
+                if cpus_per_worker:
+                    first_cpu = slot * cpus_per_worker
+                    last_cpu = first_cpu + cpus_per_worker - 1
+                    command = f"taskset -c {first_cpu}-{last_cpu} {command}"
+
+                with open(os.path.join(logdir, "out.log"), "ab") as log:
+                    exitcode = subprocess.call(
+                        command,
+                        shell=True,
+                        cwd=self.experiment_dir,
+                        env=environment,
+                        stdout=log,
+                        stderr=subprocess.STDOUT,
+                    )
+            finally:
+                slots.put(slot)
+
+            with lock:
+                exitcodes[idx] = exitcode
+                done = sum(code is not None for code in exitcodes)
+                print(f"[{done}/{len(exitcodes)}] {config_name}: exit code {exitcode}")
+                if callback is not None:
+                    callback(idx, config_name, exitcode)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [
+                executor.submit(run_config, idx) for idx in range(len(script_configs))
+            ]:
+                future.result()
+
+        return exitcodes
+
+
+class AsyncRunner:
+    """
+    asyncio front-end for a runner.
+
+    The blocking calls of the wrapped runner are run in a thread pool, so that a single event loop can drive submissions, polling and uploads on several runners (and clusters) concurrently, e.g. `await asyncio.gather(a.run(...), b.run(...))`.
+    """
+
+    def __init__(self, runner: Runner, executor=None):
+        """
+        Args:
+            runner (Runner): The wrapped runner.
+            executor (concurrent.futures.Executor, optional): The executor the blocking calls are run in. If not provided, the default executor of the event loop is used.
+        """
+        self.runner = runner
+        self.executor = executor
+        self.connect_lock = None
+
+    async def call(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) in the executor and returns its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def connect(self):
+        connect = getattr(self.runner, "connect", None)
+        if connect is None:
+            return
+        # Concurrent tasks must not open several connections
+        if self.connect_lock is None:
+            self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            await self.call(connect)
+
+    async def exec(self, cmd, **kwargs):
+        return await self.call(self.runner.exec, cmd, **kwargs)
+
+    async def exec_stream(self, cmd, **kwargs):
+        """Asynchronously yields the `(stream, line)` tuples of the output of the command"""
+        stream = await self.call(self.runner.exec_stream, cmd, **kwargs)
+        lines = iter(stream)
+        try:
+            while True:
+                line = await self.call(next, lines, None)
+                if line is None:
+                    break
+                yield line
+        finally:
+            stream.cancel()
+
+    async def sync_context(self):
+        await self.connect()
+        return await self.call(self.runner.sync_context)
+
+    async def run(self, template, template_args={}, run_name=None, **kwargs):
+        await self.connect()
+        return await self.call(
+            self.runner.run, template, template_args, run_name, **kwargs
+        )
+
+    async def run_many(self, runs, **kwargs):
+        await self.connect()
+        return await self.call(self.runner.run_many, runs, **kwargs)
+
+
+class FanOutJob(ShardedJob):
+    """
+    A sweep split across several clusters, each shard has the `cluster` it was submitted to.
+    """
+
+    def locate(self, grid_idx):
+        """
+        Returns the cluster, job id and array task id running the config with the given index in the sweep.
+        """
+        shard, array_idx = super().locate(grid_idx)
+        return shard.cluster, shard.id, array_idx
+
+
+class FanOutRunner:
+    """
+    Runs a sweep across several runners, typically one per cluster.
+
+    The configs are split in contiguous shards proportional to the capacity of each runner, which is its weight, optionally divided by its current queue depth. The shards are submitted (and the contexts synchronized) in parallel.
+    """
+
+    def __init__(self, runners: dict, weights: dict = None, use_queue_depth=False):
+        """
+        Args:
+            runners (dict): Maps cluster names to runners.
+            weights (dict, optional): Maps cluster names to capacity weights, e.g. the number of GPUs available on each cluster. If not provided, all clusters have the same weight.
+            use_queue_depth (bool, optional): If True, the weights are divided by `1 + ` the number of jobs and array tasks of the user already queued on each cluster, see `queue_depth()`.
+        """
+        self.runners = runners
+        self.weights = weights or {name: 1 for name in runners}
+        self.use_queue_depth = use_queue_depth
+
+    def queue_depth(self, name):
+        """
+        Returns the number of jobs and array tasks of the user in the queue of the cluster.
+
+        The queue is read from the `QueuePoller` of the runner, so that the fan-out shares the `squeue` query of the other consumers of the queue.
+        """
+        depth = 0
+        for row in self.runners[name].queue_poller.jobs():
+            # Pending array tasks are grouped in a single row, e.g. 123_[0-99%10]
+            _, _, task_spec = row.job_id.partition("_")
+            depth += len(parse_array_range(task_spec)) if "[" in task_spec else 1
+        return depth
+
+    def capacities(self):
+        capacities = dict(self.weights)
+        if self.use_queue_depth:
+            with ThreadPoolExecutor(max_workers=len(self.runners)) as executor:
+                depths = dict(
+                    zip(self.runners, executor.map(self.queue_depth, self.runners))
+                )
+            for name in capacities:
+                capacities[name] /= 1 + depths[name]
+        return capacities
+
+    def partition(self, n_configs):
+        """
+        Splits `range(n_configs)` in contiguous shards proportional to the capacities.
+
+        Returns:
+            A list of `(name, start, stop)` tuples, clusters without configs are left out.
+        """
+        capacities = self.capacities()
+        total = sum(capacities.values())
+        quotas = {name: n_configs * c / total for name, c in capacities.items()}
+
+        # Largest remainder method
+        sizes = {name: int(q) for name, q in quotas.items()}
+        remainders = sorted(
+            quotas, key=lambda name: quotas[name] - sizes[name], reverse=True
+        )
+        for name in remainders[: n_configs - sum(sizes.values())]:
+            sizes[name] += 1
+
+        shards, start = [], 0
+        for name in self.runners:
+            if sizes[name]:
+                shards.append((name, start, start + sizes[name]))
+                start += sizes[name]
+        return shards
+
+    def sync_context(self):
+        with ThreadPoolExecutor(max_workers=len(self.runners)) as executor:
+            for future in [
+                executor.submit(runner.sync_context) for runner in self.runners.values()
+            ]:
+                future.result()
+
+    def run(self, template, template_args={}, run_name=None, dry_run=False):
+        """
+        Runs the sweep in `template_args["script_configs"]` across the clusters.
+
+        Each shard is submitted with the run name `{run_name}-{cluster}`, so that runners sharing the same experiment directory do not overwrite each other's launch files and config tables.
+
+        Returns:
+            A `FanOutJob` mapping the index of each config in the sweep to its cluster, job id and array task id.
+        """
+        configs = template_args["script_configs"]
+        config_names = template_args.get("script_config_names", None)
+
+        def run_shard(name, start, stop):
+            shard_args = dict(
+                template_args,
+                script_configs=configs[start:stop],
+                array_offset=start,
+            )
+            if config_names is not None:
+                shard_args["script_config_names"] = config_names[start:stop]
+            job = self.runners[name].run(
+                template,
+                shard_args,
+                "-".join(filter(None, [run_name, name])),
+                dry_run=dry_run,
+            )
+            job.cluster = name
+            return job
+
+        shards = self.partition(len(configs))
+        with ThreadPoolExecutor(max_workers=len(shards) or 1) as executor:
+            futures = [executor.submit(run_shard, *shard) for shard in shards]
+            jobs = [future.result() for future in futures]
+
+        return FanOutJob(name=run_name, shards=jobs, size=len(configs))
+
+    def cancel_job(self, job: FanOutJob, indices=None, state=None):
+        """
+        Cancels a job returned by `run()`, with one `Runner.cancel()` call per cluster, in parallel.
+        """
+        job_ids = {}
+        if indices is None:
+            for shard in job.shards:
+                job_ids.setdefault(shard.cluster, []).append(shard.id)
+        else:
+            for idx in indices:
+                cluster, job_id, task_id = job.locate(idx)
+                job_ids.setdefault(cluster, []).append(f"{job_id}_{task_id}")
+
+        with ThreadPoolExecutor(max_workers=len(job_ids) or 1) as executor:
+            futures = {
+                cluster: executor.submit(self.runners[cluster].cancel, ids, state)
+                for cluster, ids in job_ids.items()
+            }
+            return {cluster: future.result() for cluster, future in futures.items()}
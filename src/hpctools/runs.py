@@ -0,0 +1,164 @@
+import os
+import re
+import shlex
+import fnmatch
+import hashlib
+
+# Layout of the runs in the experiment run directory: each config runs in `runs/{subexperiment_name}/{config_name}`, which holds its `out.log` and its `exit_code` completion marker
+RUN_LOG_FILENAME = "out.log"
+COLLECT_STATE_FILENAME = ".hpctools-collect.json"
+# Directory, relative to the experiment run directory, where the completed configs are recorded by hash
+RUN_CACHE_DIR = os.path.join(".hpctools", "cache")
+
+
+def list_runs_command(runs_dir="runs"):
+    """Returns the command listing the path, size and mtime of every file of the runs"""
+    return (
+        f"[ -d {runs_dir} ] && find {runs_dir} -type f -printf '%p\\t%s\\t%T@\\n'"
+    )
+
+
+def group_run_files(listing):
+    """
+    Groups the files listed by `list_runs_command()` by run, a run is a directory containing an `out.log` file.
+
+    Returns:
+        A dictionary mapping each run directory to a list of `(path, size, mtime)` tuples, `path` is relative to the run directory.
+    """
+    files = []
+    for line in listing.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 3:
+            files.append((fields[0], int(fields[1]), float(fields[2])))
+
+    run_dirs = {
+        os.path.dirname(path)
+        for path, _, _ in files
+        if os.path.basename(path) == RUN_LOG_FILENAME
+    }
+    runs = {run_dir: [] for run_dir in run_dirs}
+    for path, size, mtime in files:
+        # Files in subdirectories of a run belong to the run
+        run_dir = os.path.dirname(path)
+        while run_dir and run_dir not in run_dirs:
+            run_dir = os.path.dirname(run_dir)
+        if run_dir:
+            runs[run_dir].append((os.path.relpath(path, run_dir), size, mtime))
+    return runs
+
+
+def filter_run_files(files, include=None, exclude=None):
+    """
+    Returns the files matching any of the `include` glob patterns and none of the `exclude` patterns, patterns are matched against the path relative to the run directory and against the file name.
+    """
+
+    def match(path, patterns):
+        return any(
+            fnmatch.fnmatch(path, pattern)
+            or fnmatch.fnmatch(os.path.basename(path), pattern)
+            for pattern in patterns
+        )
+
+    return [
+        file
+        for file in files
+        if (include is None or match(file[0], include))
+        and not (exclude and match(file[0], exclude))
+    ]
+
+
+# Suffix added by the launch templates to the run directory of a config when it exists already
+RUN_DIR_SUFFIX_PATTERN = re.compile(r"-[A-Za-z0-9]{5}")
+
+
+def run_markers_command(runs_dirs=("runs",)):
+    """
+    Returns the command printing the `GRID_INDEX` line of the log and the `exit_code` completion marker of the runs directly under the given directories, with two `find` calls.
+    """
+    runs_dirs = " ".join(shlex.quote(runs_dir) for runs_dir in runs_dirs)
+    return (
+        f"find {runs_dirs} -maxdepth 2 -name {RUN_LOG_FILENAME} -type f "
+        f"-exec grep -H -m 1 '^GRID_INDEX: ' {{}} + 2> /dev/null; "
+        f"find {runs_dirs} -maxdepth 2 -name exit_code -type f "
+        f"-exec grep -H '' {{}} + 2> /dev/null"
+    )
+
+
+def parse_run_markers(output):
+    """
+    Parses the output of `run_markers_command()`.
+
+    Returns:
+        A dictionary mapping each completed run directory to its index in the sweep and its exit code.
+    """
+    indices, exit_codes = {}, {}
+    for line in output.splitlines():
+        path, sep, grid_idx = line.partition(":GRID_INDEX: ")
+        if sep:
+            indices[os.path.normpath(os.path.dirname(path))] = int(grid_idx)
+            continue
+        path, _, exit_code = line.rpartition(":")
+        if path and exit_code.strip().isdigit():
+            exit_codes[os.path.normpath(os.path.dirname(path))] = int(exit_code)
+
+    return {
+        run_dir: (indices[run_dir], exit_code)
+        for run_dir, exit_code in exit_codes.items()
+        if run_dir in indices
+    }
+
+
+def run_config_names(run_dir):
+    """Returns the directory containing a run and the config names the run may belong to, its name with and without the suffix added by the launch templates"""
+    runs_dir, name = os.path.split(os.path.normpath(run_dir))
+    names = [name]
+    if RUN_DIR_SUFFIX_PATTERN.fullmatch(name[-6:]):
+        names.append(name[:-6])
+    return runs_dir, names
+
+
+def run_dirs_root(job):
+    """Returns the directory of the run directories of a job, `runs/{subexperiment_name}`"""
+    return os.path.normpath(os.path.join("runs", job.subexperiment_name or ""))
+
+
+def local_run_files(run_dir):
+    """Returns the name, size and mtime of the files of a local run directory, without recursing"""
+    files = []
+    for entry in os.scandir(run_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((entry.name, stat.st_size, stat.st_mtime))
+    return files
+
+
+def run_fingerprint(files):
+    """Returns a fingerprint of the size and mtime of the files of a run, as listed by `group_run_files()` or `local_run_files()`"""
+    h = hashlib.sha1()
+    for path, size, mtime in sorted(files):
+        h.update(f"{path}\t{size}\t{mtime}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def run_cache_command(cache_dir=RUN_CACHE_DIR):
+    """Returns the command listing the hash and the run directory of every completed config whose run directory still exists"""
+    return (
+        f"for f in {cache_dir}/*; do "
+        'read -r logdir < "$f" 2> /dev/null && [ -d "$logdir" ] '
+        "&& printf '%s\\t%s\\n' \"${f##*/}\" \"$logdir\"; done"
+    )
+
+
+def parse_run_cache(output):
+    """
+    Parses the output of `run_cache_command()`.
+
+    Returns:
+        A dictionary mapping the hash of each completed config to its run directory.
+    """
+    cache = {}
+    for line in output.splitlines():
+        config_hash, _, run_dir = line.partition("\t")
+        if run_dir:
+            cache[config_hash] = os.path.normpath(run_dir)
+    return cache
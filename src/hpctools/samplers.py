@@ -0,0 +1,251 @@
+import random
+from .utils import GridConfig, idx_to_name
+
+
+class GridSample:
+    """
+    A subset of the grid indices of a `GridConfig`, configurations and names are decoded lazily.
+
+    The indices must be valid configurations of the grid, see `GridConfig.is_valid()`.
+    """
+
+    def __init__(self, grid: GridConfig, indices: list, names: list = None):
+        """
+        Args:
+            grid (GridConfig): The sampled grid.
+            indices (list): The sampled grid indices.
+            names (list, optional): The configuration names, in the format accepted by `flatten_names()`. If not provided, `grid.config_names` is used.
+        """
+        invalid = [idx for idx in indices if not grid.is_valid(idx)]
+        if invalid:
+            raise ValueError(
+                f"Grid indices {invalid[:10]} do not satisfy the constraints"
+            )
+
+        self.grid = grid
+        self.indices = indices
+        self.names = names if names is not None else grid.config_names
+
+    def configs(self, **kwargs):
+        """Lazily yields the sampled configurations, `kwargs` are passed to `GridConfig.get_config()`"""
+        for idx in self.indices:
+            yield self.grid.get_config(idx, **kwargs)
+
+    def config_names(self, join="_"):
+        """Lazily yields the names of the sampled configurations"""
+        if self.names is None:
+            raise ValueError("No configuration names provided")
+        for idx in self.indices:
+            yield idx_to_name(self.names, idx, join=join)
+
+    def __iter__(self):
+        return self.configs()
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def list_dimensions(grid: GridConfig):
+    """Returns the (key, size) of the list valued dimensions of the grid"""
+    return [
+        (k, dim_size)
+        for k, dim_size in zip(grid.config.keys(), grid.get_dimenstions())
+        if isinstance(grid.config[k], list)
+    ]
+
+
+def is_constrained(grid: GridConfig):
+    """Returns True if some configurations of the grid may be invalid"""
+    return bool(grid.constraints or grid.conditions)
+
+
+def unique(indices, n):
+    """Removes duplicated indices, keeping the first n"""
+    return list(dict.fromkeys(indices))[:n]
+
+
+def sample_valid(grid: GridConfig, n, rng):
+    """
+    Samples n distinct valid grid indices uniformly at random.
+
+    Random grid indices are drawn and the invalid ones rejected, unless most of the grid is invalid or most of the valid configurations are requested, in which case the valid indices are enumerated and sampled from directly.
+    """
+    if not is_constrained(grid):
+        return rng.sample(range(grid.size()), min(n, grid.size()))
+
+    n_valid = grid.count_valid()
+    n = min(n, n_valid)
+    if 2 * n >= n_valid or grid.size() > 100 * n_valid:
+        return rng.sample(list(grid.valid_indices()), n)
+
+    indices = {}
+    while len(indices) < n:
+        idx = rng.randrange(grid.size())
+        if idx not in indices and grid.is_valid(idx):
+            indices[idx] = None
+    return list(indices)
+
+
+def points_to_indices(grid: GridConfig, points):
+    """Maps points of the unit hypercube, one coordinate per dimension, to grid indices"""
+    dims = list_dimensions(grid)
+    return [
+        grid.dim_ids_to_idx(
+            {
+                k: min(int(u * dim_size), dim_size - 1)
+                for (k, dim_size), u in zip(dims, point)
+            }
+        )
+        for point in points
+    ]
+
+
+def sample_uniform(grid: GridConfig, n, seed=None, names=None):
+    """
+    Samples n distinct configurations uniformly at random.
+
+    Args:
+        grid (GridConfig): The grid to sample from.
+        n (int): The number of configurations, at most `len(grid)`, the number of valid configurations.
+        seed (int, optional): The random seed.
+        names (list, optional): The configuration names, see `GridSample`.
+    """
+    rng = random.Random(seed)
+    return GridSample(grid, sample_valid(grid, n, rng), names)
+
+
+def sample_latin_hypercube(grid: GridConfig, n, seed=None, names=None):
+    """
+    Samples up to n configurations with a Latin hypercube design: each dimension is split in n strata, and every stratum is hit exactly once.
+
+    Points that fall in the same grid cell are returned once, so fewer than n configurations are returned when dimensions are smaller than n. Points that fall on invalid configurations are rejected, and new designs are drawn (up to 100) until n valid configurations are found.
+    """
+    rng = random.Random(seed)
+    n = min(n, len(grid))
+    dims = list_dimensions(grid)
+
+    def design():
+        columns = []
+        for _ in dims:
+            strata = list(range(n))
+            rng.shuffle(strata)
+            columns.append([(s + rng.random()) / n for s in strata])
+        return zip(*columns) if columns else [()] * n
+
+    if not is_constrained(grid):
+        return GridSample(grid, unique(points_to_indices(grid, design()), n), names)
+
+    indices = {}
+    for _ in range(100):
+        for idx in points_to_indices(grid, design()):
+            if len(indices) < n and grid.is_valid(idx):
+                indices[idx] = None
+        if len(indices) == n:
+            break
+    return GridSample(grid, list(indices), names)
+
+
+def first_primes(n):
+    """Returns the first n prime numbers, used as bases of the Halton sequence"""
+    primes = []
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def radical_inverse(i, base):
+    inverse, f = 0.0, 1.0 / base
+    while i > 0:
+        inverse += f * (i % base)
+        i //= base
+        f /= base
+    return inverse
+
+
+def sample_halton(grid: GridConfig, n, seed=None, names=None, skip=1):
+    """
+    Samples up to n configurations along a Halton low-discrepancy sequence, which covers the grid more evenly than random sampling.
+
+    Points are drawn until n distinct valid configurations are found or the grid is exhausted, points that fall on invalid configurations are skipped.
+
+    Args:
+        grid (GridConfig): The grid to sample from.
+        n (int): The number of configurations.
+        seed (int, optional): If provided, the sequence is randomized with a random shift modulo 1.
+        names (list, optional): The configuration names, see `GridSample`.
+        skip (int, optional): The number of initial elements of the sequence to skip.
+    """
+    dims = list_dimensions(grid)
+    bases = first_primes(len(dims))
+
+    rng = random.Random(seed)
+    shift = [rng.random() if seed is not None else 0.0 for _ in dims]
+
+    n_valid = len(grid)
+    n = min(n, n_valid)
+    indices = {}
+    i = skip
+    # Bounded number of draws, in case the grid has very unbalanced dimensions or few valid configurations
+    max_draws = 100 * n * grid.size() // max(n_valid, 1)
+    while len(indices) < n and i < skip + max_draws:
+        point = [
+            (radical_inverse(i, base) + s) % 1.0 for base, s in zip(bases, shift)
+        ]
+        idx = points_to_indices(grid, [point])[0]
+        if grid.is_valid(idx):
+            indices[idx] = None
+        i += 1
+    return GridSample(grid, list(indices), names)
+
+
+def sample_stratified(grid: GridConfig, n, key, seed=None, names=None):
+    """
+    Samples n configurations uniformly at random, evenly split across the values of the `key` dimension.
+
+    Only valid configurations are sampled, a value with fewer valid configurations than its share gets all of them.
+
+    Args:
+        grid (GridConfig): The grid to sample from.
+        n (int): The number of configurations.
+        key: The key of the dimension to stratify by.
+        seed (int, optional): The random seed.
+        names (list, optional): The configuration names, see `GridSample`.
+    """
+    dims = dict(list_dimensions(grid))
+    if key not in dims:
+        raise ValueError(f"{key} is not a dimension of the grid")
+
+    rng = random.Random(seed)
+    dim_size = dims[key]
+    stride = 1
+    for k, size in zip(grid.config.keys(), grid.get_dimenstions()):
+        if k == key:
+            break
+        stride *= size
+    stratum_size = grid.size() // dim_size
+
+    strata = None
+    if is_constrained(grid):
+        strata = [[] for _ in range(dim_size)]
+        for idx in grid.valid_indices():
+            strata[(idx // stride) % dim_size].append(idx)
+
+    indices = []
+    for value in range(dim_size):
+        # Spread the remainder over the first strata
+        n_value = n // dim_size + (value < n % dim_size)
+        if strata is not None:
+            indices.extend(
+                rng.sample(strata[value], min(n_value, len(strata[value])))
+            )
+            continue
+        for j in rng.sample(range(stratum_size), min(n_value, stratum_size)):
+            # Insert the stratum value as the digit of the key dimension
+            indices.append(
+                (j // stride) * stride * dim_size + value * stride + j % stride
+            )
+    rng.shuffle(indices)
+    return GridSample(grid, indices, names)
@@ -1,5 +1,14 @@
 import os
 import abc
+import json
+import time
+import shlex
+import tarfile
+import hashlib
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import paramiko
 from . import auths as a
@@ -54,26 +63,436 @@ class SFTPUploader(Uploader, paramiko.SFTPClient):
                 raise
 
 
+class ParallelSFTPUploader(Uploader):
+    """
+    Uploads files over several SFTP channels opened on the same SSH transport, hiding the round-trip latency of small files.
+    """
+
+    def __init__(self, transport: paramiko.Transport, workers=8, retries=3):
+        """
+        Args:
+            transport (paramiko.Transport): The SSH transport the SFTP channels are opened on.
+            workers (int, optional): The number of SFTP channels, and so the maximum number of files uploaded concurrently.
+            retries (int, optional): How many times the upload of a single file is retried before giving up.
+        """
+        super().__init__()
+
+        self.transport = transport
+        self.workers = workers
+        self.retries = retries
+        self.channels = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def channel(self, reopen=False):
+        """Returns the SFTP channel of the current thread"""
+        sftp = getattr(self.local, "sftp", None)
+        if sftp is None or reopen:
+            sftp = SFTPUploader.from_transport(self.transport)
+            self.local.sftp = sftp
+            with self.lock:
+                self.channels.append(sftp)
+        return sftp
+
+    def list_files(self, source, target, blacklist=[]):
+        """
+        Creates the directory tree under target and returns the (local, remote) paths of the files that are not up to date.
+        """
+        sftp = self.channel()
+        sftp.mkdir(target, ignore_existing=True)
+        attrs = {attr.filename: attr for attr in sftp.listdir_attr(target)}
+
+        files = []
+        for item in os.listdir(source):
+            item_path = os.path.join(source, item)
+            if item_path in blacklist:
+                continue
+            if os.path.isfile(item_path):
+                # Same mtime heuristic as SFTPUploader
+                if item not in attrs or attrs[item].st_mtime < os.path.getmtime(
+                    item_path
+                ):
+                    files.append((item_path, os.path.join(target, item)))
+            else:
+                files += self.list_files(
+                    item_path, os.path.join(target, item), blacklist
+                )
+        return files
+
+    def put(self, source, target):
+        """Uploads a single file, retrying on failure. Returns the number of bytes sent"""
+        for attempt in range(self.retries + 1):
+            try:
+                return self.channel(reopen=attempt > 0).put(source, target).st_size
+            except (IOError, paramiko.SSHException):
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.1 * 2**attempt)
+
+    def upload(self, source, target, blacklist=[]):
+        """
+        Uploads the contents of the source directory to the target path, spreading the files over the SFTP channels.
+
+        Returns:
+            A dictionary with the number of `files` and `bytes` uploaded, the elapsed `seconds` and the `throughput` in bytes per second.
+        """
+        start = time.time()
+        files = self.list_files(source, target, blacklist)
+
+        failed = []
+        n_bytes = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.put, local_path, remote_path): local_path
+                for local_path, remote_path in files
+            }
+            for future, local_path in futures.items():
+                try:
+                    n_bytes += future.result()
+                except (IOError, paramiko.SSHException) as e:
+                    failed.append((local_path, e))
+
+        seconds = time.time() - start
+        stats = {
+            "files": len(files) - len(failed),
+            "bytes": n_bytes,
+            "seconds": seconds,
+            "throughput": n_bytes / seconds if seconds > 0 else 0,
+        }
+        print(
+            f"Uploaded {stats['files']} files ({n_bytes / 2**20:.2f} MiB) in {seconds:.2f}s "
+            f"({stats['throughput'] / 2**20:.2f} MiB/s) over {self.workers} channels"
+        )
+
+        if failed:
+            raise IOError(
+                f"Failed to upload {len(failed)} files: "
+                + ", ".join(f"{path} ({e})" for path, e in failed)
+            )
+
+        return stats
+
+    def close(self):
+        for sftp in self.channels:
+            sftp.close()
+        self.channels = []
+        self.local = threading.local()
+
+
+# Name of the manifest file written in the target directory by ManifestSFTPUploader
+MANIFEST_FILENAME = ".hpctools-manifest.json"
+
+
+def file_hash(path, chunk_size=2**20):
+    """Returns the sha256 hex digest of the file content"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    Local cache of file content hashes, a file is hashed again only if its size or mtime changed.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): The json file where the cache is persisted. If not provided, the cache lives only in memory.
+        """
+        self.path = path
+        self.entries = {}
+        if self.path is not None and os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def hash(self, path):
+        stat = os.stat(path)
+        entry = self.entries.get(path, None)
+        if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime:
+            entry = [stat.st_size, stat.st_mtime, file_hash(path)]
+            self.entries[path] = entry
+        return entry[2]
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
+
+
+def build_manifest(source, blacklist=[], hash_cache=None):
+    """
+    Returns a dictionary mapping the path (relative to source) of every file in source to its content hash.
+    """
+    if hash_cache is None:
+        hash_cache = HashCache()
+
+    manifest = {}
+    for root, dirs, files in os.walk(source):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in blacklist]
+        for item in files:
+            item_path = os.path.join(root, item)
+            if item_path in blacklist or item == MANIFEST_FILENAME:
+                continue
+            manifest[os.path.relpath(item_path, source)] = hash_cache.hash(item_path)
+    return manifest
+
+
+class ManifestSFTPUploader(ParallelSFTPUploader):
+    """
+    Uploads only the files whose content changed since the last upload, and deletes the files that disappeared from source.
+
+    The hashes of the uploaded files are kept in a manifest file in the target directory. Comparing it with the local files (whose hashes are cached by size and mtime) tells what to upload, without listing the remote directories. The manifest holds the files of each source separately, so that several sources can be uploaded to the same target without deleting each other's files.
+    """
+
+    def __init__(self, transport, workers=8, retries=3, cache_dir="~/.cache/hpctools"):
+        """
+        Args:
+            transport (paramiko.Transport): The SSH transport the SFTP channels are opened on.
+            workers (int, optional): The number of SFTP channels, and so the maximum number of files uploaded concurrently.
+            retries (int, optional): How many times the upload of a single file is retried before giving up.
+            cache_dir (str, optional): The directory where the local hash cache is persisted. If None, hashes are cached in memory only.
+        """
+        super().__init__(transport, workers=workers, retries=retries)
+
+        if cache_dir is not None:
+            cache_dir = os.path.join(os.path.expanduser(cache_dir), "hashes.json")
+        self.hash_cache = HashCache(cache_dir)
+        self.manifest = None
+        self.remote_manifest = None
+        self.remote_manifests = None
+
+    def read_manifest(self, target):
+        """Returns the manifests stored in the target directory, by source, or an empty dictionary"""
+        try:
+            with self.channel().open(os.path.join(target, MANIFEST_FILENAME)) as f:
+                manifests = json.loads(f.read())
+        except IOError:
+            return {}
+        # Written before the manifest was kept by source, the files are uploaded again once
+        if any(isinstance(value, str) for value in manifests.values()):
+            return {}
+        return manifests
+
+    def write_manifest(self, target, manifest):
+        with self.channel().open(os.path.join(target, MANIFEST_FILENAME), "w") as f:
+            f.write(json.dumps(manifest))
+
+    def list_files(self, source, target, blacklist=[]):
+        self.manifest = build_manifest(source, blacklist, self.hash_cache)
+        self.hash_cache.save()
+        self.remote_manifests = self.read_manifest(target)
+        self.remote_manifest = remote_manifest = self.remote_manifests.get(
+            os.path.abspath(source), {}
+        )
+
+        changed = [
+            path
+            for path, digest in self.manifest.items()
+            if remote_manifest.get(path, None) != digest
+        ]
+        # Blacklisted files may have been uploaded before, they are left in place
+        stale = [
+            path
+            for path in remote_manifest
+            if path not in self.manifest
+            and not is_blacklisted(os.path.join(source, path), blacklist)
+        ]
+
+        sftp = self.channel()
+
+        # Create only the directories that did not hold any file in the last upload
+        remote_dirs = {os.path.dirname(path) for path in remote_manifest}
+        new_dirs = set()
+        for path in changed:
+            path = os.path.dirname(path)
+            while path not in remote_dirs and path not in new_dirs:
+                new_dirs.add(path)
+                path = os.path.dirname(path)
+        for path in sorted(new_dirs, key=len):
+            sftp.mkdir(os.path.join(target, path), ignore_existing=True)
+
+        for path in stale:
+            try:
+                sftp.remove(os.path.join(target, path))
+            except IOError:
+                pass
+
+        return [
+            (os.path.join(source, path), os.path.join(target, path)) for path in changed
+        ]
+
+    def upload(self, source, target, blacklist=[]):
+        """
+        Uploads the files of the source directory that differ from the target manifest, and removes the stale ones.
+
+        Returns:
+            A dictionary with the number of `files` and `bytes` uploaded, the elapsed `seconds` and the `throughput` in bytes per second.
+        """
+        stats = super().upload(source, target, blacklist)
+        if self.manifest != self.remote_manifest:
+            self.write_manifest(
+                target,
+                dict(self.remote_manifests, **{os.path.abspath(source): self.manifest}),
+            )
+        return stats
+
+
+class ChannelWriter:
+    """File-like wrapper writing to the stdin of a paramiko channel"""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, data):
+        self.channel.sendall(data)
+        return len(data)
+
+
+class TarUploader(Uploader):
+    """
+    Streams the source directory as a compressed tar archive into `tar -x` on the remote host.
+
+    The archive is produced on the fly and piped through a single SSH channel, without temporary archives on either end. This turns the per-file round trips of SFTP into one pipelined stream, which is much faster for trees of many small files.
+    """
+
+    # Remote tar decompression flag for each tarfile compression
+    COMPRESSION_FLAGS = {
+        "": "",
+        "gz": "z",
+        "bz2": "j",
+        "xz": "J",
+    }
+
+    def __init__(self, transport: paramiko.Transport, compression="gz"):
+        """
+        Args:
+            transport (paramiko.Transport): The SSH transport the channel is opened on.
+            compression (str, optional): One of "gz", "bz2", "xz", or "" for no compression.
+        """
+        super().__init__()
+
+        if compression not in self.COMPRESSION_FLAGS:
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        self.transport = transport
+        self.compression = compression
+
+    def upload(self, source, target, blacklist=[]):
+        """
+        Uploads the contents of the source directory to the target path. The target directory is created if it does not exist.
+        """
+        if os.path.isdir(source):
+            target_dir = target
+        else:
+            target_dir = os.path.dirname(target)
+
+        flag = self.COMPRESSION_FLAGS[self.compression]
+        channel = self.transport.open_session()
+        channel.exec_command(
+            f"mkdir -p {shlex.quote(target_dir)} && tar -x{flag}f - -C {shlex.quote(target_dir)}"
+        )
+
+        with tarfile.open(
+            fileobj=ChannelWriter(channel), mode=f"w|{self.compression}"
+        ) as tar:
+            if not os.path.isdir(source):
+                tar.add(source, arcname=os.path.basename(target))
+            for root, dirs, files in os.walk(source):
+                dirs[:] = [d for d in dirs if os.path.join(root, d) not in blacklist]
+                for item in dirs + files:
+                    item_path = os.path.join(root, item)
+                    if item_path in blacklist:
+                        continue
+                    tar.add(
+                        item_path,
+                        arcname=os.path.relpath(item_path, source),
+                        recursive=False,
+                    )
+        channel.shutdown_write()
+
+        exitcode = channel.recv_exit_status()
+        if exitcode != 0:
+            stderr = channel.makefile_stderr("rb").read().decode("utf-8")
+            raise IOError(f"Remote tar exited with code {exitcode}: {stderr}")
+
+
+def rsync_pattern(source, path):
+    """Returns the rsync exclude pattern of a blacklisted local path, paths under source are anchored to the root of the transfer"""
+    source = os.path.normpath(source)
+    if os.path.isabs(path) and path.startswith(source + os.path.sep):
+        return "/" + os.path.relpath(path, source)
+    return path
+
+
+def is_blacklisted(path, blacklist):
+    """Returns whether the path is in a blacklisted directory, or is blacklisted itself"""
+    return any(
+        path == item or path.startswith(item + os.path.sep) for item in blacklist
+    )
+
+
 class RSYNCUploader(Uploader):
-    def __init__(self, auth: a.SSHAuth):
+    def __init__(self, auth: a.SSHAuth, pool=None):
+        """
+        Args:
+            auth (SSHAuth): The authentication used by ssh.
+            pool (SSHConnectionPool, optional): If provided, ssh is multiplexed over the ControlMaster socket managed by the pool, so that subsequent uploads skip the connection and authentication handshake.
+        """
         super().__init__()
 
         self.auth = auth
+        self.pool = pool
 
-    def upload(self, source, target, blacklist=[]):
+    def ssh_command(self):
         ssh_command = f"ssh -p {self.auth.port}"
 
         if self.auth.key_filename is not None:
             ssh_command += f" -i {self.auth.key_filename}"
 
+        if self.pool is not None:
+            ssh_command += f" {self.pool.ssh_options(self.auth)}"
+
+        return ssh_command
+
+    def upload(self, source, target, blacklist=[]):
+        ssh_command = self.ssh_command()
+
         if os.path.isdir(source):
             source = os.path.normpath(source) + os.path.sep
 
-        exclude = " ".join([f"--exclude={item}" for item in blacklist])
+        exclude = " ".join(
+            [f"--exclude={rsync_pattern(source, item)}" for item in blacklist]
+        )
         cmd = f"rsync -avz {exclude} -e '{ssh_command}' {source} {self.auth.username}@{self.auth.hostname}:{target}"
         print(cmd)
 
         os.system(cmd)
 
-    def close(self):
-        self.ssh_client.close()
+    def download(self, source, target, files):
+        """
+        Downloads the given files of the remote `source` directory to the local `target` directory, with delta transfer and compression.
+
+        Args:
+            source (str): The remote directory.
+            target (str): The local directory.
+            files (list): The paths of the files to download, relative to `source`.
+        """
+        os.makedirs(target, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as files_from:
+            files_from.write("\n".join(files) + "\n")
+            files_from.flush()
+
+            cmd = (
+                f"rsync -az --files-from={shlex.quote(files_from.name)} "
+                f"-e '{self.ssh_command()}' "
+                f"{self.auth.username}@{self.auth.hostname}:{shlex.quote(source)}/ "
+                f"{shlex.quote(target)}"
+            )
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise IOError(f"rsync exited with code {result.returncode}: {result.stderr}")
@@ -1,8 +1,16 @@
 import paramiko
 import os
+import inspect
+import threading
 from paramiko.config import SSH_PORT
-from functools import reduce
-from .uploaders import Uploader, SFTPUploader, RSYNCUploader
+from .uploaders import (
+    Uploader,
+    SFTPUploader,
+    ParallelSFTPUploader,
+    ManifestSFTPUploader,
+    TarUploader,
+    RSYNCUploader,
+)
 from .auths import *
 
 
@@ -17,94 +25,397 @@ class dotdict(dict):
 
 
 class MySSHClient(paramiko.SSHClient):
-    def __init__(self, auth: SSHAuth):
+    def __init__(self, auth: SSHAuth, keepalive=0, pool=None):
         super().__init__()
 
         self.auth = auth
+        self.keepalive = keepalive
+        self.pool = pool
+        # The client is shared by the runners and threads of the pool, only one of them (re)connects
+        self.connect_lock = threading.Lock()
 
         self.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
     def connect(self):
-        super().connect(**self.auth.to_paramiko())
+        """Connects to the host, unless another thread connected it meanwhile"""
+        with self.connect_lock:
+            if self.is_connected():
+                return
+            # Release the dropped transport before it is replaced
+            transport = self.get_transport()
+            if transport is not None:
+                transport.close()
+            super().connect(**self.auth.to_paramiko())
+            if self.keepalive:
+                self.get_transport().set_keepalive(self.keepalive)
+
+    def is_connected(self):
+        transport = self.get_transport()
+        return transport is not None and transport.is_active()
+
+    def reconnecting(self, func, *args, **kwargs):
+        """Calls `func`, transparently reconnecting (and calling it again) if the connection was dropped"""
+        if not self.is_connected():
+            self.connect()
+        try:
+            return func(*args, **kwargs)
+        except (paramiko.SSHException, EOFError, OSError):
+            if self.is_connected():
+                raise
+            self.connect()
+            return func(*args, **kwargs)
+
+    def exec_command(self, *args, **kwargs):
+        """Augments exec_command by transparently reconnecting if the connection was dropped"""
+        return self.reconnecting(super().exec_command, *args, **kwargs)
+
+    def exec_channel(self, command):
+        """
+        Opens a session and starts the command on it, reconnecting as `exec_command()` does.
+
+        Returns:
+            The paramiko channel of the command, for callers that read its output as it is produced.
+        """
+
+        def open_channel():
+            channel = self.get_transport().open_session()
+            channel.exec_command(command)
+            return channel
+
+        return self.reconnecting(open_channel)
 
     def mkdir(self, path):
         self.exec_command(f"mkdir -p {path}")
 
     def put_dir(self, source, target, blacklist=[], uploader="rsync"):
+        """
+        Uploads the source directory to the target path on the remote host.
+
+        Args:
+            source (str): The local directory.
+            target (str): The remote directory.
+            blacklist (list, optional): Local paths to be skipped.
+            uploader (str or Uploader, optional): One of "rsync", "sftp", "parallel-sftp", "manifest-sftp", "tar", or an `Uploader` instance.
+        """
         if uploader == "sftp":
-            SFTPUploader.from_transport(self.get_transport()).put_dir(
+            SFTPUploader.from_transport(self.get_transport()).upload(
                 source, target, blacklist
             )
+        elif uploader == "parallel-sftp":
+            with ParallelSFTPUploader(self.get_transport()) as parallel_uploader:
+                parallel_uploader.upload(source, target, blacklist)
+        elif uploader == "manifest-sftp":
+            with ManifestSFTPUploader(self.get_transport()) as manifest_uploader:
+                manifest_uploader.upload(source, target, blacklist)
+        elif uploader == "tar":
+            TarUploader(self.get_transport()).upload(source, target, blacklist)
         elif uploader == "rsync":
-            RSYNCUploader(self.auth).put_dir(source, target)
+            RSYNCUploader(self.auth, pool=self.pool).upload(source, target, blacklist)
         elif isinstance(uploader, Uploader):
-            uploader.put_dir(source, target, blacklist)
+            uploader.upload(source, target, blacklist)
+
+
+class Constraint:
+    """
+    A predicate over some configuration arguments.
+
+    If `args` is not provided, the arguments are taken from the parameter names of `func`, e.g. `Constraint(lambda batch_size, accum: batch_size * accum <= 512)`.
+    """
+
+    def __init__(self, func, args=None):
+        self.func = func
+        if args is None:
+            args = inspect.signature(func).parameters
+        self.args = list(args)
+
+    def __call__(self, config):
+        return self.func(*[config[arg] for arg in self.args])
 
 
 class GridConfig:
-    def __init__(self, config: dict, config_names: list = None):
+    """
+    Cartesian product of configuration values.
+
+    Every key whose value is a list is a dimension of the grid, other values are constant. Tuple keys zip several arguments together in a single dimension, e.g. `{("lr", "warmup"): [(0.1, 10), (0.01, 100)]}`.
+
+    Grid indices are decoded in mixed radix, the first dimension varying the fastest. The strides are computed once, so any configuration can be decoded in O(1) without enumerating the grid.
+
+    Constraints exclude invalid configurations, and conditions make a dimension vary only when some other arguments allow it: when its condition is false, the dimension is pinned to its first value and left out of the configuration. Enumeration prunes whole subtrees of the grid as soon as a constraint or condition fails.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        config_names: list = None,
+        constraints: list = None,
+        conditions: dict = None,
+    ):
+        """
+        Args:
+            config (dict): The configuration values, list values are dimensions of the grid.
+            config_names (list, optional): The configuration names, in the format accepted by `flatten_names()`.
+            constraints (list, optional): Callables or `Constraint` objects, a configuration is valid only if all of them return True.
+            conditions (dict, optional): Maps keys of the config to callables or `Constraint` objects, the dimension varies only when its condition returns True.
+        """
         self.config = config
         self.config_names = config_names
         self._idx = 0
 
-    def get_dimenstions(self):
-        dim_sizes = []
+        self._keys = list(self.config.keys())
+        self._dimensions = []
+        self._strides = []
+        stride = 1
         for k, v in self.config.items():
-            if isinstance(v, list):
-                dim_sizes.append(len(v))
-            else:
-                dim_sizes.append(1)
-        return dim_sizes
+            dim_size = len(v) if isinstance(v, list) else 1
+            self._dimensions.append(dim_size)
+            self._strides.append(stride)
+            stride *= dim_size
+        self._size = stride
+
+        self.constraints = [
+            c if isinstance(c, Constraint) else Constraint(c) for c in constraints or []
+        ]
+        self.conditions = {
+            k: c if isinstance(c, Constraint) else Constraint(c)
+            for k, c in (conditions or {}).items()
+        }
+
+        # Dimension (level) of each argument
+        arg_levels = {}
+        for level, k in enumerate(self._keys):
+            for arg in k if isinstance(k, tuple) else (k,):
+                arg_levels[arg] = level
+
+        # Every check is a set of levels and a predicate over (args, dim_ids)
+        self._checks = []
+        for c in self.constraints:
+            levels = self._levels(c, arg_levels)
+            self._checks.append((levels, lambda args, dim_ids, c=c: c(args)))
+        for k, c in self.conditions.items():
+            if k not in self.config:
+                raise ValueError(f"Unknown conditional dimension {k}")
+            levels = self._levels(c, arg_levels) | {self._keys.index(k)}
+            self._checks.append(
+                (levels, lambda args, dim_ids, k=k, c=c: dim_ids[k] == 0 or c(args))
+            )
+
+    @staticmethod
+    def _levels(constraint, arg_levels):
+        for arg in constraint.args:
+            if arg not in arg_levels:
+                raise ValueError(f"Unknown argument {arg} in constraint")
+        return {arg_levels[arg] for arg in constraint.args}
+
+    def get_dimenstions(self):
+        return list(self._dimensions)
 
     def size(self):
-        """Returns the number of configurations in the grid"""
-        if len(self.get_dimenstions()) == 0:
-            return 1
-        return reduce(lambda x, y: x * y, self.get_dimenstions())
+        """Returns the number of configurations in the grid, including the invalid ones"""
+        return self._size
 
     def idx_to_dim_ids(self, idx):
         dim_ids = {}
-        for k, v in self.config.items():
-            if isinstance(v, list):
-                dim_ids[k] = idx % len(v)
-                idx = idx // len(v)
+        for k, dim_size, stride in zip(self._keys, self._dimensions, self._strides):
+            if isinstance(self.config[k], list):
+                dim_ids[k] = (idx // stride) % dim_size
         return dim_ids
 
+    def dim_ids_to_idx(self, dim_ids):
+        """Returns the grid index of the given dimension ids, the inverse of `idx_to_dim_ids()`"""
+        idx = 0
+        for k, stride in zip(self._keys, self._strides):
+            if isinstance(self.config[k], list):
+                idx += dim_ids[k] * stride
+        return idx
+
+    def _args(self, level, dim_id):
+        """Returns the arguments set by the given dimension"""
+        k, v = self._keys[level], self.config[self._keys[level]]
+        if isinstance(v, list):
+            v = v[dim_id]
+        if isinstance(k, tuple):
+            return dict(zip(k, v))
+        return {k: v}
+
+    def dim_ids_to_config(self, dim_ids, to_args=False):
+        """Returns the configuration selected by the given dimension ids"""
+        config = {}
+        for level, k in enumerate(self._keys):
+            config.update(self._args(level, dim_ids.get(k, 0)))
+
+        # Leave out the inactive conditional dimensions
+        for k, c in self.conditions.items():
+            if not c(config):
+                for arg in k if isinstance(k, tuple) else (k,):
+                    del config[arg]
+
+        if to_args:
+            config = dict_to_args(config)
+
+        return config
+
+    def is_valid(self, grid_idx):
+        """Returns True if the configuration satisfies all the constraints and conditions"""
+        dim_ids = self.idx_to_dim_ids(grid_idx)
+        args = {}
+        for level, k in enumerate(self._keys):
+            args.update(self._args(level, dim_ids.get(k, 0)))
+        return all(check(args, dim_ids) for _, check in self._checks)
+
     def get_config(self, grid_idx=0, to_args=False):
         if self.size() == 0:
             return self.config
         if grid_idx >= self.size():
             raise ValueError("Grid index out of bounds")
 
-        dim_ids = self.idx_to_dim_ids(grid_idx)
-        config = {}
+        return self.dim_ids_to_config(self.idx_to_dim_ids(grid_idx), to_args=to_args)
 
-        for i, (k, v) in enumerate(self.config.items()):
-            if isinstance(v, list):
-                v = v[dim_ids[k]]
+    def _checks_by_position(self, order):
+        """Assigns each check to the position of `order` after which all its levels are assigned"""
+        checks = [[] for _ in order]
+        for levels, check in self._checks:
+            position = max(order.index(level) for level in levels)
+            checks[position].append(check)
+        return checks
 
-            if isinstance(k, tuple):
-                for k_, v_ in zip(k, v):
-                    config[k_] = v_
+    def valid_indices(self, start=0, stop=None):
+        """
+        Lazily yields, in increasing order, the indices in `range(start, stop)` of the valid configurations.
 
-            else:
-                config[k] = v
+        The grid is explored from the slowest varying dimension to the fastest, skipping whole subtrees that are out of range or that fail a constraint.
+        """
+        if stop is None:
+            stop = self.size()
+        if not self._checks:
+            yield from range(start, min(stop, self.size()))
+            return
+
+        order = list(reversed(range(len(self._keys))))
+        checks = self._checks_by_position(order)
+
+        def search(position, base, args, dim_ids):
+            if position == len(order):
+                yield base
+                return
+            level = order[position]
+            k, stride = self._keys[level], self._strides[level]
+            for dim_id in range(self._dimensions[level]):
+                lo = base + dim_id * stride
+                if lo + stride <= start or lo >= stop:
+                    continue
+                args_ = {**args, **self._args(level, dim_id)}
+                dim_ids_ = {**dim_ids, k: dim_id}
+                if all(check(args_, dim_ids_) for check in checks[position]):
+                    yield from search(position + 1, lo, args_, dim_ids_)
+
+        yield from search(0, 0, {}, {})
+
+    def count_valid(self):
+        """
+        Returns the number of valid configurations.
 
-        if to_args:
-            config = dict_to_args(config)
+        Only the dimensions involved in constraints or conditions are explored, the others just multiply the count.
+        """
+        if self.size() == 0:
+            return 0
+        constrained = sorted({level for levels, _ in self._checks for level in levels})
+        free = 1
+        for level, dim_size in enumerate(self._dimensions):
+            if level not in constrained:
+                free *= dim_size
+
+        checks = self._checks_by_position(constrained)
+
+        def count(position, args, dim_ids):
+            if position == len(constrained):
+                return 1
+            level = constrained[position]
+            total = 0
+            for dim_id in range(self._dimensions[level]):
+                args_ = {**args, **self._args(level, dim_id)}
+                dim_ids_ = {**dim_ids, self._keys[level]: dim_id}
+                if all(check(args_, dim_ids_) for check in checks[position]):
+                    total += count(position + 1, args_, dim_ids_)
+            return total
+
+        return free * count(0, {}, {})
+
+    def iter_configs(self, start=0, stop=None, step=1, **kwargs):
+        """
+        Lazily yields the valid configurations with grid index in `range(start, stop, step)`.
+        """
+        if stop is None:
+            stop = self.size()
+        if step == 1:
+            indices = self.valid_indices(start, stop)
+        else:
+            indices = range(start, min(stop, self.size()), step)
+            if self._checks:
+                indices = filter(self.is_valid, indices)
+        for i in indices:
+            yield self.get_config(i, **kwargs)
 
-        return config
+    def decode(self, start=0, stop=None):
+        """
+        Decodes a range of grid indices at once into columnar arrays of dimension ids.
+
+        Requires NumPy.
+
+        Returns:
+            A dictionary mapping each (list valued) key of the configuration to a NumPy array with the dimension id of every grid index in `range(start, stop)`.
+        """
+        import numpy as np
+
+        if stop is None:
+            stop = self.size()
+        idx = np.arange(start, min(stop, self.size()), dtype=np.int64)
+
+        dim_ids = {}
+        for k, dim_size, stride in zip(self._keys, self._dimensions, self._strides):
+            if isinstance(self.config[k], list):
+                dim_ids[k] = (idx // stride) % dim_size
+        return dim_ids
 
     def flatten(self, **kwargs):
         """
         Returns a list of all possible configurations
         """
-        configs = []
-        for i in range(self.size()):
-            configs.append(self.get_config(i, **kwargs))
-        return configs
+        return list(self.iter_configs(**kwargs))
+
+    def flatten_names(self, join="_"):
+        """
+        Returns the names of all the valid configurations, matching the output of `flatten()`.
+        """
+        if self.config_names is None:
+            raise ValueError("No configuration names provided")
+        return [
+            idx_to_name(self.config_names, i, join=join) for i in self.valid_indices()
+        ]
+
+    def __getitem__(self, idx):
+        """
+        Returns the configuration with the given grid index, or the valid configurations of a slice of grid indices.
+
+        Indices are grid indices, not positions among the valid configurations: with constraints, `grid[i]` is not `list(grid)[i]`, and invalid configurations raise `IndexError`.
+        """
+        if isinstance(idx, slice):
+            return list(self.iter_configs(*idx.indices(self.size())))
+        if idx < 0:
+            idx += self.size()
+        if idx < 0:
+            raise IndexError("Grid index out of bounds")
+        try:
+            config = self.get_config(idx)
+        except ValueError as e:
+            raise IndexError(str(e))
+        if not self.is_valid(idx):
+            raise IndexError(f"Configuration {idx} does not satisfy the constraints")
+        return config
 
     def __next__(self):
+        # Skip the invalid configurations
+        while self._idx < self.size() and not self.is_valid(self._idx):
+            self._idx += 1
         if self._idx >= self.size():
             raise StopIteration
         else:
@@ -113,11 +424,13 @@ class GridConfig:
             return config
 
     def __iter__(self):
+        """Lazily yields the valid configurations, see `iter_configs()`"""
         self._idx = 0
-        return self
+        return self.iter_configs()
 
     def __len__(self):
-        return self.size()
+        """Returns the number of valid configurations, `size()` is the size of the grid"""
+        return self.count_valid()
 
 
 def dict_to_args(dictionary, prefix="--", separator=" ", join=" "):
@@ -146,30 +459,26 @@ def dict_to_slurm_args(dictionary):
     return dict_to_args(dictionary, prefix="#SBATCH --", separator="=", join="\n")
 
 
+def idx_to_name(names, idx, join="_"):
+    """
+    Returns the name of the configuration with the given index, without flattening all the names.
+
+    Names are decoded as in `flatten_names()`, the first list varying the fastest.
+    """
+    name = []
+    for dim in names:
+        if isinstance(dim, list):
+            name.append(dim[idx % len(dim)])
+            idx = idx // len(dim)
+        else:
+            name.append(dim)
+    return join.join(name)
+
+
 def flatten_names(names, join="_"):
-    dims = []
     size = 1
     for l in names:
         if isinstance(l, list):
-            dim_size = len(l)
-            dims.append(dim_size)
-            size *= dim_size
-        else:
-            dims.append(1)
-
-    flattened_names = []
-    for i in range(size):
-        dim_ids = []
-        flattened_names.append([])
-        for dim_id, dim_size in enumerate(dims):
-            dim_ids.append(i % dim_size)
-            i = i // dim_size
-            dim = names[dim_id]
-            if isinstance(dim, list):
-                flattened_names[-1].append(dim[dim_ids[-1]])
-            else:
-                flattened_names[-1].append(dim)
-
-        flattened_names[-1] = join.join(flattened_names[-1])
-
-    return flattened_names
+            size *= len(l)
+
+    return [idx_to_name(names, i, join=join) for i in range(size)]
@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+import pytest
+import paramiko
+from unittest.mock import patch, MagicMock
+from hpctools.auths import SSHAuth
+from hpctools.connections import SSHConnectionPool
+from hpctools.uploaders import RSYNCUploader
+from hpctools.runners import SSHRunner
+
+
+@pytest.fixture
+def pool():
+    pool = SSHConnectionPool()
+    yield pool
+    pool.close_all()
+
+
+def test_pool_shares_clients(pool):
+    auth = SSHAuth(username="user", hostname="host")
+    same_auth = SSHAuth(username="user", hostname="host", password="pass")
+    other_auth = SSHAuth(username="user", hostname="host", port=2222)
+
+    assert pool.get(auth) is pool.get(same_auth)
+    assert pool.get(auth) is not pool.get(other_auth)
+
+
+def test_runners_share_connection(pool):
+    auth_kwargs = {"username": "user", "hostname": "host"}
+    runner1 = SSHRunner("/remote", project_name="a", auth_kwargs=auth_kwargs, pool=pool)
+    runner2 = SSHRunner("/remote", project_name="b", auth_kwargs=auth_kwargs, pool=pool)
+    assert runner1.ssh_client is runner2.ssh_client
+
+
+def test_pool_control_path(pool):
+    auth = SSHAuth(username="user", hostname="host")
+    options = pool.ssh_options(auth)
+    assert "ControlMaster=auto" in options
+    assert f"ControlPath={pool.control_path(auth)}" in options
+
+    control_dir = pool.control_dir
+    assert os.path.isdir(control_dir)
+    pool.close_all()
+    assert not os.path.exists(control_dir)
+
+
+def test_rsync_uploader_multiplexed(pool, tmp_path):
+    auth = SSHAuth(username="user", hostname="host")
+    with patch("os.system") as mock_os:
+        RSYNCUploader(auth, pool=pool).upload(str(tmp_path), "/remote")
+        cmd = mock_os.call_args[0][0]
+        assert f"-o ControlPath={pool.control_path(auth)}" in cmd
+
+
+def test_exec_command_reconnects(pool):
+    client = pool.get(SSHAuth(username="user", hostname="host"))
+    with patch.object(client, "is_connected", return_value=False), patch.object(
+        client, "connect"
+    ) as mock_connect, patch.object(
+        paramiko.SSHClient, "exec_command", return_value=(None, None, None)
+    ):
+        client.exec_command("ls")
+        mock_connect.assert_called_once()
+
+
+def test_exec_channel_reconnects(pool):
+    client = pool.get(SSHAuth(username="user", hostname="host"))
+    channel = MagicMock()
+    transport = MagicMock()
+    # The first session fails on a dropped connection, the second one succeeds
+    transport.open_session.side_effect = [EOFError(), channel]
+    with patch.object(client, "get_transport", return_value=transport), patch.object(
+        client, "is_connected", side_effect=[True, False]
+    ), patch.object(client, "connect") as mock_connect:
+        assert client.exec_channel("ls") is channel
+        mock_connect.assert_called_once()
+        channel.exec_command.assert_called_once_with("ls")
+
+
+def test_ssh_runner_exec_bytes(pool):
+    runner = SSHRunner(
+        "/remote",
+        project_name="a",
+        auth_kwargs={"username": "user", "hostname": "host"},
+        pool=pool,
+    )
+    channel = MagicMock()
+    stdout = [b"Submitted batch job 5\n"]
+    channel.recv_ready.side_effect = lambda: bool(stdout)
+    channel.recv.side_effect = lambda size: stdout.pop(0)
+    channel.recv_stderr_ready.return_value = False
+    channel.exit_status_ready.return_value = True
+    channel.recv_exit_status.return_value = 0
+
+    with patch.object(runner.ssh_client, "exec_channel", return_value=channel):
+        stdout_, stderr, exitcode = runner.exec("sbatch launch.slurm")
+    assert stdout_.read().decode("utf-8") == "Submitted batch job 5\n"
+    assert stderr.read() == b""
+    assert exitcode == 0
+
+
+def test_concurrent_connect(pool):
+    client = pool.get(SSHAuth(username="user", hostname="host"))
+    connected = threading.Event()
+
+    def connect(**kwargs):
+        time.sleep(0.1)
+        connected.set()
+
+    with patch.object(
+        client, "is_connected", side_effect=lambda: connected.is_set()
+    ), patch.object(client, "get_transport"), patch.object(
+        paramiko.SSHClient, "connect", side_effect=connect
+    ) as mock_connect:
+        threads = [threading.Thread(target=client.connect) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The threads that waited for the lock reuse the connection
+        mock_connect.assert_called_once()
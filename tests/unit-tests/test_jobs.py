@@ -0,0 +1,112 @@
+import pytest
+from hpctools.jobs import (
+    JobStore,
+    aggregate_state,
+    collapse_job_ids,
+    format_array_range,
+    scancel_command,
+    parse_array_range,
+    parse_sacct,
+    sacct_command,
+)
+
+
+@pytest.fixture
+def job_store():
+    store = JobStore(":memory:")
+    yield store
+    store.close()
+
+
+def test_parse_array_range():
+    assert parse_array_range("[0-3,7%2]") == [0, 1, 2, 3, 7]
+    assert parse_array_range("5") == [5]
+    assert parse_array_range("[0-6:3]") == [0, 3, 6]
+
+
+def test_format_array_range():
+    assert format_array_range([7, 0, 1, 2, 3, 3]) == "0-3,7"
+    assert format_array_range([5]) == "5"
+
+
+def test_collapse_job_ids():
+    assert collapse_job_ids(["1_0", "1_1", "1_5", "2", "2_3", "3_[4-6]", "3_7"]) == [
+        "1_[0-1,5]",
+        "2",
+        "3_[4-7]",
+    ]
+    assert collapse_job_ids(["4_2"]) == ["4_2"]
+
+
+def test_scancel_command():
+    assert scancel_command(["1"]) == "scancel 1"
+    assert (
+        scancel_command(["1_0", "1_1", "2", "3"], state="PENDING", max_ids=2)
+        == "scancel --state=PENDING '1_[0-1]' 2 ; scancel --state=PENDING 3"
+    )
+
+
+def test_parse_sacct():
+    output = "\n".join(
+        [
+            "100|COMPLETED|0:0",
+            "101_0|FAILED|1:0",
+            "101_1|CANCELLED by 1234|0:15",
+            "101_[2-3%1]|PENDING|0:0",
+        ]
+    )
+    assert parse_sacct(output) == [
+        ("100", None, "COMPLETED", 0),
+        ("101", 0, "FAILED", 1),
+        ("101", 1, "CANCELLED", 0),
+        ("101", 2, "PENDING", 0),
+        ("101", 3, "PENDING", 0),
+    ]
+    assert sacct_command(["100", "101"]).startswith("sacct -n -P -X -j 100,101 ")
+
+
+def test_aggregate_state():
+    assert aggregate_state(["COMPLETED", "PENDING", "RUNNING"]) == "RUNNING"
+    assert aggregate_state(["COMPLETED", "COMPLETED"]) == "COMPLETED"
+    assert aggregate_state(["COMPLETED", "TIMEOUT"]) == "FAILED"
+
+
+def test_job_store_update(job_store):
+    job_store.record("host", "100", run_name="a", config_offset=0, config_size=1)
+    job_store.record("host", "101", run_name="b", config_offset=1, config_size=2)
+    job_store.record("other", "100")
+    assert job_store.active_jobs("host") == ["100", "101"]
+
+    changed = job_store.update(
+        "host",
+        [
+            ("100", None, "COMPLETED", 0),
+            ("101", 0, "RUNNING", 0),
+            ("101", 1, "PENDING", 0),
+        ],
+    )
+    assert [(c.job_id, c.task_id, c.state) for c in changed] == [
+        ("100", None, "COMPLETED"),
+        ("101", 0, "RUNNING"),
+        ("101", 1, "PENDING"),
+    ]
+    assert job_store.active_jobs("host") == ["101"]
+    assert job_store.jobs(host="host", run_name="b")[0].state == "RUNNING"
+    # Jobs of other hosts are left untouched
+    assert job_store.jobs(host="other")[0].state == "PENDING"
+
+    # Only the rows whose state changed are reported
+    changed = job_store.update(
+        "host", [("101", 0, "COMPLETED", 0), ("101", 1, "PENDING", 0)]
+    )
+    assert [(c.job_id, c.task_id, c.state) for c in changed] == [
+        ("101", 0, "COMPLETED")
+    ]
+
+    job_store.update("host", [("101", 1, "FAILED", 1)])
+    assert job_store.jobs(host="host", run_name="b")[0].state == "FAILED"
+    assert [(t.task_id, t.exit_code) for t in job_store.tasks("host", "101")] == [
+        (0, 0),
+        (1, 1),
+    ]
+    assert job_store.active_jobs("host") == []
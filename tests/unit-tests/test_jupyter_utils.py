@@ -1,8 +1,10 @@
+import io
 import pytest
 from unittest.mock import MagicMock, patch
 import ipywidgets as widgets
 from threading import Timer
-from hpctools.jupyter_utils import DynamicTableWidget, SlurmQueueWidget
+from hpctools.jupyter_utils import DynamicTableWidget, SlurmQueueWidget, LogWidget
+from hpctools.monitoring import QueuePoller
 
 
 @pytest.fixture
@@ -18,6 +20,7 @@ def dynamic_table_widget():
 @pytest.fixture
 def slurm_queue_widget():
     runner = MagicMock()
+    runner.queue_poller = QueuePoller(runner)
     widget = SlurmQueueWidget(runner, "test_job")
     return widget, runner
 
@@ -93,13 +96,13 @@ def test_slurm_queue_widget_initialization(slurm_queue_widget):
 def test_slurm_queue_widget_get_slurm_queue(slurm_queue_widget):
     widget, runner = slurm_queue_widget
     runner.exec.return_value = (
-        MagicMock(readlines=MagicMock(return_value=["", "job1", "job2"])),
+        "1|RUNNING|1:00|1|node1|test_job\n2|PENDING|0:00|1|(Priority)|other_job\n",
         None,
         None,
     )
 
     lines = widget.get_slurm_queue()
-    assert lines == ["job1", "job2"]
+    assert lines == ["1|RUNNING|1:00|1|node1|test_job"]
 
 
 def test_slurm_queue_widget_kill_job(slurm_queue_widget):
@@ -126,3 +129,141 @@ def test_slurm_queue_widget_on_click(slurm_queue_widget):
     row = "12345 some_job"
     widget.on_click(button, row)
     runner.exec.assert_called_with("scancel 12345")
+
+
+def test_dynamic_table_widget_update_diff(dynamic_table_widget):
+    widget, rows_func, _ = dynamic_table_widget
+    rows_func.return_value = ["Row 1", "Row 2"]
+    assert widget.update()
+    row_1 = widget.rows["Row 1"]
+
+    # Nothing changed
+    assert not widget.update()
+
+    # Row widgets are reused and reordered, not rebuilt
+    rows_func.return_value = ["Row 3", "Row 1"]
+    assert widget.update()
+    assert widget.rows["Row 1"] is row_1
+    assert widget.n_rows() == 2
+    button, label, separator = widget.get_row(1)
+    assert label.value == "Row\xa01"
+    assert separator.layout.display == "none"
+
+
+def test_dynamic_table_widget_button_callback(dynamic_table_widget):
+    widget, rows_func, button_callback = dynamic_table_widget
+    rows_func.return_value = ["Row 1"]
+    widget.update()
+    widget.update()
+
+    button, _, _ = widget.get_row(0)
+    button.click()
+    # The handler is registered only once
+    button_callback.assert_called_once_with(button, "Row 1")
+
+
+def test_dynamic_table_widget_poll_backoff(dynamic_table_widget):
+    widget, rows_func, _ = dynamic_table_widget
+    widget.refresh_interval = 0.01
+    widget.max_refresh_interval = 0.04
+    waits = []
+
+    def wait(interval):
+        waits.append(interval)
+        if len(waits) == 5:
+            widget.stop_event.set()
+
+    widget.stop_event.wait = wait
+    rows_func.side_effect = [["a"], ["a"], ["a"], ["a"], ["b"]]
+    widget.poll()
+    assert waits == pytest.approx([0.01, 0.015, 0.0225, 0.03375, 0.01])
+
+
+def test_dynamic_table_widget_auto_update_thread(dynamic_table_widget):
+    widget, rows_func, _ = dynamic_table_widget
+    widget.auto_update()
+    thread = widget.thread
+    widget.auto_update()
+    # A single long-lived thread
+    assert widget.thread is thread and thread.is_alive()
+    widget.stop()
+    assert not thread.is_alive()
+    assert rows_func.called
+
+
+def test_slurm_queue_widget_structured_rows(slurm_queue_widget):
+    widget, runner = slurm_queue_widget
+    runner.exec.return_value = (
+        "123_1|RUNNING|1:00|1|node1|test_job\n"
+        "123_[2-9]|PENDING|0:00|1|(Priority)|test_job\n",
+        None,
+        None,
+    )
+
+    widget.update()
+    assert "--format=" in runner.exec.call_args[0][0]
+    assert list(widget.rows) == ["123_1", "123_[2-9]"]
+    _, label, _ = widget.get_row(0)
+    assert label.value.startswith("123_1\xa0")
+
+    runner.exec.return_value = (io.BytesIO(b""), None, None)
+    widget.on_click(None, "123_[2-9]|PENDING|0:00|1|(Priority)|test_job")
+    runner.exec.assert_called_with("scancel '123_[2-9]'")
+
+
+def test_slurm_queue_widgets_share_poller(slurm_queue_widget):
+    widget, runner = slurm_queue_widget
+    runner.exec.return_value = ("1|RUNNING|1:00|1|node1|test_job\n", None, None)
+    other = SlurmQueueWidget(runner, "test_job")
+
+    widget.update()
+    other.update()
+    # One squeue query for both widgets
+    runner.exec.assert_called_once()
+    assert other.get_slurm_queue() == widget.get_slurm_queue()
+
+
+def test_slurm_queue_widget_bulk_kill(slurm_queue_widget):
+    widget, runner = slurm_queue_widget
+    runner.exec.return_value = (
+        "1_0|RUNNING|1:00|1|node1|test_job\n"
+        "1_1|RUNNING|1:00|1|node1|test_job\n"
+        "2|PENDING|0:00|1|(Priority)|test_job\n",
+        None,
+        None,
+    )
+    widget.update()
+    assert widget.n_rows() == 3
+    button, label, _ = widget.get_row(0)
+    assert isinstance(button, widgets.Button) and isinstance(label, widgets.Label)
+
+    # Select the first two rows
+    for key in ["1_0", "1_1"]:
+        widget.rows[key].children[0].children[0].value = True
+    assert len(widget.selected_rows()) == 2
+
+    widget.on_bulk_click(None)
+    runner.cancel.assert_called_once_with(["1_0", "1_1"])
+    # The selection is cleared
+    assert widget.selected_rows() == []
+
+    widget.select_all.value = True
+    assert len(widget.selected_rows()) == 3
+
+
+def test_log_widget():
+    widget = LogWidget(MagicMock(), max_chars=8)
+    # Polled before any log exists
+    widget.on_logs({})
+    assert widget.selector.options == () and widget.output.value == ""
+
+    widget.on_logs({"runs/b/out.log": "b1\n", "runs/a/out.log": "a1\n"})
+    assert widget.selector.options == ("runs/a/out.log", "runs/b/out.log")
+    assert widget.output.value == "a1\n"
+
+    widget.on_logs({"runs/a/out.log": "a2\na3\n"})
+    # Only the last max_chars characters are kept
+    assert widget.output.value == "1\na2\na3\n"
+
+    widget.selector.value = "runs/b/out.log"
+    assert widget.output.value == "b1\n"
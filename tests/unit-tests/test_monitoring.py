@@ -0,0 +1,106 @@
+import time
+from unittest.mock import MagicMock
+from hpctools.runners import LocalRunner
+from hpctools.monitoring import QueuePoller, LogFollower, parse_squeue
+
+
+def test_parse_squeue():
+    rows = parse_squeue(
+        "1|RUNNING|1:00|1|node1|job|with|bars\n\n2_[0-3]|PENDING|0:00|1|(Priority)|b\n"
+    )
+    assert [(row.job_id, row.state, row.name) for row in rows] == [
+        ("1", "RUNNING", "job|with|bars"),
+        ("2_[0-3]", "PENDING", "b"),
+    ]
+    assert rows[1].line == "2_[0-3]|PENDING|0:00|1|(Priority)|b"
+
+
+def test_queue_poller_cache():
+    runner = MagicMock()
+    runner.exec.return_value = (b"1|RUNNING|1:00|1|node1|a\n", b"", 0)
+    poller = QueuePoller(runner, ttl=60)
+
+    assert [row.job_id for row in poller.jobs()] == ["1"]
+    assert poller.jobs(name="b") == []
+    runner.exec.assert_called_once()
+    assert "squeue --noheader" in runner.exec.call_args[0][0]
+
+    poller.jobs(max_age=0)
+    assert runner.exec.call_count == 2
+
+
+def test_queue_poller_subscribe():
+    runner = MagicMock()
+    runner.exec.return_value = (b"1|RUNNING|1:00|1|node1|a\n", b"", 0)
+    poller = QueuePoller(runner, interval=0.01)
+
+    received = []
+    poller.subscribe(received.append)
+    deadline = time.time() + 5
+    while not received and time.time() < deadline:
+        time.sleep(0.01)
+    poller.unsubscribe(received.append)
+    poller.thread.join(timeout=5)
+
+    assert received[0][0].job_id == "1"
+    assert not poller.thread.is_alive()
+
+
+def test_log_follower(tmp_path):
+    (tmp_path / "runs" / "a").mkdir(parents=True)
+    (tmp_path / "runs" / "sub" / "b").mkdir(parents=True)
+    log_a = tmp_path / "runs" / "a" / "out.log"
+    log_b = tmp_path / "runs" / "sub" / "b" / "out.log"
+
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    follower = LogFollower(runner, max_bytes=4)
+
+    log_a.write_bytes("hhhéllo\n".encode())
+    # Reads are capped at max_bytes, a character split across two reads is kept whole
+    assert follower.read() == {"runs/a/out.log": "hhh"}
+    assert follower.read() == {"runs/a/out.log": "éllo"}
+    assert follower.read() == {"runs/a/out.log": "\n"}
+    assert follower.read() == {}
+
+    follower.max_bytes = 2**20
+    with open(log_a, "a") as f:
+        f.write("more\n")
+    log_b.write_text("b\n")
+    assert follower.read() == {
+        "runs/a/out.log": "more\n",
+        "runs/sub/b/out.log": "b\n",
+    }
+    assert follower.offsets == {"runs/a/out.log": 14, "runs/sub/b/out.log": 2}
+
+    # Truncated logs are read again from the start
+    log_a.write_text("new\n")
+    assert follower.read() == {"runs/a/out.log": "new\n"}
+
+
+def test_log_follower_single_round_trip(tmp_path, mocker):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    for name in "abc":
+        (tmp_path / "runs" / name).mkdir(parents=True)
+        (tmp_path / "runs" / name / "out.log").write_text(name)
+    follower = LogFollower(runner)
+    spy = mocker.spy(runner, "exec")
+
+    assert len(follower.read()) == 3
+    spy.assert_called_once()
+
+
+def test_log_follower_many_logs(tmp_path):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    follower = LogFollower(runner, patterns=("runs/*/out.log",))
+    (tmp_path / "runs" / "a").mkdir(parents=True)
+    (tmp_path / "runs" / "a" / "out.log").write_text("a\n")
+
+    # Offsets of more logs than fit on a command line (MAX_ARG_STRLEN is 128 KiB)
+    follower.offsets = {f"runs/{'x' * 200}{i}/out.log": 1 for i in range(2000)}
+    follower.offsets["runs/a/out.log"] = 1
+    assert len(follower.offsets_input()) > 2**17
+    assert len(follower.command()) < 2**12
+
+    with open(tmp_path / "runs" / "a" / "out.log", "a") as f:
+        f.write("b\n")
+    assert follower.read() == {"runs/a/out.log": "\nb\n"}
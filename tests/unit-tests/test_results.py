@@ -0,0 +1,93 @@
+import os
+import json
+import pytest
+from hpctools.utils import GridConfig
+from hpctools.results import (
+    ResultTable,
+    parse_log_metrics,
+    parse_metrics_file,
+)
+
+
+def write_run(runs_dir, name, log, metrics=None):
+    run_dir = runs_dir / name
+    run_dir.mkdir(parents=True, exist_ok=True)
+    (run_dir / "out.log").write_text(log)
+    if metrics is not None:
+        (run_dir / "metrics.json").write_text(metrics)
+    return run_dir
+
+
+@pytest.fixture
+def grid():
+    return GridConfig(
+        {"lr": [0.1, 0.01], "bs": [16, 32], "epochs": 10},
+        config_names=["lr", ["a", "b"], ["16", "32"]],
+    )
+
+
+def test_parse_log_metrics(tmp_path):
+    run_dir = write_run(
+        tmp_path,
+        "run",
+        "SLURM_JOB_ID: 12\nGRID_INDEX: 3\n"
+        "epoch=1 loss: 0.5\n"
+        "epoch=2 loss: 2.5e-1 acc=0.9\n",
+    )
+    assert parse_log_metrics(str(run_dir)) == {"epoch": 2, "loss": 0.25, "acc": 0.9}
+
+
+def test_parse_metrics_file(tmp_path):
+    run_dir = write_run(tmp_path, "a", "", '{"loss": 0.5}')
+    assert parse_metrics_file(str(run_dir)) == {"loss": 0.5}
+
+    # JSON lines, the last value wins
+    run_dir = write_run(tmp_path, "b", "", '{"loss": 0.5}\n{"loss": 0.2, "acc": 1}\n')
+    assert parse_metrics_file(str(run_dir)) == {"loss": 0.2, "acc": 1}
+
+
+def test_result_table(tmp_path, grid):
+    runs_dir = tmp_path / "runs"
+    write_run(runs_dir, "lr_b_16", "", '{"loss": 0.5}')
+    write_run(runs_dir, "lr_a_32", "loss: 0.25\n")
+    # Not a named run, the grid index is read from the log
+    write_run(runs_dir / "sub", "other", "GRID_INDEX: 0\n")
+
+    table = ResultTable(grid)
+    assert table.ingest(str(runs_dir)) == ["lr_a_32", "lr_b_16", "sub/other"]
+
+    array = table.to_numpy()
+    assert list(array["run"]) == ["lr_a_32", "lr_b_16", "sub/other"]
+    assert list(array["grid_index"]) == [2, 1, 0]
+    assert list(array["lr"]) == [0.1, 0.01, 0.1]
+    assert list(array["bs"]) == [32, 16, 16]
+    assert array["loss"][:2].tolist() == [0.25, 0.5]
+    # Missing metrics are NaN
+    assert str(array["loss"][2]) == "nan"
+
+
+def test_result_table_incremental(tmp_path, grid):
+    runs_dir = tmp_path / "runs"
+    write_run(runs_dir, "lr_a_16", "loss: 1\n")
+    write_run(runs_dir, "lr_b_16", "loss: 2\n")
+    path = str(tmp_path / "table.json")
+    calls = []
+
+    def parser(run_dir):
+        calls.append(os.path.basename(run_dir))
+        return {"loss": float(open(os.path.join(run_dir, "out.log")).read()[6:])}
+
+    table = ResultTable(grid, parser=parser, path=path)
+    table.ingest(str(runs_dir))
+    assert sorted(calls) == ["lr_a_16", "lr_b_16"]
+
+    # Only the new and changed runs are parsed again, the state survives across sessions
+    run_dir = write_run(runs_dir, "lr_b_16", "loss: 3\n")
+    os.utime(run_dir / "out.log", (0, 0))
+    write_run(runs_dir, "lr_a_32", "loss: 4\n")
+    table = ResultTable(grid, parser=parser, path=path)
+    assert table.ingest(str(runs_dir)) == ["lr_a_32", "lr_b_16"]
+    assert sorted(calls[2:]) == ["lr_a_32", "lr_b_16"]
+    assert len(table) == 3
+    assert table.to_dict()["loss"] == [1.0, 4.0, 3.0]
+    assert json.load(open(path))["records"]["lr_b_16"]["loss"] == 3.0
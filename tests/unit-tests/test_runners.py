@@ -1,6 +1,27 @@
 import pytest
 import os
-from hpctools.runners import LAUNCH_COMMANDS, TEMPLATING_ENGINES, Runner
+import re
+import time
+import threading
+import subprocess
+from hpctools.runners import (
+    LAUNCH_COMMANDS,
+    TEMPLATING_ENGINES,
+    RUN_OUTPUT_MARKER,
+    CONFIG_INDEX_WIDTH,
+    write_config_table,
+    config_hashes,
+    SSHExecStream,
+    AsyncRunner,
+    FanOutRunner,
+    FanOutJob,
+    ShardedJob,
+    parse_job_id,
+    Runner,
+    LocalRunner,
+)
+from hpctools.jobs import JobStore
+from hpctools.utils import dotdict
 
 
 def test_launch_commands():
@@ -78,3 +99,802 @@ def test_runner_init_custom():
     assert (
         runner.experiment_dir == experiment_dir
     ), "Experiment directory should match the provided directory"
+
+
+def test_templating_engines_j2_cache(tmp_path):
+    p = tmp_path / "cached.j2"
+    p.write_text("Hello {{ name }}!")
+
+    first = TEMPLATING_ENGINES.j2_template(str(p))
+    second = TEMPLATING_ENGINES.j2_template(str(p))
+    assert first is second
+
+    # A change on disk invalidates the compiled template
+    p.write_text("Bye {{ name }}!")
+    os.utime(p, (0, 0))
+    assert TEMPLATING_ENGINES["j2"](str(p), name="World") == "Bye World!"
+    assert len([k for k in TEMPLATING_ENGINES.J2_TEMPLATES if k[0] == str(p)]) == 1
+
+
+def test_templating_engines_j2_bytecode_cache(tmp_path):
+    p = tmp_path / "cached.j2"
+    p.write_text("Hello {{ name }}!")
+    cache_dir = tmp_path / "cache"
+
+    try:
+        TEMPLATING_ENGINES.j2_environment(bytecode_cache_dir=str(cache_dir))
+        assert TEMPLATING_ENGINES["j2"](str(p), name="World") == "Hello World!"
+        assert len(os.listdir(cache_dir)) == 1
+    finally:
+        TEMPLATING_ENGINES.j2_environment(reset=True)
+
+
+def test_runner_run_many(tmp_path, mocker):
+    template = tmp_path / "job.sh.j2"
+    template.write_text("echo {{ message }}")
+
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    mock_exec = mocker.patch.object(
+        runner,
+        "exec",
+        return_value=(
+            f"{RUN_OUTPUT_MARKER}0\nfirst\n{RUN_OUTPUT_MARKER}1\nsecond\n".encode(),
+            b"",
+            0,
+        ),
+    )
+    mock_sync = mocker.patch.object(runner, "sync_context")
+
+    jobs = runner.run_many(
+        [
+            (str(template), {"message": "a"}, "a"),
+            (str(template), {"message": "b"}, "b"),
+        ]
+    )
+
+    # The context is synced and the commands are submitted only once
+    mock_sync.assert_called_once()
+    mock_exec.assert_called_once()
+    command = mock_exec.call_args[0][0]
+    assert "./launch.a.sh" in command and "./launch.b.sh" in command
+
+    assert [job.name for job in jobs] == [
+        f"project/{tmp_path.name}/a",
+        f"project/{tmp_path.name}/b",
+    ]
+    assert [job.output for job in jobs] == ["first\n", "second\n"]
+    # Launch files are cleaned up
+    assert not (tmp_path / "launch.a.sh").exists()
+
+
+def test_runner_run_many_duplicate_names(tmp_path):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        runner.run_many([("job.sh.j2", {}, "a"), ("job.sh.j2", {}, "a")])
+
+
+ARRAYJOB_TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "../../src/hpctools/templates/launch_scripts/arrayjob.slurm.j2",
+)
+
+
+def test_arrayjob_template_sharding():
+    rendered = TEMPLATING_ENGINES["j2"](
+        ARRAYJOB_TEMPLATE,
+        **__builtins__,
+        slurm_args={"time": "10:00"},
+        job_name="project/experiment/run-1",
+        script_configs=["--a 1", "--a 2"],
+        script_config_names=["a1", "a2"],
+        array_offset=1000,
+        array_throttle=10,
+    )
+    assert "#SBATCH --array=0-1%10\n" in rendered
+    assert "#SBATCH --job-name=project/experiment/run-1\n" in rendered
+    assert "GRID_INDEX=$((SLURM_ARRAY_TASK_ID + 1000))" in rendered
+
+
+def test_runner_run_sharded(tmp_path, mocker):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    mocker.patch.object(runner, "sync_context")
+
+    job = runner.run_sharded(
+        ARRAYJOB_TEMPLATE,
+        {
+            "slurm_args": {},
+            "script_configs": [f"--a {i}" for i in range(25)],
+            "script_config_names": [f"a{i}" for i in range(25)],
+        },
+        run_name="sweep",
+        max_array_size=10,
+        dry_run=True,
+    )
+
+    assert job.size == 25
+    assert [shard.name for shard in job.shards] == [
+        f"project/{tmp_path.name}/sweep-{i}" for i in range(3)
+    ]
+    assert [(shard.offset, shard.size) for shard in job.shards] == [
+        (0, 10),
+        (10, 10),
+        (20, 5),
+    ]
+    shard, task_id = job.locate(23)
+    assert shard is job.shards[2] and task_id == 3
+    with pytest.raises(IndexError):
+        job.locate(25)
+
+
+def test_write_config_table(tmp_path):
+    configs = ["--a 1", "--a 22 --b 'x'", ""]
+    table, index = write_config_table(
+        str(tmp_path / "configs.tsv"), configs, ["n0", "n1", "n2"]
+    )
+
+    with open(table, "rb") as t, open(index, "rb") as idx:
+        for i, config in enumerate(configs):
+            idx.seek(i * CONFIG_INDEX_WIDTH)
+            t.seek(int(idx.read(CONFIG_INDEX_WIDTH)))
+            assert t.readline().decode() == f"n{i}\t{config}\n"
+
+    with pytest.raises(ValueError):
+        write_config_table(str(tmp_path / "bad.tsv"), ["--a\t1"])
+
+
+def test_runner_config_table(tmp_path, mocker):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    mocker.patch.object(runner, "sync_context")
+    # Keep the launch file
+    mocker.patch("hpctools.runners.DEBUG", True)
+
+    job = runner.run(
+        ARRAYJOB_TEMPLATE,
+        {"script_configs": ["--a 1", "--a 2"], "script_config_names": ["a1", "a2"]},
+        run_name="sweep",
+        dry_run=True,
+    )
+
+    launch_file = (tmp_path / "launch.sweep.slurm").read_text()
+    assert "CONFIGS=(" not in launch_file
+    assert job.config_table.startswith(".hpctools/configs/sweep-")
+    assert job.config_table in launch_file
+    assert (tmp_path / job.config_table).read_text() == "a1\t--a 1\na2\t--a 2\n"
+
+    # A new submission with the same run name does not overwrite the table of the pending one
+    other = runner.run(
+        ARRAYJOB_TEMPLATE,
+        {"script_configs": ["--a 3"], "script_config_names": ["a3"]},
+        run_name="sweep",
+        dry_run=True,
+    )
+    assert other.config_table != job.config_table
+    assert other.launch_file != job.launch_file
+    assert (tmp_path / job.config_table).read_text() == "a1\t--a 1\na2\t--a 2\n"
+
+
+PACKED_TEMPLATE = os.path.join(
+    os.path.dirname(ARRAYJOB_TEMPLATE), "packedarrayjob.slurm.j2"
+)
+
+
+def test_runner_run_packed(tmp_path, mocker):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    mocker.patch.object(runner, "sync_context")
+    mocker.patch("hpctools.runners.DEBUG", True)
+
+    job = runner.run_packed(
+        PACKED_TEMPLATE,
+        {
+            "slurm_args": {"cpus-per-task": 4},
+            "script_configs": [f"--a {i}" for i in range(25)],
+        },
+        run_name="sweep",
+        max_array_size=10,
+        dry_run=True,
+    )
+
+    assert job.pack_size == 3 and job.size == 25
+    launch_file = (tmp_path / "launch.sweep.slurm").read_text()
+    assert "#SBATCH --array=0-8\n" in launch_file
+    assert "PACK_SIZE=3\n" in launch_file
+
+    runner.config_table = False
+    with pytest.raises(ValueError):
+        runner.run_packed(PACKED_TEMPLATE, {"script_configs": []}, dry_run=True)
+
+
+def test_local_runner_run_pool(tmp_path):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    completed = []
+
+    exitcodes = runner.run_pool(
+        'sh -c \'echo "$CUDA_VISIBLE_DEVICES $0"; exit $0\'',
+        ["0", "1", "0", "2"],
+        ["a", "b", "c", "d"],
+        subexperiment_name="sub",
+        worker_gpus=[3, 5],
+        callback=lambda idx, name, exitcode: completed.append(idx),
+    )
+
+    assert exitcodes == [0, 1, 0, 2]
+    assert sorted(completed) == [0, 1, 2, 3]
+    gpu, code = (tmp_path / "runs" / "sub" / "d" / "out.log").read_text().split()
+    assert gpu in ["3", "5"] and code == "2"
+
+    # More worker slots than GPUs, the slots share the GPUs
+    exitcodes = runner.run_pool(
+        'sh -c \'echo "$CUDA_VISIBLE_DEVICES"; sleep 0.1\'',
+        [""] * 6,
+        subexperiment_name="shared",
+        max_workers=4,
+        worker_gpus=[3, 5],
+    )
+    assert exitcodes == [0] * 6
+    gpus = {
+        (tmp_path / "runs" / "shared" / str(i) / "out.log").read_text().strip()
+        for i in range(6)
+    }
+    assert gpus == {"3", "5"}
+
+
+def test_job_template_worker_gpus(tmp_path):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    runner.config_table = False
+    runner.run(
+        os.path.join(os.path.dirname(ARRAYJOB_TEMPLATE), "job.bash.j2"),
+        {
+            "script": "sleep",
+            "script_configs": ["0.2"] * 4,
+            "script_config_names": ["a", "b", "c", "d"],
+            "subexperiment_name": "sub",
+            "max_workers": 4,
+            "worker_gpus": [3, 5],
+            "run_before": "",
+            "run_after": "",
+            "env": "",
+            "run_before_task": "",
+            "run_after_task": "",
+        },
+        run_name="pool",
+    )
+
+    # More worker slots than GPUs, every slot gets one of the GPUs
+    for name in ["a", "b", "c", "d"]:
+        log = (tmp_path / "runs" / "sub" / name / "out.log").read_text()
+        assert re.search(r"^CUDA_VISIBLE_DEVICES: [35]$", log, flags=re.MULTILINE)
+
+
+def test_local_runner_exec_stream():
+    runner = LocalRunner(project_name="project")
+    stream = runner.exec_stream("echo a; echo b >&2; echo c; exit 3")
+
+    lines = list(stream)
+    assert [line for name, line in lines if name == "stdout"] == ["a", "c"]
+    assert [line for name, line in lines if name == "stderr"] == ["b"]
+    assert stream.exitcode == 3
+
+
+def test_local_runner_exec_stream_timeout_and_cancel():
+    runner = LocalRunner(project_name="project")
+
+    with pytest.raises(TimeoutError):
+        list(runner.exec_stream("sleep 5", timeout=0.2))
+
+    stream = runner.exec_stream("echo a; sleep 5")
+    for name, line in stream:
+        assert line == "a"
+        stream.cancel()
+    assert stream.exitcode is None
+    assert stream.process.wait(timeout=1) != 0
+
+
+def test_ssh_exec_stream(mocker):
+    channel = mocker.Mock()
+    stdout = [b"line 1\nli", b"ne 2\npartial"]
+    channel.recv_ready.side_effect = lambda: bool(stdout)
+    channel.recv.side_effect = lambda size: stdout.pop(0)
+    channel.recv_stderr_ready.return_value = False
+    channel.exit_status_ready.return_value = True
+    channel.recv_exit_status.return_value = 0
+
+    stream = SSHExecStream(channel)
+    assert list(stream) == [
+        ("stdout", "line 1"),
+        ("stdout", "line 2"),
+        ("stdout", "partial"),
+    ]
+    assert stream.exitcode == 0
+
+
+def test_ssh_exec_stream_late_output(mocker):
+    channel = mocker.Mock()
+    stdout = []
+    checks = []
+
+    # The last output and the exit status arrive between the checks of the stream
+    def recv_ready():
+        checks.append(1)
+        if len(checks) == 1:
+            stdout.append(b"Submitted batch job 5\n")
+            return False
+        return bool(stdout)
+
+    channel.recv_ready.side_effect = recv_ready
+    channel.recv.side_effect = lambda size: stdout.pop(0)
+    channel.recv_stderr_ready.return_value = False
+    channel.exit_status_ready.return_value = True
+    channel.recv_exit_status.return_value = 0
+
+    stream = SSHExecStream(channel)
+    assert list(stream) == [("stdout", "Submitted batch job 5")]
+    assert stream.exitcode == 0
+
+
+def test_async_runner(mocker):
+    import asyncio
+
+    runner = LocalRunner(project_name="project")
+    runner.connect = mocker.Mock()
+    async_runner = AsyncRunner(runner)
+
+    async def main():
+        # Several commands run concurrently
+        results = await asyncio.gather(
+            *[async_runner.exec(f"sleep 0.2; echo {i}") for i in range(4)]
+        )
+        lines = [line async for line in async_runner.exec_stream("echo a; echo b")]
+        await asyncio.gather(async_runner.connect(), async_runner.connect())
+        return results, lines
+
+    start = time.time()
+    results, lines = asyncio.run(main())
+    assert time.time() - start < 0.7
+    assert [stdout for stdout, _, _ in results] == [b"0\n", b"1\n", b"2\n", b"3\n"]
+    assert lines == [("stdout", "a"), ("stdout", "b")]
+    assert runner.connect.call_count == 2
+
+
+def test_parse_job_id():
+    assert parse_job_id("Submitted batch job 1234\n") == "1234"
+    assert parse_job_id("sbatch: error: invalid partition") is None
+
+
+def test_fan_out_runner_partition(mocker):
+    runners = {name: LocalRunner(project_name="project") for name in "abc"}
+    fan_out = FanOutRunner(runners, weights={"a": 2, "b": 1, "c": 1})
+    assert fan_out.partition(10) == [("a", 0, 5), ("b", 5, 8), ("c", 8, 10)]
+    assert fan_out.partition(1) == [("a", 0, 1)]
+
+    # Clusters with a deep queue get fewer configs
+    queues = {"a": b"1|RUNNING|1:00|1|n1|x\n2_[0-1%1]|PENDING|0:00|1|n1|y\n"}
+    for name, runner in runners.items():
+        mocker.patch.object(
+            runner, "exec", return_value=(queues.get(name, b""), b"", 0)
+        )
+    fan_out.use_queue_depth = True
+    assert fan_out.queue_depth("a") == 3
+    assert fan_out.partition(10) == [("a", 0, 2), ("b", 2, 6), ("c", 6, 10)]
+    # The queue is read through the shared queue poller
+    assert "squeue --noheader" in runners["a"].exec.call_args[0][0]
+    runners["a"].exec.assert_called_once()
+
+
+def test_fan_out_runner_run(tmp_path, mocker):
+    runners = {}
+    for i, name in enumerate(["a", "b"]):
+        runner = LocalRunner(
+            project_name="project", experiment_dir=str(tmp_path / name)
+        )
+        mocker.patch.object(runner, "sync_context")
+        mocker.patch.object(
+            runner,
+            "exec",
+            return_value=(
+                f"{RUN_OUTPUT_MARKER}0\nSubmitted batch job {i + 1}\n".encode(),
+                b"",
+                0,
+            ),
+        )
+        runners[name] = runner
+
+    job = FanOutRunner(runners).run(
+        ARRAYJOB_TEMPLATE,
+        {
+            "slurm_args": {},
+            "script_configs": [f"--a {i}" for i in range(5)],
+            "script_config_names": [f"a{i}" for i in range(5)],
+        },
+        run_name="sweep",
+    )
+
+    assert job.size == 5
+    assert [(shard.cluster, shard.offset, shard.size) for shard in job.shards] == [
+        ("a", 0, 3),
+        ("b", 3, 2),
+    ]
+    assert job.locate(1) == ("a", "1", 1)
+    assert job.locate(4) == ("b", "2", 1)
+    for runner in runners.values():
+        runner.sync_context.assert_called_once()
+
+
+def test_fan_out_runner_shared_experiment_dir(tmp_path, mocker):
+    # Both runners render their launch files before either submits and cleans up
+    barrier = threading.Barrier(2, timeout=5)
+    launch_files = {}
+
+    def exec_launch(name, i):
+        def exec(cmd, *args, **kwargs):
+            launch_file = re.search(r"launch\.\S+\.slurm", cmd).group(0)
+            with open(tmp_path / launch_file) as f:
+                launch_files[name] = (launch_file, f.read())
+            output = f"{RUN_OUTPUT_MARKER}0\nSubmitted batch job {i + 1}\n"
+            return output.encode(), b"", 0
+
+        return exec
+
+    runners = {}
+    for i, name in enumerate(["a", "b"]):
+        runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+        mocker.patch.object(runner, "sync_context", side_effect=barrier.wait)
+        mocker.patch.object(runner, "exec", side_effect=exec_launch(name, i))
+        runners[name] = runner
+
+    job = FanOutRunner(runners).run(
+        ARRAYJOB_TEMPLATE,
+        {"slurm_args": {}, "script_configs": [f"--a {i}" for i in range(4)]},
+        run_name="sweep",
+    )
+
+    assert [shard.id for shard in job.shards] == ["1", "2"]
+    assert launch_files["a"][0] == "launch.sweep-a.slurm"
+    assert launch_files["b"][0] == "launch.sweep-b.slurm"
+    assert launch_files["a"][1] != launch_files["b"][1]
+    assert job.shards[0].config_table != job.shards[1].config_table
+    assert not list(tmp_path.glob("launch.*"))
+
+
+def test_runner_job_store(tmp_path, mocker):
+    job_store = JobStore(":memory:")
+    runner = LocalRunner(
+        project_name="project", experiment_dir=str(tmp_path), job_store=job_store
+    )
+    mocker.patch.object(runner, "sync_context")
+    mocker.patch.object(
+        runner,
+        "exec",
+        return_value=(
+            f"{RUN_OUTPUT_MARKER}0\nSubmitted batch job 42\n".encode(),
+            b"",
+            0,
+        ),
+    )
+
+    job = runner.run(
+        ARRAYJOB_TEMPLATE,
+        {"slurm_args": {}, "script_configs": ["--a 1", "--a 2"], "array_offset": 10},
+        run_name="sweep",
+    )
+
+    assert job.id == "42"
+    [record] = job_store.jobs(host="localhost")
+    assert (record.job_id, record.run_name) == ("42", "sweep")
+    assert (record.config_offset, record.config_size) == (10, 2)
+    assert record.template_hash == job.template_hash
+    assert record.remote_dir == str(tmp_path)
+
+    # The states of all the active jobs are refreshed with one sacct call
+    runner.exec.return_value = (b"42_0|COMPLETED|0:0\n42_1|RUNNING|0:0\n", b"", 0)
+    changed = runner.refresh_jobs()
+    assert runner.exec.call_args[0][0].startswith("sacct -n -P -X -j 42 ")
+    assert [(c.task_id, c.state) for c in changed] == [
+        (0, "COMPLETED"),
+        (1, "RUNNING"),
+    ]
+    assert job_store.jobs()[0].state == "RUNNING"
+
+
+def test_runner_cancel_job(mocker):
+    runner = LocalRunner(project_name="project")
+    mock_exec = mocker.patch.object(runner, "exec", return_value=(b"", b"", 0))
+
+    sharded = ShardedJob(
+        shards=[
+            dotdict(id="10", offset=0, size=10),
+            dotdict(id="11", offset=10, size=10),
+        ],
+        size=20,
+    )
+    runner.cancel_job(sharded, state="PENDING")
+    mock_exec.assert_called_with("scancel --state=PENDING 10 11")
+
+    runner.cancel_job(sharded, indices=[2, 3, 4, 8, 12])
+    mock_exec.assert_called_with("scancel '10_[2-4,8]' 11_2")
+
+    # Packed jobs run pack_size configs per array task
+    runner.cancel_job(dotdict(id="12", pack_size=4), indices=range(10))
+    mock_exec.assert_called_with("scancel '12_[0-2]'")
+
+    # Memoized jobs run a subset of the sweep
+    runner.cancel_job(dotdict(id="13", indices=[2, 5, 7]), indices=[5, 7])
+    mock_exec.assert_called_with("scancel '13_[1-2]'")
+    assert mock_exec.call_count == 4
+
+
+def test_fan_out_runner_cancel_job(mocker):
+    runners = {name: LocalRunner(project_name="project") for name in "ab"}
+    for runner in runners.values():
+        mocker.patch.object(runner, "exec", return_value=(b"", b"", 0))
+    job = FanOutJob(
+        shards=[
+            dotdict(cluster="a", id="1", offset=0, size=2),
+            dotdict(cluster="b", id="7", offset=2, size=2),
+        ],
+        size=4,
+    )
+
+    FanOutRunner(runners).cancel_job(job, indices=[0, 1, 3])
+    runners["a"].exec.assert_called_once_with("scancel '1_[0-1]'")
+    runners["b"].exec.assert_called_once_with("scancel 7_1")
+
+
+def test_runner_collect(tmp_path, mocker):
+    remote = tmp_path / "remote"
+    for name in ["a1", "a2"]:
+        (remote / "runs" / "sub" / name / "ckpt").mkdir(parents=True)
+        (remote / "runs" / "sub" / name / "out.log").write_text(name)
+        (remote / "runs" / "sub" / name / "metrics.json").write_text("{}")
+        (remote / "runs" / "sub" / name / "ckpt" / "model.pt").write_text("weights")
+    local = tmp_path / "local"
+
+    runner = LocalRunner(project_name="project", experiment_dir=str(remote))
+    download = mocker.spy(runner, "download")
+
+    collected = runner.collect(str(local), exclude=["ckpt/*"], workers=2)
+    assert collected == ["runs/sub/a1", "runs/sub/a2"]
+    assert download.call_count == 2
+    assert (local / "runs" / "sub" / "a1" / "metrics.json").read_text() == "{}"
+    assert not (local / "runs" / "sub" / "a1" / "ckpt").exists()
+
+    # Nothing changed
+    assert runner.collect(str(local), exclude=["ckpt/*"]) == []
+
+    # Only the changed runs are collected again
+    (remote / "runs" / "sub" / "a2" / "out.log").write_text("a2 done")
+    os.utime(remote / "runs" / "sub" / "a2" / "out.log", (0, 0))
+    assert runner.collect(str(local), exclude=["ckpt/*"]) == ["runs/sub/a2"]
+    assert (local / "runs" / "sub" / "a2" / "out.log").read_text() == "a2 done"
+
+    # Filter by config names and files
+    job = dotdict(
+        id="1", config_names=["a1"], offset=0, size=1, subexperiment_name="sub"
+    )
+    assert runner.collect(str(tmp_path / "logs"), job=job, include=["*.log"]) == [
+        "runs/sub/a1"
+    ]
+    assert os.listdir(tmp_path / "logs" / "runs" / "sub" / "a1") == ["out.log"]
+    assert runner.collect(str(tmp_path / "names"), names=["a2"]) == ["runs/sub/a2"]
+
+
+def test_runner_collect_job_default_names(tmp_path, mocker):
+    remote = tmp_path / "remote"
+    # Runs of the job, a rerun with the suffix of the launch templates, and decoys
+    for run_dir in ["sub/0", "sub/1-aB3x9", "sub/2", "other/0", "0"]:
+        (remote / "runs" / run_dir).mkdir(parents=True)
+        (remote / "runs" / run_dir / "out.log").write_text(run_dir)
+
+    runner = LocalRunner(project_name="project", experiment_dir=str(remote))
+    # Submitted without script_config_names, the config table uses the default names
+    job = dotdict(
+        id="1", config_names=None, offset=10, size=2, subexperiment_name="sub"
+    )
+    assert runner.collect(str(tmp_path / "local"), job=job) == [
+        "runs/sub/0",
+        "runs/sub/1-aB3x9",
+    ]
+
+
+def test_runner_sync_blacklist(tmp_path):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    runner.del_context(str(tmp_path / "data"))
+
+    # The collected runs are not uploaded back
+    assert runner.sync_blacklist(str(tmp_path)) == [
+        str(tmp_path / "data"),
+        str(tmp_path / "runs"),
+        str(tmp_path / ".hpctools-collect.json"),
+    ]
+    assert runner.sync_blacklist("/other/source") == [str(tmp_path / "data")]
+
+
+def test_runner_resubmit(tmp_path):
+    # Fake scheduler commands
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "sacct").write_text(
+        "#!/bin/sh\n"
+        "printf '10_0|COMPLETED|0:0\\n10_1|COMPLETED|0:0\\n10_2|FAILED|1:0\\n'\n"
+        "printf '11_0|RUNNING|0:0\\n11_1|COMPLETED|0:0\\n'\n"
+    )
+    (bin_dir / "sbatch").write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {tmp_path}/sbatch.log\n'
+        "echo Submitted batch job 99\n"
+    )
+    for script in bin_dir.iterdir():
+        script.chmod(0o755)
+
+    experiment_dir = tmp_path / "experiment"
+    experiment_dir.mkdir()
+    runner = LocalRunner(
+        project_name="project",
+        experiment_dir=str(experiment_dir),
+        environment={"PATH": f"{bin_dir}:{os.environ['PATH']}"},
+    )
+    job = runner.run_sharded(
+        ARRAYJOB_TEMPLATE,
+        {
+            "slurm_args": {},
+            "subexperiment_name": "sweep",
+            "script_configs": [f"--a {i}" for i in range(5)],
+            "script_config_names": [f"a{i}" for i in range(5)],
+        },
+        run_name="sweep",
+        max_array_size=3,
+        throttle=2,
+        dry_run=True,
+    )
+    job.shards[0].id, job.shards[1].id = "10", "11"
+
+    # Completion markers: config 1 failed, config 2 never ran, config 3 is running
+    for run_dir, grid_idx, exit_code in [
+        ("sweep/a0", 0, 0),
+        ("sweep/a1", 1, 1),
+        ("sweep/a4", 4, 1),
+        # Retried in a suffixed run directory
+        ("sweep/a4-x7Kq2", 4, 0),
+        # Runs of other sweeps at the same indices
+        ("other/a1", 1, 0),
+        ("sweep/b2", 2, 0),
+        ("a2", 2, 0),
+    ]:
+        run_dir = experiment_dir / "runs" / run_dir
+        run_dir.mkdir(parents=True)
+        (run_dir / "out.log").write_text(f"GRID_INDEX: {grid_idx}\n")
+        (run_dir / "exit_code").write_text(f"{exit_code}\n")
+
+    assert runner.failed_indices(job) == [1, 2]
+
+    retry = runner.resubmit(job, max_retries=1)
+    assert retry.indices == [1, 2] and retry.ids == ["99"]
+    # The original launch file and config table are reused
+    assert (tmp_path / "sbatch.log").read_text() == (
+        f"--array=1-2%2 {job.shards[0].launch_file}\n"
+    )
+    assert job.shards[0].launch_file.startswith(".hpctools/configs/sweep-0-")
+    assert (experiment_dir / job.shards[0].launch_file).exists()
+    assert job.shards[0].retry_ids == ["99"]
+
+    # The retry budget is exhausted
+    retry = runner.resubmit(job, max_retries=1)
+    assert retry.indices == [] and retry.exhausted == [1, 2]
+
+
+def test_config_hashes():
+    hashes = config_hashes(["--a 1", "--a 2"], "template", "context", {"script": "x"})
+    assert len(set(hashes)) == 2
+
+    # Resources and names do not change the results
+    assert hashes == config_hashes(
+        ["--a 1", "--a 2"],
+        "template",
+        "context",
+        {"script": "x", "slurm_args": {"time": "1:00:00"}, "subexperiment_name": "s"},
+    )
+    for context_hash, script in [("changed", "x"), ("context", "y")]:
+        assert (
+            config_hashes(["--a 1"], "template", context_hash, {"script": script})
+            != hashes[:1]
+        )
+
+
+def test_runner_context_hash(tmp_path):
+    (tmp_path / "train.py").write_text("print(1)")
+    (tmp_path / "analysis.ipynb").write_text("{}")
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    context_hash = runner.context_hash()
+
+    # Files written by the runner are not part of the context
+    (tmp_path / "runs" / "a0").mkdir(parents=True)
+    (tmp_path / "runs" / "a0" / "out.log").write_text("done")
+    (tmp_path / "launch.sweep.slurm").write_text("#!/bin/bash")
+    assert runner.context_hash() == context_hash
+
+    (tmp_path / "analysis.ipynb").write_text("{\"cells\": []}")
+    assert runner.context_hash(ignore=["*.ipynb"]) == runner.context_hash(
+        ignore=["*.ipynb"]
+    )
+    assert runner.context_hash() != context_hash
+
+    (tmp_path / "train.py").write_text("print(2)")
+    assert runner.context_hash(ignore=["*.ipynb"]) != context_hash
+
+
+def test_runner_run_memoized(tmp_path, mocker):
+    runner = LocalRunner(project_name="project", experiment_dir=str(tmp_path))
+    mocker.patch("hpctools.runners.DEBUG", True)
+    template_args = {
+        "slurm_args": {},
+        "script": "true",
+        "subexperiment_name": "sweep",
+    }
+
+    def run_tasks(job):
+        for task_id in range(job.size):
+            subprocess.run(
+                ["bash", "launch.sweep.slurm"],
+                cwd=tmp_path,
+                env=dict(os.environ, SLURM_ARRAY_TASK_ID=str(task_id)),
+                check=True,
+            )
+
+    job = runner.run_memoized(
+        ARRAYJOB_TEMPLATE,
+        dict(
+            template_args,
+            script_configs=[f"--a {i}" for i in range(2)],
+            script_config_names=[f"a{i}" for i in range(2)],
+        ),
+        run_name="sweep",
+        dry_run=True,
+    )
+    assert job.indices == [0, 1] and job.skipped == {}
+    run_tasks(job)
+    assert len(os.listdir(tmp_path / ".hpctools" / "cache")) == 2
+
+    # The grid is extended, only the new config runs
+    job = runner.run_memoized(
+        ARRAYJOB_TEMPLATE,
+        dict(
+            template_args,
+            script_configs=[f"--a {i}" for i in range(3)],
+            script_config_names=[f"a{i}" for i in range(3)],
+        ),
+        run_name="sweep",
+        dry_run=True,
+    )
+    assert job.indices == [2] and job.size == 1
+    assert job.skipped == {0: "runs/sweep/a0", 1: "runs/sweep/a1"}
+    run_tasks(job)
+    # The grid index of the config in the sweep, not in the array job
+    log = (tmp_path / "runs" / "sweep" / "a2" / "out.log").read_text()
+    assert "GRID_INDEX: 2" in log
+
+    # The configs are renamed, the completed runs are linked
+    job = runner.run_memoized(
+        ARRAYJOB_TEMPLATE,
+        dict(
+            template_args,
+            script_configs=[f"--a {i}" for i in range(3)],
+            script_config_names=[f"b{i}" for i in range(3)],
+        ),
+        run_name="sweep",
+    )
+    assert job.id is None and job.indices == [] and len(job.skipped) == 3
+    assert os.path.realpath(tmp_path / "runs" / "sweep" / "b2") == str(
+        tmp_path / "runs" / "sweep" / "a2"
+    )
+
+    # Changing the script runs everything again
+    job = runner.run_memoized(
+        ARRAYJOB_TEMPLATE,
+        dict(
+            template_args,
+            script="false",
+            script_configs=[f"--a {i}" for i in range(3)],
+        ),
+        run_name="sweep",
+        dry_run=True,
+    )
+    assert job.indices == [0, 1, 2]
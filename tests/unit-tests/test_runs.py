@@ -0,0 +1,38 @@
+import os
+from hpctools.runs import (
+    group_run_files,
+    local_run_files,
+    parse_run_markers,
+    run_fingerprint,
+)
+
+
+def test_run_fingerprint_local_and_remote(tmp_path):
+    run_dir = tmp_path / "runs" / "a"
+    run_dir.mkdir(parents=True)
+    (run_dir / "out.log").write_text("loss: 1\n")
+    (run_dir / "metrics.json").write_text("{}")
+    (run_dir / "checkpoints").mkdir()
+
+    files = local_run_files(run_dir)
+    assert sorted(name for name, _, _ in files) == ["metrics.json", "out.log"]
+
+    listing = "".join(
+        f"runs/a/{name}\t{size}\t{mtime}\n" for name, size, mtime in files
+    )
+    runs = group_run_files(listing)
+    assert run_fingerprint(runs["runs/a"]) == run_fingerprint(files)
+
+    (run_dir / "out.log").write_text("loss: 0.5\n")
+    os.utime(run_dir / "out.log", (0, 0))
+    assert run_fingerprint(local_run_files(run_dir)) != run_fingerprint(files)
+
+
+def test_parse_run_markers():
+    output = (
+        "runs/sweep/a/out.log:GRID_INDEX: 3\n"
+        "runs/sweep/b/out.log:GRID_INDEX: 4\n"
+        "runs/sweep/a/exit_code:0\n"
+        "runs/other/c/exit_code:1\n"
+    )
+    assert parse_run_markers(output) == {"runs/sweep/a": (3, 0)}
@@ -0,0 +1,117 @@
+import pytest
+from hpctools.utils import GridConfig, flatten_names
+from hpctools.samplers import (
+    GridSample,
+    sample_uniform,
+    sample_latin_hypercube,
+    sample_halton,
+    sample_stratified,
+)
+
+config = {
+    "lr": [0.1, 0.01, 0.001, 0.0001],
+    "batch_size": [16, 32, 64],
+    "seed": list(range(10)),
+}
+config_names = [
+    "run",
+    ["a", "b", "c", "d"],
+    ["16", "32", "64"],
+    [str(i) for i in range(10)],
+]
+
+
+@pytest.mark.parametrize(
+    "sampler", [sample_uniform, sample_latin_hypercube, sample_halton]
+)
+def test_samplers(sampler):
+    grid = GridConfig(config)
+    sample = sampler(grid, 20, seed=0, names=config_names)
+
+    assert 0 < len(sample) <= 20
+    assert len(set(sample.indices)) == len(sample)
+    all_configs = grid.flatten()
+    all_names = flatten_names(config_names)
+    for idx, config_, name in zip(
+        sample.indices, sample.configs(), sample.config_names()
+    ):
+        assert config_ == all_configs[idx]
+        assert name == all_names[idx]
+
+
+def test_latin_hypercube_covers_dimensions():
+    grid = GridConfig(config)
+    sample = sample_latin_hypercube(grid, 10, seed=0)
+    assert {c["seed"] for c in sample.configs()} == set(range(10))
+
+
+def test_sample_huge_grid():
+    grid = GridConfig({f"dim{i}": list(range(10)) for i in range(8)})
+    assert len(sample_uniform(grid, 2000, seed=0)) == 2000
+    assert len(sample_halton(grid, 2000)) == 2000
+
+
+def test_sample_stratified():
+    grid = GridConfig(config)
+    sample = sample_stratified(grid, 9, "batch_size", seed=0)
+    batch_sizes = [c["batch_size"] for c in sample.configs()]
+    assert sorted(batch_sizes) == [16, 16, 16, 32, 32, 32, 64, 64, 64]
+    assert len(set(sample.indices)) == 9
+
+    with pytest.raises(ValueError):
+        sample_stratified(grid, 9, "missing")
+
+
+@pytest.mark.parametrize(
+    "sampler", [sample_uniform, sample_latin_hypercube, sample_halton]
+)
+def test_samplers_constrained(sampler):
+    grid = GridConfig(
+        {"bs": [1, 2, 3, 4], "acc": [1, 2, 3, 4]},
+        constraints=[lambda bs, acc: bs * acc <= 4],
+    )
+    valid = set(grid.valid_indices())
+    assert len(valid) == 8
+
+    sample = sampler(grid, 16, seed=0)
+    assert 0 < len(sample) <= 8
+    assert set(sample.indices) <= valid
+    assert len(set(sample.indices)) == len(sample)
+    assert all(c["bs"] * c["acc"] <= 4 for c in sample.configs())
+
+
+def test_sample_uniform_constrained_all_valid():
+    grid = GridConfig(
+        {"bs": [1, 2, 3, 4], "acc": [1, 2, 3, 4]},
+        constraints=[lambda bs, acc: bs * acc <= 4],
+    )
+    assert sorted(sample_uniform(grid, 16, seed=0).indices) == list(
+        grid.valid_indices()
+    )
+
+    grid = GridConfig(
+        {f"dim{i}": list(range(10)) for i in range(6)},
+        constraints=[lambda dim0: dim0 != 0],
+    )
+    sample = sample_uniform(grid, 500, seed=0)
+    assert len(set(sample.indices)) == 500
+    assert all(c["dim0"] != 0 for c in sample.configs())
+
+
+def test_sample_stratified_constrained():
+    grid = GridConfig(
+        {"bs": [1, 2, 3, 4], "acc": [1, 2, 3, 4]},
+        constraints=[lambda bs, acc: bs * acc <= 4],
+    )
+    sample = sample_stratified(grid, 8, "bs", seed=0)
+    assert sorted(c["bs"] for c in sample.configs()) == [1, 1, 2, 2, 3, 4]
+    assert all(grid.is_valid(idx) for idx in sample.indices)
+
+
+def test_grid_sample_rejects_invalid_indices():
+    grid = GridConfig(
+        {"bs": [1, 2, 3, 4], "acc": [1, 2, 3, 4]},
+        constraints=[lambda bs, acc: bs * acc <= 4],
+    )
+    with pytest.raises(ValueError):
+        GridSample(grid, [0, 15])
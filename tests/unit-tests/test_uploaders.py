@@ -1,7 +1,13 @@
 import pytest
 from unittest.mock import patch, call
 import os
-from hpctools.uploaders import SFTPUploader
+from hpctools.uploaders import (
+    SFTPUploader,
+    ParallelSFTPUploader,
+    ManifestSFTPUploader,
+    TarUploader,
+    RSYNCUploader,
+)
 from hpctools.auths import SSHAuth
 from hpctools.utils import MySSHClient
 
@@ -55,3 +61,202 @@ def test_blacklist_files(uploader):
                 source, target, blacklist=["./mock-source-folder/file1.txt"]
             )
             mock_put.assert_not_called()
+
+
+@pytest.fixture
+def parallel_uploader(mocker):
+    channel = mocker.Mock()
+    channel.listdir_attr.return_value = []
+    channel.put.return_value = mocker.Mock(st_size=10)
+    mocker.patch(
+        "hpctools.uploaders.SFTPUploader.from_transport", return_value=channel
+    )
+    return ParallelSFTPUploader(mocker.Mock(), workers=4, retries=2), channel
+
+
+def test_parallel_upload(parallel_uploader, tmp_path):
+    uploader, channel = parallel_uploader
+    (tmp_path / "dir1").mkdir()
+    for name in ["file1.txt", "file2.txt", "dir1/file3.txt"]:
+        (tmp_path / name).write_text("data")
+
+    stats = uploader.upload(str(tmp_path), target)
+
+    assert stats["files"] == 3
+    assert stats["bytes"] == 30
+    channel.put.assert_any_call(
+        os.path.join(str(tmp_path), "dir1", "file3.txt"), f"{target}/dir1/file3.txt"
+    )
+
+
+def test_parallel_upload_retries(parallel_uploader, tmp_path, mocker):
+    uploader, channel = parallel_uploader
+    mocker.patch("time.sleep")
+    (tmp_path / "file1.txt").write_text("data")
+    channel.put.side_effect = [IOError, mocker.Mock(st_size=4)]
+
+    stats = uploader.upload(str(tmp_path), target)
+    assert stats["files"] == 1
+    assert channel.put.call_count == 2
+
+    channel.put.side_effect = IOError
+    with pytest.raises(IOError):
+        uploader.upload(str(tmp_path), target)
+
+
+@pytest.fixture
+def manifest_uploader(mocker):
+    remote_files = {}
+
+    class RemoteFile:
+        def __init__(self, path, mode="r"):
+            if mode == "r" and path not in remote_files:
+                raise IOError(path)
+            self.path = path
+
+        def read(self):
+            return remote_files[self.path]
+
+        def write(self, data):
+            remote_files[self.path] = data
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+    channel = mocker.Mock()
+    channel.open.side_effect = RemoteFile
+    channel.put.return_value = mocker.Mock(st_size=4)
+    mocker.patch(
+        "hpctools.uploaders.SFTPUploader.from_transport", return_value=channel
+    )
+    return ManifestSFTPUploader(mocker.Mock(), cache_dir=None), channel
+
+
+def test_manifest_upload(manifest_uploader, tmp_path):
+    uploader, channel = manifest_uploader
+    (tmp_path / "dir1").mkdir()
+    (tmp_path / "file1.txt").write_text("data")
+    (tmp_path / "dir1" / "file2.txt").write_text("data")
+
+    assert uploader.upload(str(tmp_path), target)["files"] == 2
+
+    # Nothing changed, nothing is uploaded even if mtimes changed
+    channel.put.reset_mock()
+    os.utime(tmp_path / "file1.txt", (0, 0))
+    assert uploader.upload(str(tmp_path), target)["files"] == 0
+    channel.put.assert_not_called()
+    channel.listdir_attr.assert_not_called()
+
+    # Changed files are uploaded and removed files are deleted
+    (tmp_path / "file1.txt").write_text("new data")
+    (tmp_path / "dir1" / "file2.txt").unlink()
+    assert uploader.upload(str(tmp_path), target)["files"] == 1
+    channel.put.assert_called_once_with(
+        os.path.join(str(tmp_path), "file1.txt"), f"{target}/file1.txt"
+    )
+    channel.remove.assert_called_once_with(f"{target}/dir1/file2.txt")
+
+
+def test_manifest_upload_shared_target(manifest_uploader, tmp_path):
+    uploader, channel = manifest_uploader
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "file1.txt").write_text("data")
+    (tmp_path / "b" / "file2.txt").write_text("data")
+
+    # Two sources uploaded to the same target do not delete each other's files
+    for _ in range(2):
+        uploader.upload(str(tmp_path / "a"), target)
+        uploader.upload(str(tmp_path / "b"), target)
+    channel.remove.assert_not_called()
+    assert channel.put.call_count == 2
+
+    (tmp_path / "a" / "file1.txt").unlink()
+    uploader.upload(str(tmp_path / "a"), target)
+    channel.remove.assert_called_once_with(f"{target}/file1.txt")
+
+
+def test_manifest_upload_keeps_blacklisted(manifest_uploader, tmp_path):
+    uploader, channel = manifest_uploader
+    (tmp_path / "runs").mkdir()
+    (tmp_path / "file1.txt").write_text("data")
+    (tmp_path / "runs" / "out.log").write_text("data")
+    uploader.upload(str(tmp_path), target)
+
+    # The files blacklisted since the previous upload are not deleted from the target
+    uploader.upload(str(tmp_path), target, blacklist=[str(tmp_path / "runs")])
+    channel.remove.assert_not_called()
+
+
+def test_tar_upload(tmp_path, mocker):
+    import io
+    import tarfile
+
+    (tmp_path / "dir1").mkdir()
+    (tmp_path / "ignored").mkdir()
+    (tmp_path / "file1.txt").write_text("data")
+    (tmp_path / "dir1" / "file2.txt").write_text("data")
+    (tmp_path / "ignored" / "file3.txt").write_text("data")
+
+    stream = io.BytesIO()
+    channel = mocker.Mock()
+    channel.sendall.side_effect = stream.write
+    channel.recv_exit_status.return_value = 0
+    transport = mocker.Mock()
+    transport.open_session.return_value = channel
+
+    TarUploader(transport).upload(
+        str(tmp_path), target, blacklist=[str(tmp_path / "ignored")]
+    )
+
+    channel.exec_command.assert_called_once_with(
+        f"mkdir -p {target} && tar -xzf - -C {target}"
+    )
+    channel.shutdown_write.assert_called_once()
+    stream.seek(0)
+    with tarfile.open(fileobj=stream, mode="r:gz") as tar:
+        assert sorted(tar.getnames()) == ["dir1", "dir1/file2.txt", "file1.txt"]
+
+
+def test_tar_upload_failure(tmp_path, mocker):
+    channel = mocker.Mock()
+    channel.recv_exit_status.return_value = 2
+    channel.makefile_stderr.return_value.read.return_value = b"No space left"
+    transport = mocker.Mock()
+    transport.open_session.return_value = channel
+
+    with pytest.raises(IOError):
+        TarUploader(transport).upload(str(tmp_path), target)
+
+
+def test_rsync_upload_blacklist(tmp_path, mocker):
+    system = mocker.patch("hpctools.uploaders.os.system")
+    auth = SSHAuth(username="user", hostname="host", key_filename="/key")
+
+    RSYNCUploader(auth).upload(
+        str(tmp_path), "/remote/exp", blacklist=[str(tmp_path / "runs"), "*.pyc"]
+    )
+
+    # Local paths are anchored to the root of the transfer
+    cmd = system.call_args[0][0]
+    assert "--exclude=/runs --exclude=*.pyc" in cmd
+
+
+def test_rsync_download(tmp_path, mocker):
+    run = mocker.patch("hpctools.uploaders.subprocess.run")
+    run.return_value.returncode = 0
+    auth = SSHAuth(username="user", hostname="host", key_filename="/key")
+
+    RSYNCUploader(auth).download("/remote/exp", str(tmp_path), ["runs/a/out.log"])
+
+    cmd = run.call_args[0][0]
+    assert cmd.startswith("rsync -az --files-from=")
+    assert "-e 'ssh -p 22 -i /key'" in cmd
+    assert cmd.endswith(f"user@host:/remote/exp/ {tmp_path}")
+
+    run.return_value.returncode = 23
+    with pytest.raises(IOError):
+        RSYNCUploader(auth).download("/remote/exp", str(tmp_path), ["x"])
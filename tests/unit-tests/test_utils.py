@@ -49,3 +49,78 @@ def test_dict_to_args_error():
 
 
 # Additional tests can be added for other functions and error handling
+
+
+def test_grid_config_random_access():
+    config = {
+        "iterations": [1, 2, 3],
+        ("lr", "warmup"): [(0.1, 10), (0.01, 100)],
+        "mode": "test",
+    }
+    grid = GridConfig(config)
+    assert grid.size() == 6
+    assert grid[4] == {"iterations": 2, "lr": 0.01, "warmup": 100, "mode": "test"}
+    assert grid[-1] == grid.get_config(5)
+    assert grid[1:6:2] == [grid[1], grid[3], grid[5]]
+    assert list(grid.iter_configs(4)) == grid.flatten()[4:]
+    with pytest.raises(IndexError):
+        grid[6]
+
+
+def test_grid_config_decode():
+    import numpy as np
+
+    config = {"iterations": [1, 2, 3], "mode": ["test", "prod"], "seed": 0}
+    grid = GridConfig(config)
+    dim_ids = grid.decode(1, 5)
+    assert list(dim_ids.keys()) == ["iterations", "mode"]
+    np.testing.assert_array_equal(dim_ids["iterations"], [1, 2, 0, 1])
+    np.testing.assert_array_equal(dim_ids["mode"], [0, 0, 1, 1])
+    for i, idx in enumerate(range(1, 5)):
+        assert grid.idx_to_dim_ids(idx) == {k: v[i] for k, v in dim_ids.items()}
+
+
+def test_grid_config_constraints():
+    config = {
+        "batch_size": [16, 32, 64],
+        "accum": [1, 2, 4],
+        "optimizer": ["sgd", "adam"],
+        "momentum": [0.0, 0.9],
+        "seed": [0, 1],
+    }
+    grid = GridConfig(
+        config,
+        config_names=["run", ["16", "32", "64"], ["1", "2", "4"]],
+        constraints=[lambda batch_size, accum: batch_size * accum <= 64],
+        conditions={"momentum": lambda optimizer: optimizer == "sgd"},
+    )
+
+    # Brute force reference
+    expected = [i for i in range(grid.size()) if grid.is_valid(i)]
+    assert list(grid.valid_indices()) == expected
+    assert grid.count_valid() == len(expected) == 6 * 3 * 2
+    assert list(grid.valid_indices(10, 50)) == [i for i in expected if 10 <= i < 50]
+
+    configs = grid.flatten()
+    assert len(configs) == len(expected)
+    assert all(c["batch_size"] * c["accum"] <= 64 for c in configs)
+    # The momentum is dropped when the optimizer does not use it
+    assert all(("momentum" in c) == (c["optimizer"] == "sgd") for c in configs)
+    assert len(grid.flatten_names()) == len(configs)
+
+    # The iteration protocol applies the constraints too
+    assert list(grid) == configs
+    assert len(grid) == len(configs)
+    assert grid[expected[0]] == configs[0]
+    invalid = next(i for i in range(grid.size()) if not grid.is_valid(i))
+    with pytest.raises(IndexError):
+        grid[invalid]
+    grid.__iter__()
+    assert [next(grid) for _ in configs] == configs
+    with pytest.raises(StopIteration):
+        next(grid)
+
+
+def test_grid_config_constraints_unknown_argument():
+    with pytest.raises(ValueError):
+        GridConfig({"a": [1, 2]}, constraints=[lambda b: b > 1])